@@ -0,0 +1,235 @@
+"""
+Adaptive Sampling Module
+Coarse-to-fine sampling of flood probabilities over a bounding box.
+
+The box is covered by a coarse lattice of real (weather + model) samples.
+Cells whose corner probabilities differ by more than a tolerance are split
+into four, and only the new lattice nodes are sampled in the next round.
+Refinement stops when every cell is within tolerance, the maximum depth is
+reached, or the hard budget of upstream calls is spent. The remaining grid is
+filled by bilinear interpolation inside each leaf cell.
+
+The sampler does no I/O itself: a driver asks for `pending()` points, samples
+them however it likes (sync or async) and feeds the results back with
+`add_results()`. `run_adaptive()` is the plain synchronous driver and
+`run_adaptive_async()` its coroutine counterpart.
+"""
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Finest lattice resolution (nodes per side) allowed for the leaf lookup raster
+MAX_LATTICE_SIZE = 1024
+
+
+class AdaptiveSampler:
+    """
+    Quadtree refinement over a lat/lon box.
+
+    Lattice nodes are addressed by integer (i, j) indices on the finest
+    possible resolution, so corners shared by neighboring cells are sampled
+    exactly once.
+    """
+
+    def __init__(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        coarse: int = 3,
+        tolerance: float = 0.1,
+        max_samples: int = 64,
+        max_depth: int = 5
+    ):
+        if (coarse + 1) ** 2 > max_samples:
+            raise ValueError(
+                f"max_samples={max_samples} is too small for a {coarse}x{coarse} coarse lattice "
+                f"(needs at least {(coarse + 1) ** 2})"
+            )
+        while max_depth > 0 and coarse * 2 ** max_depth > MAX_LATTICE_SIZE:
+            max_depth -= 1
+
+        self.min_lat, self.min_lon = min_lat, min_lon
+        self.max_lat, self.max_lon = max_lat, max_lon
+        self.tolerance = tolerance
+        self.max_samples = max_samples
+
+        self._unit = 2 ** max_depth                 # coarse cell size in lattice units
+        self._size = coarse * self._unit            # lattice units per side
+        self._values: Dict[Tuple[int, int], float] = {}
+        # Leaf cells as (i0, j0, size) in lattice units
+        self._leaves: List[Tuple[int, int, int]] = [
+            (ci * self._unit, cj * self._unit, self._unit)
+            for ci in range(coarse) for cj in range(coarse)
+        ]
+        self._pending = self._missing_nodes(self._leaves)
+        self.rounds = 0
+
+    # ------------------------------------------------------------------
+    # Lattice helpers
+    # ------------------------------------------------------------------
+    def _node_coords(self, node: Tuple[int, int]) -> Tuple[float, float]:
+        i, j = node
+        lat = self.min_lat + (self.max_lat - self.min_lat) * i / self._size
+        lon = self.min_lon + (self.max_lon - self.min_lon) * j / self._size
+        return lat, lon
+
+    @staticmethod
+    def _corners(cell: Tuple[int, int, int]) -> List[Tuple[int, int]]:
+        i0, j0, s = cell
+        return [(i0, j0), (i0, j0 + s), (i0 + s, j0), (i0 + s, j0 + s)]
+
+    @staticmethod
+    def _split_nodes(cell: Tuple[int, int, int]) -> List[Tuple[int, int]]:
+        i0, j0, s = cell
+        h = s // 2
+        return [(i0, j0 + h), (i0 + h, j0), (i0 + h, j0 + h), (i0 + h, j0 + s), (i0 + s, j0 + h)]
+
+    def _missing_nodes(self, cells) -> List[Tuple[int, int]]:
+        missing = []
+        seen = set()
+        for cell in cells:
+            for node in self._corners(cell):
+                if node not in self._values and node not in seen:
+                    seen.add(node)
+                    missing.append(node)
+        return missing
+
+    # ------------------------------------------------------------------
+    # Driver protocol
+    # ------------------------------------------------------------------
+    @property
+    def done(self) -> bool:
+        return not self._pending
+
+    @property
+    def samples_used(self) -> int:
+        return len(self._values)
+
+    def pending(self) -> List[Tuple[float, float]]:
+        """(lat, lon) points that must be sampled before the next refinement step."""
+        return [self._node_coords(node) for node in self._pending]
+
+    def add_results(self, probabilities: Sequence[float]):
+        """
+        Record probabilities for the points returned by `pending()` (same order)
+        and plan the next refinement round.
+        """
+        if len(probabilities) != len(self._pending):
+            raise ValueError("Number of probabilities does not match pending points")
+        for node, prob in zip(self._pending, probabilities):
+            self._values[node] = float(prob)
+        self.rounds += 1
+        self._pending = self._refine()
+
+    def _refine(self) -> List[Tuple[int, int]]:
+        budget = self.max_samples - len(self._values)
+        if budget <= 0:
+            return []
+
+        candidates = []
+        for cell in self._leaves:
+            if cell[2] < 2:
+                continue
+            corner_values = [self._values[node] for node in self._corners(cell)]
+            spread = max(corner_values) - min(corner_values)
+            if spread > self.tolerance:
+                candidates.append((spread, cell))
+        # Spend the budget on the most heterogeneous cells first
+        candidates.sort(key=lambda item: item[0], reverse=True)
+
+        planned = set()
+        split = set()
+        for _, cell in candidates:
+            new_nodes = [n for n in self._split_nodes(cell) if n not in self._values and n not in planned]
+            if len(new_nodes) > budget:
+                continue
+            budget -= len(new_nodes)
+            planned.update(new_nodes)
+            split.add(cell)
+
+        if not split:
+            return []
+
+        leaves = []
+        for cell in self._leaves:
+            if cell in split:
+                i0, j0, s = cell
+                h = s // 2
+                leaves.extend([(i0, j0, h), (i0, j0 + h, h), (i0 + h, j0, h), (i0 + h, j0 + h, h)])
+            else:
+                leaves.append(cell)
+        self._leaves = leaves
+        return sorted(planned)
+
+    # ------------------------------------------------------------------
+    # Results
+    # ------------------------------------------------------------------
+    def samples(self) -> List[Tuple[float, float, float]]:
+        """All real samples as (lat, lon, probability)."""
+        return [(*self._node_coords(node), value) for node, value in self._values.items()]
+
+    def interpolate(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """
+        Fill arbitrary points inside the box by bilinear interpolation within
+        the leaf cell containing each point. Fully vectorized over the points.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+        lat_span = (self.max_lat - self.min_lat) or 1.0
+        lon_span = (self.max_lon - self.min_lon) or 1.0
+        u = np.clip((lats - self.min_lat) / lat_span * self._size, 0, self._size)
+        v = np.clip((lons - self.min_lon) / lon_span * self._size, 0, self._size)
+
+        # Raster of leaf ids at lattice resolution
+        leaf_ids = np.empty((self._size, self._size), dtype=np.int32)
+        leaves = np.array(self._leaves, dtype=np.int64)
+        corner_values = np.empty((len(self._leaves), 4))
+        for k, cell in enumerate(self._leaves):
+            i0, j0, s = cell
+            leaf_ids[i0:i0 + s, j0:j0 + s] = k
+            corner_values[k] = [self._values[node] for node in self._corners(cell)]
+
+        iu = np.minimum(u.astype(np.int64), self._size - 1)
+        iv = np.minimum(v.astype(np.int64), self._size - 1)
+        k = leaf_ids[iu, iv]
+
+        size = leaves[k, 2]
+        y = (u - leaves[k, 0]) / size
+        x = (v - leaves[k, 1]) / size
+        v00, v01, v10, v11 = (corner_values[k, c] for c in range(4))
+        return (v00 * (1 - x) * (1 - y) +
+                v01 * x * (1 - y) +
+                v10 * (1 - x) * y +
+                v11 * x * y)
+
+
+def run_adaptive(
+    sampler: AdaptiveSampler,
+    sample_fn: Callable[[List[Tuple[float, float]]], Sequence[float]]
+) -> AdaptiveSampler:
+    """
+    Drive a sampler to completion with a synchronous batch sampling function.
+
+    Args:
+        sampler: AdaptiveSampler instance
+        sample_fn: Maps a list of (lat, lon) points to their flood probabilities
+
+    Returns:
+        The same sampler, fully refined
+    """
+    while not sampler.done:
+        sampler.add_results(sample_fn(sampler.pending()))
+    return sampler
+
+
+async def run_adaptive_async(
+    sampler: AdaptiveSampler,
+    sample_fn: Callable[[List[Tuple[float, float]]], Awaitable[Sequence[float]]]
+) -> AdaptiveSampler:
+    """run_adaptive with a coroutine batch sampling function."""
+    while not sampler.done:
+        sampler.add_results(await sample_fn(sampler.pending()))
+    return sampler
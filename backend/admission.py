@@ -0,0 +1,222 @@
+"""
+Admission Control Module
+Per-endpoint-class concurrency limits with bounded, deadline-aware queues.
+
+Each request is mapped to an endpoint class by its path. A class serves at
+most `limit` requests at once; further requests wait in the class queue for
+up to `queue_timeout` seconds. A request that finds the queue full is
+rejected at once with 429, one whose deadline passes while queued with 503;
+both carry a Retry-After estimated from the class's recent service times.
+Rejections cost no upstream calls and no model work.
+
+Classes are served in priority order: while a class has queued requests, no
+class with a larger `priority` value admits new work, so cheap single-location
+predictions are never starved by heatmaps or multi-city scans.
+
+All state lives on the event loop (the middleware is pure ASGI), so no locks
+are needed. Requests whose path matches no rule are not limited.
+"""
+import asyncio
+import json
+import logging
+import math
+import re
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest request in the service-time average
+SERVICE_TIME_ALPHA = 0.1
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class EndpointClass:
+    """
+    Concurrency budget of a group of endpoints.
+
+    Args:
+        name: Label used in stats and error messages
+        limit: Requests of this class served concurrently
+        queue_depth: Requests allowed to wait for a slot (more get 429)
+        queue_timeout: Seconds a request may wait for a slot (then 503)
+        priority: Lower values are served first
+    """
+
+    def __init__(self, name: str, limit: int, queue_depth: int, queue_timeout: float, priority: int = 0):
+        self.name = name
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.priority = priority
+        self.active = 0
+        self.queue: deque = deque()
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.avg_service_seconds = 0.0
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new request."""
+        waves = (len(self.queue) + 1) / self.limit
+        return max(1, math.ceil(self.avg_service_seconds * waves))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue_depth": self.queue_depth,
+            "queue_timeout": self.queue_timeout,
+            "priority": self.priority,
+            "active": self.active,
+            "queued": len(self.queue),
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_service_seconds": round(self.avg_service_seconds, 4)
+        }
+
+
+class AdmissionController:
+    """
+    Admits requests per endpoint class.
+
+    Args:
+        classes: Endpoint classes
+        rules: (path regex, class name) pairs; the first full match wins
+    """
+
+    def __init__(self, classes: Sequence[EndpointClass], rules: Sequence[Tuple[str, str]]):
+        self.classes = sorted(classes, key=lambda c: c.priority)
+        self._by_name = {c.name: c for c in self.classes}
+        self._rules = [(re.compile(pattern), self._by_name[name]) for pattern, name in rules]
+
+    def classify(self, path: str) -> Optional[EndpointClass]:
+        for pattern, endpoint_class in self._rules:
+            if pattern.fullmatch(path):
+                return endpoint_class
+        return None
+
+    def _outranked(self, endpoint_class: EndpointClass) -> bool:
+        """True while a higher-priority class has requests waiting."""
+        return any(c.queue for c in self.classes if c.priority < endpoint_class.priority)
+
+    def _grant(self, endpoint_class: EndpointClass):
+        endpoint_class.active += 1
+        endpoint_class.admitted += 1
+
+    def _dispatch(self):
+        """Hand free slots to queued requests, highest priority first."""
+        for endpoint_class in self.classes:
+            queue = endpoint_class.queue
+            while queue and endpoint_class.active < endpoint_class.limit and not self._outranked(endpoint_class):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self._grant(endpoint_class)
+                waiter.set_result(None)
+
+    async def acquire(self, endpoint_class: EndpointClass) -> bool:
+        """
+        Wait for a slot; returns True if the request had to queue. Raises
+        AdmissionRejected if the queue is full or the deadline passes.
+        """
+        if (not endpoint_class.queue and endpoint_class.active < endpoint_class.limit
+                and not self._outranked(endpoint_class)):
+            self._grant(endpoint_class)
+            return False
+        if len(endpoint_class.queue) >= endpoint_class.queue_depth:
+            endpoint_class.rejected_queue_full += 1
+            raise AdmissionRejected(429, f"Too many {endpoint_class.name} requests queued",
+                                    endpoint_class.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        endpoint_class.queue.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, endpoint_class.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted in the same tick as the deadline (wait_for
+                # can still raise then): the request is admitted and owns it
+                return True
+            self._forget(endpoint_class, waiter)
+            endpoint_class.rejected_timeout += 1
+            raise AdmissionRejected(503, f"Server busy: {endpoint_class.name} request timed out in queue",
+                                    endpoint_class.retry_after())
+        except asyncio.CancelledError:
+            # Client went away while queued (or just as its slot was granted)
+            if waiter.done() and not waiter.cancelled():
+                self.release(endpoint_class)
+            else:
+                self._forget(endpoint_class, waiter)
+            raise
+
+    def _forget(self, endpoint_class: EndpointClass, waiter: asyncio.Future):
+        try:
+            endpoint_class.queue.remove(waiter)
+        except ValueError:
+            pass
+        # Lower-priority classes may have been held back by this waiter
+        self._dispatch()
+
+    def release(self, endpoint_class: EndpointClass, seconds: Optional[float] = None):
+        endpoint_class.active -= 1
+        if seconds is not None:
+            endpoint_class.avg_service_seconds += SERVICE_TIME_ALPHA * (seconds - endpoint_class.avg_service_seconds)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {c.name: c.stats() for c in self.classes}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to HTTP requests."""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        endpoint_class = self.controller.classify(scope["path"]) if scope["type"] == "http" else None
+        if endpoint_class is None:
+            return await self.app(scope, receive, send)
+
+        queued_at = time.perf_counter()
+        try:
+            queued = await self.controller.acquire(endpoint_class)
+        except AdmissionRejected as e:
+            logger.warning("Rejected %s %s: %s", scope["method"], scope["path"], e.detail)
+            return await self._reject(e, send)
+        if queued:
+            tracing.record("admission_queue", queued_at, time.perf_counter())
+
+        started = time.monotonic()
+        try:
+            # Streamed responses keep their slot until the last chunk is sent
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(endpoint_class, time.monotonic() - started)
+
+    @staticmethod
+    async def _reject(error: AdmissionRejected, send):
+        body = json.dumps({"detail": error.detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(error.retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
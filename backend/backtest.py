@@ -0,0 +1,222 @@
+"""
+Backtest Module
+Scores the model over historical NASA POWER daily series and evaluates it
+against EM-DAT flood records, without rerunning the training notebook.
+
+Every day of every site is turned into a feature row (anomalies from the
+site's own day-of-year climatology, as in training), scored in large batches
+and labelled with the EM-DAT flood start dates. Metrics are computed with a
+vectorized threshold sweep over the sorted scores.
+
+Usage:
+    python backtest.py ["../nasa(India).csv" ...] [--emdat ../EMD_data.xlsx]
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_NAMES
+from inference_pool import inference_pool
+from nasa_power import NASA_CSV_PATH, load_nasa_power_csv
+
+logger = logging.getLogger(__name__)
+
+EMDAT_PATH = Path(__file__).parent.parent / "EMD_data.xlsx"
+
+# Datasets scored by the /backtest endpoint (one NASA POWER export per site)
+BACKTEST_DATASETS: List[Path] = [NASA_CSV_PATH]
+
+# Rows scored per model call; progress is reported after each chunk
+SCORE_CHUNK_ROWS = 65536
+DEFAULT_THRESHOLDS = np.round(np.linspace(0.05, 0.95, 19), 2)
+
+
+def load_flood_dates(path=EMDAT_PATH, country: str = "India") -> np.ndarray:
+    """
+    Flood start dates from an EM-DAT export (same rules as the training
+    notebook: missing month/day default to 1).
+
+    Returns:
+        Sorted unique datetime64[D] array
+    """
+    emdat = pd.read_excel(path)
+    emdat = emdat[(emdat["Country"] == country) & (emdat["Disaster Type"] == "Flood")]
+    start = pd.to_datetime(dict(
+        year=emdat["Start Year"],
+        month=emdat["Start Month"].fillna(1),
+        day=emdat["Start Day"].fillna(1)
+    ))
+    return np.unique(start.to_numpy().astype("datetime64[D]"))
+
+
+def site_feature_matrix(df: pd.DataFrame) -> np.ndarray:
+    """
+    Model feature rows (training order) for a daily NASA POWER series.
+    Anomalies are taken against the series' own day-of-year means.
+    """
+    doy = df.index.dayofyear
+    rain_clim = df["PRECTOTCORR"].groupby(doy).transform("mean")
+    temp_clim = df["T2M"].groupby(doy).transform("mean")
+    features = df.reindex(columns=FEATURE_NAMES)
+    features["rain_anomaly"] = df["PRECTOTCORR"] - rain_clim
+    features["temp_anomaly"] = df["T2M"] - temp_clim
+    return features.to_numpy(dtype=np.float64)
+
+
+def threshold_metrics(labels: np.ndarray, scores: np.ndarray, thresholds: Sequence[float]) -> List[Dict[str, Any]]:
+    """
+    Confusion counts, precision and recall for every threshold (flood when
+    score >= threshold), via binary search on the sorted scores.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    pos = np.sort(scores[labels == 1])
+    neg = np.sort(scores[labels == 0])
+    tp = len(pos) - np.searchsorted(pos, thresholds, side="left")
+    fp = len(neg) - np.searchsorted(neg, thresholds, side="left")
+    fn = len(pos) - tp
+    tn = len(neg) - fp
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(len(pos) > 0, tp / max(len(pos), 1), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        fpr = np.where(len(neg) > 0, fp / max(len(neg), 1), 0.0)
+
+    return [
+        {
+            "threshold": float(t),
+            "tp": int(tp[i]), "fp": int(fp[i]), "tn": int(tn[i]), "fn": int(fn[i]),
+            "precision": round(float(precision[i]), 4),
+            "recall": round(float(recall[i]), 4),
+            "f1": round(float(f1[i]), 4),
+            "fpr": round(float(fpr[i]), 4)
+        }
+        for i, t in enumerate(thresholds)
+    ]
+
+
+def roc_curve(labels: np.ndarray, scores: np.ndarray, max_points: int = 200) -> Dict[str, Any]:
+    """
+    ROC curve and AUC from one sort of the scores. The returned curve is
+    thinned to at most `max_points` points; AUC uses the full curve.
+    """
+    n_pos = int(labels.sum())
+    n_neg = len(labels) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return {"auc": None, "fpr": [], "tpr": []}
+
+    order = np.argsort(-scores, kind="mergesort")
+    sorted_scores = scores[order]
+    sorted_labels = labels[order]
+    # Last index of each run of tied scores
+    distinct = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(scores) - 1]
+    tps = np.cumsum(sorted_labels)[distinct]
+    fps = (distinct + 1) - tps
+
+    tpr = np.r_[0.0, tps / n_pos]
+    fpr = np.r_[0.0, fps / n_neg]
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    keep = np.unique(np.linspace(0, len(fpr) - 1, min(max_points, len(fpr))).astype(int))
+    return {
+        "auc": round(auc, 4),
+        "fpr": np.round(fpr[keep], 4).tolist(),
+        "tpr": np.round(tpr[keep], 4).tolist()
+    }
+
+
+def run_backtest(paths: Sequence = None, emdat_path=EMDAT_PATH, thresholds: Sequence[float] = None,
+                 start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Run the backtest, yielding progress events and finally the result.
+
+    Events:
+        {"event": "progress", "site", "site_index", "sites", "rows_scored", "rows_total"}
+        {"event": "result", ...metrics}
+    """
+    paths = list(paths or BACKTEST_DATASETS)
+    thresholds = DEFAULT_THRESHOLDS if thresholds is None else np.asarray(thresholds, dtype=np.float64)
+    started = time.perf_counter()
+    flood_dates = load_flood_dates(emdat_path)
+
+    all_labels, all_scores, sites = [], [], []
+    for site_index, path in enumerate(paths):
+        df = load_nasa_power_csv(path)
+        if start or end:
+            df = df.loc[start:end]
+        features = site_feature_matrix(df)
+        labels = np.isin(df.index.to_numpy().astype("datetime64[D]"), flood_dates).astype(np.int8)
+
+        scores = np.empty(len(features), dtype=np.float64)
+        for offset in range(0, len(features), SCORE_CHUNK_ROWS):
+            chunk = slice(offset, offset + SCORE_CHUNK_ROWS)
+            scores[chunk] = inference_pool.predict(features[chunk])
+            yield {
+                "event": "progress",
+                "site": Path(path).name,
+                "site_index": site_index + 1,
+                "sites": len(paths),
+                "rows_scored": min(offset + SCORE_CHUNK_ROWS, len(features)),
+                "rows_total": len(features)
+            }
+
+        all_labels.append(labels)
+        all_scores.append(scores)
+        sites.append({
+            "site": Path(path).name,
+            "latitude": df.attrs.get("latitude"),
+            "longitude": df.attrs.get("longitude"),
+            "days": len(df),
+            "start": str(df.index.min().date()) if len(df) else None,
+            "end": str(df.index.max().date()) if len(df) else None,
+            "flood_days": int(labels.sum())
+        })
+
+    labels = np.concatenate(all_labels) if all_labels else np.zeros(0, dtype=np.int8)
+    scores = np.concatenate(all_scores) if all_scores else np.zeros(0)
+
+    yield {
+        "event": "result",
+        "sites": sites,
+        "rows": int(len(labels)),
+        "flood_days": int(labels.sum()),
+        "flood_events": int(len(flood_dates)),
+        "roc": roc_curve(labels, scores),
+        "thresholds": threshold_metrics(labels, scores, thresholds),
+        "elapsed_seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def backtest(**kwargs) -> Dict[str, Any]:
+    """Run the backtest to completion and return the result event."""
+    result = None
+    for event in run_backtest(**kwargs):
+        result = event
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the flood model on NASA POWER history")
+    parser.add_argument("csv", nargs="*", help="NASA POWER daily exports (default: nasa(India).csv)")
+    parser.add_argument("--emdat", default=str(EMDAT_PATH), help="EM-DAT export (.xlsx)")
+    parser.add_argument("--start", help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    for event in run_backtest(args.csv or None, args.emdat, start=args.start, end=args.end):
+        if event["event"] == "progress":
+            print(f"[{event['site_index']}/{event['sites']}] {event['site']}: "
+                  f"{event['rows_scored']}/{event['rows_total']} rows", file=sys.stderr)
+        else:
+            print(json.dumps(event, indent=2))
+
+
+if __name__ == "__main__":
+    main()
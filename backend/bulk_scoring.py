@@ -0,0 +1,274 @@
+"""
+Bulk Scoring Module
+Scores large CSV / Parquet extracts in the NASA POWER column layout with
+bounded memory.
+
+Input is read in fixed-size chunks (pandas chunked CSV reader, or Parquet
+record batches), each chunk is scored with one batched model call and
+written out before the next chunk is read. Missing rain_anomaly /
+temp_anomaly columns are derived from the climatology table using the
+YEAR/DOY (or date) and LAT/LON columns when present.
+
+Expected columns:
+    T2M, T2M_MAX, T2M_MIN, PS, PRECTOTCORR, RH2M, WS2M
+    optional: YEAR + DOY or DATE, LAT + LON, rain_anomaly, temp_anomaly
+A leading NASA POWER "-BEGIN HEADER-" block is skipped. Parquet input and
+output need the optional pyarrow package.
+
+Usage:
+    python bulk_scoring.py input.csv [-o scored.csv|scored.parquet] [--chunk-rows 100000]
+"""
+import argparse
+import io
+import logging
+import sys
+import time
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_NAMES, add_anomalies
+from inference_pool import inference_pool
+from nasa_power import MISSING_VALUE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 100_000
+FORMATS = ("csv", "parquet")
+BASE_FEATURES = FEATURE_NAMES[:7]
+ANOMALY_FEATURES = FEATURE_NAMES[7:]
+PROBABILITY_COLUMN = "flood_probability"
+
+
+def detect_format(path, content_type: Optional[str] = None) -> str:
+    """Input format from a content type or the file extension / magic bytes."""
+    if content_type:
+        if "parquet" in content_type:
+            return "parquet"
+        if "csv" in content_type or content_type.startswith("text/"):
+            return "csv"
+    if str(path).lower().endswith((".parquet", ".pq")):
+        return "parquet"
+    with open(path, "rb") as f:
+        if f.read(4) == b"PAR1":
+            return "parquet"
+    return "csv"
+
+
+def _csv_line_chunks(path, chunk_rows: int) -> Iterator[Tuple[str, List[str], pd.DataFrame]]:
+    """
+    Yield (column header, raw data lines, parsed DataFrame) per chunk. The raw
+    lines are kept so scored output can pass input rows through unchanged.
+    """
+    with open(path, "r", newline="") as f:
+        line = f.readline()
+        if line.startswith("-BEGIN HEADER-"):
+            while line and not line.startswith("-END HEADER-"):
+                line = f.readline()
+            line = f.readline()
+        header = line.rstrip("\r\n")
+        while True:
+            lines = [row for row in islice(f, chunk_rows) if row.strip()]
+            if not lines:
+                break
+            df = pd.read_csv(io.StringIO(header + "\n" + "".join(lines)))
+            yield header, lines, df
+
+
+def _csv_chunks(path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for _, _, df in _csv_line_chunks(path, chunk_rows):
+        yield df
+
+
+def _parquet_chunks(path, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    try:
+        import pyarrow.parquet as pq  # type: ignore
+    except ImportError:
+        raise ValueError("Parquet input requires pyarrow (pip install pyarrow)")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def iter_chunks(path, fmt: str = "csv", chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    if fmt == "parquet":
+        return _parquet_chunks(path, chunk_rows)
+    return _csv_chunks(path, chunk_rows)
+
+
+def _find_column(df: pd.DataFrame, *names: str) -> Optional[str]:
+    lookup = {c.lower(): c for c in df.columns}
+    for name in names:
+        if name.lower() in lookup:
+            return lookup[name.lower()]
+    return None
+
+
+def _chunk_days_of_year(df: pd.DataFrame) -> Optional[np.ndarray]:
+    doy = _find_column(df, "DOY")
+    if doy is not None:
+        return df[doy].to_numpy(dtype=np.int64)
+    date = _find_column(df, "DATE", "time")
+    if date is not None:
+        return pd.to_datetime(df[date]).dt.dayofyear.to_numpy()
+    return None
+
+
+def score_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Append the flood probability column (and derived anomalies) to a chunk."""
+    missing = [name for name in BASE_FEATURES if name not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    features = np.empty((len(df), len(FEATURE_NAMES)), dtype=np.float64)
+    features[:, :len(BASE_FEATURES)] = df[BASE_FEATURES].to_numpy(dtype=np.float64)
+    features[features == MISSING_VALUE] = np.nan
+
+    if all(name in df.columns for name in ANOMALY_FEATURES):
+        features[:, len(BASE_FEATURES):] = df[ANOMALY_FEATURES].to_numpy(dtype=np.float64)
+    else:
+        features[:, len(BASE_FEATURES):] = 0.0
+        doy = _chunk_days_of_year(df)
+        if doy is not None:
+            lat, lon = _find_column(df, "LAT", "latitude"), _find_column(df, "LON", "longitude")
+            add_anomalies(
+                features, doy,
+                df[lat].to_numpy(dtype=np.float64) if lat and lon else None,
+                df[lon].to_numpy(dtype=np.float64) if lat and lon else None
+            )
+        df = df.assign(rain_anomaly=features[:, -2], temp_anomaly=features[:, -1])
+
+    return df.assign(**{PROBABILITY_COLUMN: inference_pool.predict(features)})
+
+
+def _update_stats(stats: Dict[str, Any], rows: int, started: float):
+    elapsed = time.perf_counter() - started
+    stats["rows"] += rows
+    stats["chunks"] += 1
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["rows"] / elapsed, 1) if elapsed > 0 else 0.0
+
+
+def _reset_stats(stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    stats = {} if stats is None else stats
+    stats.update(rows=0, chunks=0, seconds=0.0, rows_per_sec=0.0)
+    return stats
+
+
+def score_chunks(path, fmt: str = "csv", chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 stats: Optional[Dict[str, Any]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Score the input chunk by chunk. `stats` (if given) is updated in place
+    with rows, seconds and rows_per_sec as chunks are produced.
+    """
+    stats = _reset_stats(stats)
+    started = time.perf_counter()
+    for chunk in iter_chunks(path, fmt, chunk_rows):
+        scored = score_chunk(chunk)
+        _update_stats(stats, len(scored), started)
+        yield scored
+
+
+def _format_cell(value: float) -> str:
+    return "" if value != value else f"{value:.6g}"
+
+
+def scored_csv_pieces(path, fmt: str = "csv", chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                      stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """
+    Scored rows as CSV text, one piece per chunk (header in the first).
+
+    For CSV input the original lines are passed through verbatim and only
+    the appended columns are formatted, which avoids re-serializing the
+    whole frame with DataFrame.to_csv.
+    """
+    if fmt != "csv":
+        header = True
+        for scored in score_chunks(path, fmt, chunk_rows, stats):
+            yield scored.to_csv(index=False, header=header)
+            header = False
+        return
+
+    stats = _reset_stats(stats)
+    started = time.perf_counter()
+    first = True
+    for header, lines, df in _csv_line_chunks(path, chunk_rows):
+        scored = score_chunk(df)
+        added = [name for name in scored.columns if name not in df.columns]
+        columns = [scored[name].to_numpy(dtype=np.float64).tolist() for name in added]
+        body = "".join(
+            line.rstrip("\r\n") + "," + ",".join(_format_cell(v) for v in values) + "\n"
+            for line, values in zip(lines, zip(*columns))
+        )
+        if first:
+            body = header + "," + ",".join(added) + "\n" + body
+            first = False
+        _update_stats(stats, len(scored), started)
+        yield body
+
+
+def stream_scored_csv(path, fmt: str = "csv", chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[str]:
+    """
+    Scored rows as CSV text followed by a summary comment line:
+    "# rows=<n> seconds=<s> rows_per_sec=<r>".
+    """
+    stats: Dict[str, Any] = {}
+    yield from scored_csv_pieces(path, fmt, chunk_rows, stats)
+    yield f"# rows={stats['rows']} seconds={stats['seconds']} rows_per_sec={stats['rows_per_sec']}\n"
+
+
+def score_file(input_path, output_path, fmt: Optional[str] = None,
+               chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Score `input_path` into `output_path` (CSV, or Parquet when the output
+    ends in .parquet). Returns rows / seconds / rows_per_sec.
+    """
+    fmt = fmt or detect_format(input_path)
+    stats: Dict[str, Any] = {}
+
+    if str(output_path).lower().endswith((".parquet", ".pq")):
+        try:
+            import pyarrow as pa  # type: ignore
+            import pyarrow.parquet as pq  # type: ignore
+        except ImportError:
+            raise ValueError("Parquet output requires pyarrow (pip install pyarrow)")
+        writer = None
+        try:
+            for scored in score_chunks(input_path, fmt, chunk_rows, stats):
+                table = pa.Table.from_pandas(scored, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(output_path, "w", newline="") as f:
+            for piece in scored_csv_pieces(input_path, fmt, chunk_rows, stats):
+                f.write(piece)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet extract with the flood model")
+    parser.add_argument("input", help="Input CSV or Parquet file (NASA POWER column layout)")
+    parser.add_argument("-o", "--output", help="Output file (.csv or .parquet); default: stdout as CSV")
+    parser.add_argument("--format", choices=FORMATS, help="Input format (default: detect)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per scoring chunk")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.input)
+    if args.output:
+        stats = score_file(args.input, args.output, fmt, args.chunk_rows)
+        print(f"Scored {stats['rows']} rows in {stats['seconds']}s "
+              f"({stats['rows_per_sec']} rows/sec) -> {args.output}", file=sys.stderr)
+    else:
+        for piece in stream_scored_csv(args.input, fmt, args.chunk_rows):
+            sys.stdout.write(piece)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Cache Module
+Thread-safe in-memory LRU cache with optional TTL and request coalescing.
+
+`get_or_compute` guarantees that concurrent callers asking for the same
+missing key share a single computation: the first caller computes the value
+while the others wait for it, so each key is computed at most once per
+expiry window. `aget_or_compute` is the coroutine variant for async
+handlers; it waits without blocking the event loop and coalesces with
+synchronous callers of the same key.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+_MISSING = object()
+
+
+def _wake(future: "asyncio.Future"):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Flight:
+    """One in-progress computation: sync waiters block on `event`, async ones await a future."""
+    __slots__ = ("event", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.waiters: List[tuple] = []
+
+    def wait_async(self) -> "asyncio.Future":
+        """Future resolved when the flight lands. Caller must hold the cache lock."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.append((loop, future))
+        return future
+
+    def land(self):
+        """Release every waiter. Call after removing the flight from the cache."""
+        self.event.set()
+        for loop, future in self.waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with an optional time-to-live per entry.
+
+    Args:
+        maxsize: Maximum number of entries kept
+        ttl: Seconds an entry stays valid (None = never expires)
+        name: Label used in stats output
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: Hashable):
+        """Return the cached value or _MISSING. Caller must hold the lock."""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        """Insert a value and evict the oldest entries. Caller must hold the lock."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Return the cached value for `key`, computing it with `compute()` on a miss.
+        Concurrent misses for the same key wait for the first computation.
+        If that computation fails, the exception propagates to its caller and
+        waiting callers retry the computation themselves.
+        """
+        while True:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    self.hits += 1
+                    return value
+                flight = self._inflight.get(key)
+                if flight is None:
+                    self.misses += 1
+                    flight = self._inflight[key] = _Flight()
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                flight.event.wait()
+                continue
+
+            try:
+                value = compute()
+                with self._lock:
+                    self._store(key, value, ttl)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                flight.land()
+
+    async def aget_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]],
+                              ttl: Optional[float] = None) -> Any:
+        """
+        Async get_or_compute: `compute` is a coroutine function. Waiting for
+        another caller's computation (sync or async) does not block the loop.
+        """
+        while True:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not _MISSING:
+                    self.hits += 1
+                    return value
+                flight = self._inflight.get(key)
+                if flight is None:
+                    self.misses += 1
+                    flight = self._inflight[key] = _Flight()
+                    waiter = None
+                else:
+                    waiter = flight.wait_async()
+
+            if waiter is not None:
+                await waiter
+                continue
+
+            try:
+                value = await compute()
+                with self._lock:
+                    self._store(key, value, ttl)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                flight.land()
+
+    def peek_many(self, keys) -> list:
+        """
+        Unexpired values of `keys` (None where missing) without changing LRU
+        order or hit/miss counts.
+        """
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                values.append(entry[0] if entry is not None and (entry[1] is None or entry[1] > now) else None)
+        return values
+
+    def items(self):
+        """Snapshot of unexpired (key, value) pairs; does not change LRU order."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters."""
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
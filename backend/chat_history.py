@@ -0,0 +1,194 @@
+"""
+Chat History Module
+Per-session conversation stores for the chatbot with bounded memory.
+
+Each session keeps its most recent messages in a ring buffer
+(`max_messages`). Sessions idle for longer than `idle_ttl` seconds are
+evicted, and at most `max_sessions` are kept (least recently used go first),
+so memory per worker stays flat however long it runs.
+
+With `persist_dir`, evicted sessions (and all sessions at shutdown) are
+written there as one small JSON file each and reloaded on next use, so
+conversations survive eviction and restarts without living in memory.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION = "default"
+DEFAULT_MAX_MESSAGES = 200
+DEFAULT_MAX_SESSIONS = 10_000
+DEFAULT_IDLE_TTL = 3600
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validate_session_id(session_id: Optional[str]) -> str:
+    """Session id to use (DEFAULT_SESSION if None); raises ValueError if malformed."""
+    if session_id is None:
+        return DEFAULT_SESSION
+    if not _SESSION_ID_RE.match(session_id):
+        raise ValueError("session_id must be 1-64 characters of letters, digits, '-' or '_'")
+    return session_id
+
+
+class ChatSession:
+    """Ring buffer of one session's messages."""
+
+    def __init__(self, max_messages: int, messages: Optional[List[Dict[str, Any]]] = None, total: int = 0):
+        self.messages: deque = deque(messages or [], maxlen=max_messages)
+        # Messages ever added, including those that fell out of the buffer
+        self.total = max(total, len(self.messages))
+        self.last_seen = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"total": self.total, "messages": list(self.messages)}
+
+
+class ChatSessionStore:
+    """
+    Bounded, thread-safe map of session id -> ChatSession.
+
+    Args:
+        max_messages: Messages kept per session (oldest dropped first)
+        max_sessions: Sessions kept in memory (least recently used evicted)
+        idle_ttl: Seconds without activity before a session is evicted
+        persist_dir: Directory where evicted sessions are saved (None = discard)
+    """
+
+    def __init__(self, max_messages: int = DEFAULT_MAX_MESSAGES, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 idle_ttl: float = DEFAULT_IDLE_TTL, persist_dir=None):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        if self.persist_dir is not None:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    # ---------------- persistence ----------------
+
+    def _path(self, session_id: str) -> Path:
+        return self.persist_dir / f"{session_id}.json"
+
+    def _load(self, session_id: str) -> Optional[ChatSession]:
+        if self.persist_dir is None:
+            return None
+        try:
+            with open(self._path(session_id)) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Could not load chat session %s: %s", session_id, e)
+            return None
+        return ChatSession(self.max_messages, data.get("messages"), data.get("total", 0))
+
+    def _save(self, sessions: Dict[str, ChatSession]):
+        if self.persist_dir is None:
+            return
+        for session_id, session in sessions.items():
+            path = self._path(session_id)
+            tmp = path.with_suffix(".tmp")
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(session.to_dict(), f)
+                os.replace(tmp, path)
+            except Exception as e:
+                logger.warning("Could not save chat session %s: %s", session_id, e)
+
+    # ---------------- internals ----------------
+
+    def _evict(self) -> Dict[str, ChatSession]:
+        """Pop idle and surplus sessions (LRU order). Caller must hold the lock."""
+        evicted = {}
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_seen > cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            evicted[session_id] = self._sessions.pop(session_id)
+        self.evicted += len(evicted)
+        return evicted
+
+    def _session(self, session_id: str, create: bool) -> Optional[ChatSession]:
+        """Look up (or load/create) a session and mark it used. Caller must hold the lock."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id)
+            if session is None and not create:
+                return None
+            session = session or ChatSession(self.max_messages)
+            self._sessions[session_id] = session
+        session.last_seen = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    # ---------------- public API ----------------
+
+    def append(self, session_id: str, role: str, message: str):
+        with self._lock:
+            session = self._session(session_id, create=True)
+            session.messages.append({"role": role, "message": message, "timestamp": datetime.now().isoformat()})
+            session.total += 1
+            evicted = self._evict()
+        self._save(evicted)
+
+    def page(self, session_id: str, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """
+        Up to `limit` messages in chronological order, skipping the `offset`
+        most recent ones (offset=0 is the latest page).
+        """
+        with self._lock:
+            session = self._session(session_id, create=False)
+            messages = session.messages if session else deque()
+            stop = max(len(messages) - offset, 0)
+            start = max(stop - limit, 0)
+            history = list(islice(messages, start, stop))
+            return {
+                "session_id": session_id,
+                "retained": len(messages),
+                "total": session.total if session else 0,
+                "offset": offset,
+                "limit": limit,
+                "has_more": start > 0,
+                "history": history
+            }
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.persist_dir is not None:
+            try:
+                self._path(session_id).unlink()
+            except FileNotFoundError:
+                pass
+
+    def flush(self):
+        """Save every in-memory session (call at shutdown when persisting)."""
+        with self._lock:
+            sessions = dict(self._sessions)
+        self._save(sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(s.messages) for s in self._sessions.values()),
+                "evicted": self.evicted,
+                "max_sessions": self.max_sessions,
+                "max_messages": self.max_messages,
+                "persistent": self.persist_dir is not None
+            }
@@ -0,0 +1,209 @@
+"""
+Chat Router Module
+Routes a chatbot message to an intent in one pass over the text.
+
+All patterns are compiled once at import:
+- every routing keyword (decision refusals and intent keywords) goes into a
+  single prefix-factored alternation scanned with a lookahead, so
+  overlapping keywords are all seen in one pass;
+- the ten location patterns are combined into one alternation that rejects
+  the (common) messages without a location in a single search.
+
+Routing priorities are the same as the original chain of checks: decision
+refusal, then location lookup (patterns in order), then the intents in the
+order of INTENTS, then the general answer. Keywords match as plain
+substrings, as before.
+
+Benchmark:
+    python chat_router.py [--iterations 20000]
+"""
+import argparse
+import re
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+DECISION = "decision"
+LOCATION = "location"
+GENERAL = "general"
+
+DECISION_KEYWORDS = [
+    "should i evacuate", "should we evacuate", "tell me what to do",
+    "what action", "what should i do", "what should we do",
+    "allocate", "deploy", "command", "order", "authorize"
+]
+
+# (intent, keywords) in routing priority order
+INTENTS: List[Tuple[str, List[str]]] = [
+    ("shap", ["shap", "feature", "contribute", "important", "influence"]),
+    ("reasons", ["why", "reason", "cause"]),
+    ("simulation", ["simulation", "what if", "scenario", "hypothetical"]),
+    ("prediction", ["prediction", "forecast", "risk"]),
+    ("external", ["external", "news", "context", "recent", "public"]),
+    ("compare", ["compare", "difference", "versus", "vs"]),
+    ("welcome", ["hello", "hi", "help", "what can you"])
+]
+
+# Tried in order; the first match that yields a usable location wins
+LOCATION_PATTERNS = [
+    r"what about\s+([a-zA-Z\s]+)",
+    r"tell\s+(?:me\s+)?about\s+([a-zA-Z\s]+)",
+    r"show.*?for\s+([a-zA-Z\s]+)",
+    r"give.*?for\s+([a-zA-Z\s]+)",
+    r"(?:flood\s+)?risk in\s+([a-zA-Z\s]+)",
+    r"forecast for\s+([a-zA-Z\s]+)",
+    r"prediction for\s+([a-zA-Z\s]+)",
+    r"analysis (?:of|for)\s+([a-zA-Z\s]+)",
+    r"(?:what's|how's) (?:the )?(?:flood )?risk in\s+([a-zA-Z\s]+)",
+    r"data (?:for|of|on)\s+([a-zA-Z\s]+)"
+]
+
+NON_LOCATIONS = frozenset(["the area", "my area", "this area", "here"])
+
+_TRAILING_PUNCTUATION = re.compile(r"[?!.,;]+$")
+
+
+def trie_pattern(words: Sequence[str]) -> str:
+    """
+    Regex matching any of `words`, factored by common prefix so the engine
+    tests each character once per position instead of once per word. Where
+    one word is a prefix of another, the longer one is preferred.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class Route(NamedTuple):
+    intent: str
+    location: Optional[str] = None
+
+
+class ChatRouter:
+    """
+    Precompiled intent router.
+
+    Args:
+        intents: (intent, keywords) pairs in priority order
+        decision_keywords: Phrases that trigger the safety refusal
+        location_patterns: Regexes with one group capturing the place name
+    """
+
+    def __init__(self, intents: Sequence[Tuple[str, Sequence[str]]] = INTENTS,
+                 decision_keywords: Sequence[str] = DECISION_KEYWORDS,
+                 location_patterns: Sequence[str] = LOCATION_PATTERNS):
+        # Rank 0 is the decision refusal; intents follow in priority order
+        self._intents = [DECISION] + [name for name, _ in intents]
+        ranks = {}
+        for rank, keywords in enumerate([decision_keywords] + [kw for _, kw in intents]):
+            for keyword in keywords:
+                ranks.setdefault(keyword, rank)
+        # At one position only the longest keyword is reported; credit it with
+        # the best rank of every keyword that is its prefix (those match at
+        # the same position too).
+        self._rank = {kw: min(r for k, r in ranks.items() if kw.startswith(k)) for kw in ranks}
+        self._keywords = re.compile(f"(?=({trie_pattern(ranks)}))")
+
+        self._location_patterns = [re.compile(p) for p in location_patterns]
+        self._any_location = re.compile("|".join(f"(?:{p})" for p in location_patterns))
+
+    def _best_rank(self, query: str) -> Optional[int]:
+        best = None
+        for match in self._keywords.finditer(query):
+            rank = self._rank[match.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+        return best
+
+    def is_decision_query(self, query: str) -> bool:
+        return self._best_rank(query) == 0
+
+    def extract_location(self, query: str) -> Optional[str]:
+        """Place name from 'What about Mumbai?', 'risk in Delhi', ... or None."""
+        query = query.lower().strip()
+        if self._any_location.search(query) is None:
+            return None
+        for pattern in self._location_patterns:
+            match = pattern.search(query)
+            if match:
+                location = _TRAILING_PUNCTUATION.sub("", match.group(1).strip()).strip()
+                if len(location) > 1 and location not in NON_LOCATIONS:
+                    return location
+        return None
+
+    def route(self, query: str) -> Route:
+        """Route a lower-cased message."""
+        rank = self._best_rank(query)
+        if rank == 0:
+            return Route(DECISION)
+        location = self.extract_location(query)
+        if location:
+            return Route(LOCATION, location)
+        if rank is None:
+            return Route(GENERAL)
+        return Route(self._intents[rank])
+
+
+router = ChatRouter()
+
+
+SAMPLE_MESSAGES = [
+    "hello",
+    "Why is the risk so high?",
+    "Which features contribute most to this prediction?",
+    "What if rainfall doubles tomorrow?",
+    "What about Mumbai?",
+    "Tell me about the flood risk in Chennai",
+    "Should I evacuate my family tonight?",
+    "Any recent news about the monsoon?",
+    "Compare the baseline versus the simulation",
+    "thanks, that was useful",
+    "Can you give me the full analysis for Guwahati and the surrounding districts please?",
+    "ok"
+]
+
+
+def benchmark(messages: Sequence[str] = SAMPLE_MESSAGES, iterations: int = 20000) -> dict:
+    """Mean routing cost per message (lower-casing included), in microseconds."""
+    per_message = {}
+    for message in messages:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            router.route(message.lower())
+        per_message[message] = (time.perf_counter() - started) / iterations * 1e6
+    return {
+        "iterations": iterations,
+        "mean_us": sum(per_message.values()) / len(per_message),
+        "max_us": max(per_message.values()),
+        "per_message_us": per_message
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark the chat intent router")
+    parser.add_argument("--iterations", type=int, default=20000, help="Routing calls per sample message")
+    args = parser.parse_args(argv)
+
+    result = benchmark(iterations=args.iterations)
+    for message, cost in result["per_message_us"].items():
+        route = router.route(message.lower())
+        print(f"{cost:8.2f} us  {route.intent:<10} {message}")
+    print(f"mean {result['mean_us']:.2f} us/message, max {result['max_us']:.2f} us "
+          f"({result['iterations']} iterations per message)")
+
+
+if __name__ == "__main__":
+    main()
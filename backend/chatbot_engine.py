@@ -4,14 +4,21 @@ This module provides contextual explanations and interpretations of flood predic
 It does NOT provide decision-making or authoritative guidance.
 """
 
+import contextvars
 import logging
-from typing import Dict, List, Optional, Any
-import random
-from datetime import datetime
-import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+from location_service import get_lat_lon, get_lat_lon_async, live_prediction, live_prediction_async, live_shap, live_shap_async
+from chat_router import DECISION, LOCATION, Route, router
+from chat_history import DEFAULT_SESSION, ChatSessionStore
+from tracing import span
 
 logger = logging.getLogger(__name__)
 
+# Runs the slow parts of a reply (SHAP) while earlier sections are sent
+_section_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-sections")
+
 
 class FloodInsightChatbot:
     """
@@ -22,8 +29,9 @@ class FloodInsightChatbot:
     and contextual awareness.
     """
     
-    def __init__(self):
-        self.conversation_history = []
+    def __init__(self, sessions: Optional[ChatSessionStore] = None):
+        # Per-session, bounded conversation history
+        self.sessions = sessions or ChatSessionStore()
         
         # Feature name mappings for better explanation
         self.feature_names = {
@@ -41,7 +49,8 @@ class FloodInsightChatbot:
     def process_query(
         self,
         user_message: str,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        session_id: str = DEFAULT_SESSION
     ) -> Dict[str, Any]:
         """
         Process a user query and return an explanatory response.
@@ -49,6 +58,7 @@ class FloodInsightChatbot:
         Args:
             user_message: The user's question
             context: Optional context including prediction, shap_values, simulation, etc.
+            session_id: Conversation the exchange is recorded in
         
         Returns:
             Dictionary with response and metadata
@@ -56,29 +66,77 @@ class FloodInsightChatbot:
         user_message_lower = user_message.lower()
         
         # Store in history
-        self.conversation_history.append({
-            "role": "user",
-            "message": user_message,
-            "timestamp": datetime.now().isoformat()
-        })
+        self.sessions.append(session_id, "user", user_message)
         
         # Route to appropriate handler
         response = self._generate_response(user_message_lower, context or {})
         
         # Store response
-        self.conversation_history.append({
-            "role": "assistant",
-            "message": response["message"],
-            "timestamp": datetime.now().isoformat()
-        })
+        self.sessions.append(session_id, "assistant", response["message"])
         
         return response
     
-    def _generate_response(self, query: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def prefetch(self, user_message: str, explain: bool = True):
+        """
+        Warm the live caches a location question will read (coordinates,
+        prediction and, with `explain`, SHAP) without holding a thread while
+        upstream responds. process_query/stream_query then answer from memory.
+        Failures are left for those to report.
+        """
+        route = router.route(user_message.lower())
+        if route.intent != LOCATION:
+            return
+        try:
+            with span("chat_prefetch"):
+                coords = await get_lat_lon_async(route.location)
+                if coords is None:
+                    return
+                await live_prediction_async(*coords)
+                if explain:
+                    await live_shap_async(*coords)
+        except Exception as e:
+            logger.warning("Prefetch for %s failed: %s", route.location, e)
+    
+    def stream_query(
+        self,
+        user_message: str,
+        context: Optional[Dict[str, Any]] = None,
+        session_id: str = DEFAULT_SESSION
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Like process_query, but yields the reply while it is produced:
+        {"event": "section", "id", "markdown"} for each part as soon as it is
+        ready, then {"event": "done", **response}. Location analyses stream
+        section by section; other replies arrive as one "message" section.
+        """
+        query = user_message.lower()
+        self.sessions.append(session_id, "user", user_message)
+        
+        route = router.route(query)
+        if route.intent == LOCATION:
+            sections = []
+            for section, value in self._location_sections(route.location):
+                if section is None:
+                    response = {**value, "message": "".join(sections)}
+                    break
+                sections.append(value)
+                yield {"event": "section", "id": section, "markdown": value}
+        else:
+            response = self._generate_response(query, context or {}, route)
+            yield {"event": "section", "id": "message", "markdown": response["message"]}
+        
+        self.sessions.append(session_id, "assistant", response["message"])
+        yield {"event": "done", **response}
+    
+    def _generate_response(self, query: str, context: Dict[str, Any],
+                           route: Optional[Route] = None) -> Dict[str, Any]:
         """Generate appropriate response based on query type and available context"""
         
+        with span("chat_route"):
+            route = route or router.route(query)
+
         # Safety check - refuse decision-making queries
-        if self._is_decision_query(query):
+        if route.intent == DECISION:
             return {
                 "message": self._get_safety_disclaimer(),
                 "type": "safety_disclaimer",
@@ -86,32 +144,22 @@ class FloodInsightChatbot:
             }
         
         # Check if user is asking about a specific place
-        location_query = self._extract_location_query(query)
-        if location_query:
-            return self._handle_location_query(location_query, context)
+        if route.intent == LOCATION:
+            return self._handle_location_query(route.location, context)
         
         # Route to specific handlers
-        if any(word in query for word in ["shap", "feature", "contribute", "important", "influence"]):
-            return self._explain_shap(context)
-        
-        elif any(word in query for word in ["why", "reason", "cause"]):
-            return self._explain_reasons(context)
-        
-        elif any(word in query for word in ["simulation", "what if", "scenario", "hypothetical"]):
-            return self._explain_simulation(context)
-        
-        elif any(word in query for word in ["prediction", "forecast", "risk"]):
-            return self._explain_prediction(context)
-        
-        elif any(word in query for word in ["external", "news", "context", "recent", "public"]):
-            return self._provide_external_context(context)
-        
-        elif any(word in query for word in ["compare", "difference", "versus", "vs"]):
-            return self._compare_results(context)
-        
-        elif any(word in query for word in ["hello", "hi", "help", "what can you"]):
+        handlers = {
+            "shap": self._explain_shap,
+            "reasons": self._explain_reasons,
+            "simulation": self._explain_simulation,
+            "prediction": self._explain_prediction,
+            "external": self._provide_external_context,
+            "compare": self._compare_results
+        }
+        if route.intent in handlers:
+            return handlers[route.intent](context)
+        elif route.intent == "welcome":
             return self._get_welcome_message()
-        
         else:
             return self._general_response(query, context)
     
@@ -121,170 +169,55 @@ class FloodInsightChatbot:
         'What about Mumbai?', 'Tell me about Delhi', 'Show data for Chennai', etc.
         Returns the location name if found, else None
         """
-        location_patterns = [
-            r"what about\s+([a-zA-Z\s]+)",
-            r"tell\s+(?:me\s+)?about\s+([a-zA-Z\s]+)",
-            r"show.*?for\s+([a-zA-Z\s]+)",
-            r"give.*?for\s+([a-zA-Z\s]+)",
-            r"(?:flood\s+)?risk in\s+([a-zA-Z\s]+)",
-            r"forecast for\s+([a-zA-Z\s]+)",
-            r"prediction for\s+([a-zA-Z\s]+)",
-            r"analysis (?:of|for)\s+([a-zA-Z\s]+)",
-            r"(?:what's|how's) (?:the )?(?:flood )?risk in\s+([a-zA-Z\s]+)",
-            r"data (?:for|of|on)\s+([a-zA-Z\s]+)"
-        ]
-        
-        query_lower = query.lower().strip()
-        
-        import re
-        for pattern in location_patterns:
-            match = re.search(pattern, query_lower)
-            if match:
-                location = match.group(1).strip()
-                # Remove trailing punctuation
-                location = re.sub(r'[?!.,;]+$', '', location).strip()
-                # Filter out common non-location words
-                if location and len(location) > 1 and location not in ["the area", "my area", "this area", "here"]:
-                    return location
-        
-        return None
+        return router.extract_location(query)
     
     def _handle_location_query(self, location: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Handle user asking about a specific location.
         Fetches live data and returns comprehensive analysis.
         """
-        from main import get_lat_lon, fetch_live_weather, classify_risk
-        from model_loader import predict, explain_instance_shap
-        
-        explanation = f"**Flood Risk Analysis for {location.title()}**\n\n"
+        sections = []
+        for section, value in self._location_sections(location):
+            if section is None:
+                return {**value, "message": "".join(sections)}
+            sections.append(value)
+    
+    def _location_sections(self, location: str) -> Iterator[Tuple[Optional[str], Any]]:
+        """
+        Location analysis as (section id, markdown) pairs in display order,
+        each yielded as soon as its data is ready, followed by
+        (None, response metadata). SHAP runs concurrently with the risk and
+        weather sections.
+        """
+        yield "header", f"**Flood Risk Analysis for {location.title()}**\n\n"
         
         try:
             # Get coordinates
-            coords = get_lat_lon(location)
+            with span("chat_geocode"):
+                coords = get_lat_lon(location)
             if coords is None:
-                explanation += f"❌ Unable to find location '{location.title()}'. Please check the spelling or try:\n"
+                explanation = f"❌ Unable to find location '{location.title()}'. Please check the spelling or try:\n"
                 explanation += "• Using a more specific name (e.g., 'Mumbai, India')\n"
                 explanation += "• Selecting the location from the Location Selector in the dashboard\n"
-                return {
-                    "message": explanation,
+                yield "error", explanation
+                yield None, {
                     "type": "location_query",
                     "confidence": 0.3,
                     "data": {"location": location, "status": "location_not_found"}
                 }
+                return
             
             lat, lon = coords
             
-            # Fetch weather data
-            weather = fetch_live_weather(lat, lon)
-            
-            # Calculate features
-            t2m = weather["temperature"]
-            t2m_max = weather["temperature"] + 2
-            t2m_min = weather["temperature"] - 2
-            
-            features = np.array([[
-                t2m,                      # T2M
-                t2m_max,                  # T2M_MAX
-                t2m_min,                  # T2M_MIN
-                weather["pressure"],      # PS
-                weather["rainfall"],      # PRECTOTCORR
-                weather["humidity"],      # RH2M
-                weather["wind_speed"],    # WS2M
-                0.0,                      # rain_anomaly
-                0.0                       # temp_anomaly
-            ]])
-            
-            # Get prediction
-            prob = float(predict(features))
-            risk = classify_risk(prob)
-            
-            # Get SHAP explanation
-            shap_explanation = explain_instance_shap(features)
-            shap_values = shap_explanation.get("shap_values", [])
-            feature_names = shap_explanation.get("feature_names", [])
-            
-            # Build comprehensive response
-            explanation += f"📍 **Location**: {location.title()} ({lat:.2f}°N, {lon:.2f}°E)\n\n"
-            
-            explanation += "---\n\n"
-            explanation += "## 🌊 Flood Risk Assessment\n\n"
-            explanation += f"**Probability**: {prob:.1%}\n"
-            explanation += f"**Risk Level**: **{risk}**\n\n"
-            
-            # Risk interpretation
-            if risk == "Critical":
-                explanation += "⚠️ **CRITICAL RISK** - Conditions are highly favorable for flooding. Multiple weather factors indicate severe flood potential.\n\n"
-            elif risk == "High":
-                explanation += "🔴 **HIGH RISK** - Significant flood potential exists. Weather conditions show elevated risk factors.\n\n"
-            elif risk == "Moderate":
-                explanation += "🟡 **MODERATE RISK** - Some flood potential present. Conditions warrant monitoring.\n\n"
-            else:
-                explanation += "🟢 **LOW RISK** - Current conditions are generally unfavorable for flooding.\n\n"
-            
-            explanation += "---\n\n"
-            explanation += "## 🌤️ Current Weather Conditions\n\n"
-            explanation += f"• **Temperature**: {t2m:.1f}°C (max: {t2m_max:.1f}°C, min: {t2m_min:.1f}°C)\n"
-            explanation += f"• **Rainfall**: {weather['rainfall']:.1f} mm\n"
-            explanation += f"• **Humidity**: {weather['humidity']:.1f}%\n"
-            explanation += f"• **Pressure**: {weather['pressure']:.1f} kPa\n"
-            explanation += f"• **Wind Speed**: {weather['wind_speed']:.1f} m/s\n\n"
-            
-            explanation += "---\n\n"
-            explanation += "## 📊 Feature Contribution Analysis (SHAP)\n\n"
-            
-            if shap_values and feature_names:
-                # Find top contributing features
-                feature_impacts = list(zip(feature_names, shap_values))
-                feature_impacts.sort(key=lambda x: abs(x[1]), reverse=True)
-                top_features = feature_impacts[:5]
-                
-                explanation += "**Top factors influencing the flood risk prediction:**\n\n"
-                
-                for i, (feature, value) in enumerate(top_features, 1):
-                    feature_display = self.feature_names.get(feature, feature)
-                    direction = "increasing" if value > 0 else "decreasing"
-                    impact = "strongly" if abs(value) > 0.1 else "moderately" if abs(value) > 0.05 else "slightly"
-                    emoji = "🔺" if value > 0 else "🔻"
-                    
-                    explanation += f"{i}. {emoji} **{feature_display}**: {impact} {direction} risk (SHAP: {value:+.3f})\n"
-                
-                explanation += "\n*SHAP values show how much each weather parameter pushed the prediction away from the baseline.*\n\n"
-            
-            explanation += "---\n\n"
-            explanation += "## 💡 What This Means\n\n"
-            explanation += "This analysis is based on:\n"
-            explanation += "• Real-time weather data from meteorological services\n"
-            explanation += "• Machine learning model trained on historical flood patterns\n"
-            explanation += "• Feature importance analysis using SHAP (SHapley Additive exPlanations)\n\n"
-            
-            explanation += "**Remember**: This is a risk interpretation tool, not an official warning system. "
-            explanation += "Always consult local emergency services and official weather alerts for action guidance.\n\n"
-            
-            explanation += "---\n\n"
-            explanation += "**Ask me more questions** like:\n"
-            explanation += "• 'Why is the risk at this level?'\n"
-            explanation += "• 'Which feature contributed most?'\n"
-            explanation += "• 'How does rainfall affect the prediction?'\n"
-            
-            return {
-                "message": explanation,
-                "type": "location_query",
-                "confidence": 0.95,
-                "data": {
-                    "location": location,
-                    "coordinates": {"latitude": lat, "longitude": lon},
-                    "probability": prob,
-                    "risk_level": risk,
-                    "weather": weather,
-                    "shap_explanation": shap_explanation,
-                    "status": "success"
-                }
-            }
-            
+            # Weather and prediction from the shared live caches; SHAP starts
+            # right away (in this request's context) while the risk is shown
+            with span("chat_prediction"):
+                prediction = live_prediction(lat, lon)
+            shap_future = _section_executor.submit(contextvars.copy_context().run, live_shap, lat, lon)
+            weather = prediction["weather"]
         except Exception as e:
             logger.exception(f"Error fetching data for location {location}: {e}")
-            explanation += f"❌ **Error**: Unable to fetch data for {location.title()}.\n\n"
+            explanation = f"❌ **Error**: Unable to fetch data for {location.title()}.\n\n"
             explanation += "This could be due to:\n"
             explanation += "• Network connectivity issues\n"
             explanation += "• Weather service unavailability\n"
@@ -293,9 +226,8 @@ class FloodInsightChatbot:
             explanation += "• Checking your spelling\n"
             explanation += "• Using the Location Selector in the dashboard\n"
             explanation += "• Trying again in a few moments\n"
-            
-            return {
-                "message": explanation,
+            yield "error", explanation
+            yield None, {
                 "type": "location_query",
                 "confidence": 0.2,
                 "data": {
@@ -304,15 +236,105 @@ class FloodInsightChatbot:
                     "error": str(e)
                 }
             }
+            return
+        
+        # Calculate features
+        t2m = weather["temperature"]
+        t2m_max = weather["temperature"] + 2
+        t2m_min = weather["temperature"] - 2
+        
+        prob = prediction["probability"]
+        risk = prediction["risk_level"]
+        
+        # Build comprehensive response
+        explanation = f"📍 **Location**: {location.title()} ({lat:.2f}°N, {lon:.2f}°E)\n\n"
+        
+        explanation += "---\n\n"
+        explanation += "## 🌊 Flood Risk Assessment\n\n"
+        explanation += f"**Probability**: {prob:.1%}\n"
+        explanation += f"**Risk Level**: **{risk}**\n\n"
+        
+        # Risk interpretation
+        if risk == "Critical":
+            explanation += "⚠️ **CRITICAL RISK** - Conditions are highly favorable for flooding. Multiple weather factors indicate severe flood potential.\n\n"
+        elif risk == "High":
+            explanation += "🔴 **HIGH RISK** - Significant flood potential exists. Weather conditions show elevated risk factors.\n\n"
+        elif risk == "Moderate":
+            explanation += "🟡 **MODERATE RISK** - Some flood potential present. Conditions warrant monitoring.\n\n"
+        else:
+            explanation += "🟢 **LOW RISK** - Current conditions are generally unfavorable for flooding.\n\n"
+        yield "risk", explanation
+        
+        explanation = "---\n\n"
+        explanation += "## 🌤️ Current Weather Conditions\n\n"
+        explanation += f"• **Temperature**: {t2m:.1f}°C (max: {t2m_max:.1f}°C, min: {t2m_min:.1f}°C)\n"
+        explanation += f"• **Rainfall**: {weather['rainfall']:.1f} mm\n"
+        explanation += f"• **Humidity**: {weather['humidity']:.1f}%\n"
+        explanation += f"• **Pressure**: {weather['pressure']:.1f} kPa\n"
+        explanation += f"• **Wind Speed**: {weather['wind_speed']:.1f} m/s\n\n"
+        yield "weather", explanation
+        
+        with span("chat_shap_wait"):
+            shap_explanation = shap_future.result() or {}
+        shap_values = shap_explanation.get("shap_values", [])
+        feature_names = shap_explanation.get("feature_names", [])
+        
+        explanation = "---\n\n"
+        explanation += "## 📊 Feature Contribution Analysis (SHAP)\n\n"
+        
+        if shap_values and feature_names:
+            # Find top contributing features
+            feature_impacts = list(zip(feature_names, shap_values))
+            feature_impacts.sort(key=lambda x: abs(x[1]), reverse=True)
+            top_features = feature_impacts[:5]
+            
+            explanation += "**Top factors influencing the flood risk prediction:**\n\n"
+            
+            for i, (feature, value) in enumerate(top_features, 1):
+                feature_display = self.feature_names.get(feature, feature)
+                direction = "increasing" if value > 0 else "decreasing"
+                impact = "strongly" if abs(value) > 0.1 else "moderately" if abs(value) > 0.05 else "slightly"
+                emoji = "🔺" if value > 0 else "🔻"
+                
+                explanation += f"{i}. {emoji} **{feature_display}**: {impact} {direction} risk (SHAP: {value:+.3f})\n"
+            
+            explanation += "\n*SHAP values show how much each weather parameter pushed the prediction away from the baseline.*\n\n"
+        yield "shap", explanation
+        
+        explanation = "---\n\n"
+        explanation += "## 💡 What This Means\n\n"
+        explanation += "This analysis is based on:\n"
+        explanation += "• Real-time weather data from meteorological services\n"
+        explanation += "• Machine learning model trained on historical flood patterns\n"
+        explanation += "• Feature importance analysis using SHAP (SHapley Additive exPlanations)\n\n"
+        
+        explanation += "**Remember**: This is a risk interpretation tool, not an official warning system. "
+        explanation += "Always consult local emergency services and official weather alerts for action guidance.\n\n"
+        
+        explanation += "---\n\n"
+        explanation += "**Ask me more questions** like:\n"
+        explanation += "• 'Why is the risk at this level?'\n"
+        explanation += "• 'Which feature contributed most?'\n"
+        explanation += "• 'How does rainfall affect the prediction?'\n"
+        yield "footer", explanation
+        
+        yield None, {
+            "type": "location_query",
+            "confidence": 0.95,
+            "data": {
+                "location": location,
+                "coordinates": {"latitude": lat, "longitude": lon},
+                "probability": prob,
+                "risk_level": risk,
+                "weather": weather,
+                "shap_explanation": shap_explanation,
+                "status": "success"
+            }
+        }
     
     def _is_decision_query(self, query: str) -> bool:
         """Detect if user is asking for decisions/actions"""
-        decision_keywords = [
-            "should i evacuate", "should we evacuate", "tell me what to do",
-            "what action", "what should i do", "what should we do",
-            "allocate", "deploy", "command", "order", "authorize"
-        ]
-        return any(keyword in query for keyword in decision_keywords)
+        return router.is_decision_query(query)
     
     def _get_safety_disclaimer(self) -> str:
         """Return safety disclaimer for inappropriate queries"""
@@ -720,21 +742,26 @@ How can I help you understand the flood predictions today?
             "confidence": 0.6
         }
     
-    def get_conversation_history(self) -> List[Dict]:
-        """Return conversation history"""
-        return self.conversation_history
+    def get_conversation_history(self, session_id: str = DEFAULT_SESSION,
+                                 offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """Return one page of a session's conversation history (latest first page)"""
+        return self.sessions.page(session_id, offset, limit)
     
-    def clear_history(self):
-        """Clear conversation history"""
-        self.conversation_history = []
+    def clear_history(self, session_id: str = DEFAULT_SESSION):
+        """Clear a session's conversation history"""
+        self.sessions.clear(session_id)
 
 
 # Global chatbot instance
 _chatbot_instance = None
 
+# Directory where idle/evicted chat sessions are saved and reloaded from
+# (FLOOD_CHAT_HISTORY_DIR; unset keeps history in memory only)
+CHAT_HISTORY_DIR: Optional[str] = os.environ.get("FLOOD_CHAT_HISTORY_DIR") or None
+
 def get_chatbot() -> FloodInsightChatbot:
     """Get or create global chatbot instance"""
     global _chatbot_instance
     if _chatbot_instance is None:
-        _chatbot_instance = FloodInsightChatbot()
+        _chatbot_instance = FloodInsightChatbot(ChatSessionStore(persist_dir=CHAT_HISTORY_DIR))
     return _chatbot_instance
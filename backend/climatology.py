@@ -0,0 +1,140 @@
+"""
+Climatology Module
+Day-of-year climatological means used to derive rain_anomaly / temp_anomaly.
+
+An offline build step reduces one or more NASA POWER daily exports to a
+compact artifact (climatology.npz) holding, for every source grid cell, the
+mean PRECTOTCORR and T2M of each day of year - the same climatology the
+training notebook computes. At request time the artifact is loaded once and
+anomalies are looked up in O(1) with vectorized batch lookups.
+
+Build:
+    python climatology.py build ["../nasa(India).csv" ...] [-o climatology.npz]
+"""
+import argparse
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CLIMATOLOGY_PATH = Path(__file__).parent / "climatology.npz"
+DAYS_IN_YEAR = 366
+
+_climatology: Optional[Dict[str, np.ndarray]] = None
+_load_lock = threading.Lock()
+_load_failed = False
+
+
+def build_climatology(paths: Sequence) -> Dict[str, np.ndarray]:
+    """
+    Compute per-cell, per-day-of-year means from NASA POWER exports.
+    Each file is one grid cell, located by its header coordinates.
+
+    Returns:
+        {"lat": (n,), "lon": (n,), "rain": (n, 366), "temp": (n, 366)}
+    """
+    from nasa_power import load_nasa_power_csv
+
+    lats, lons, rains, temps = [], [], [], []
+    for path in paths:
+        df = load_nasa_power_csv(path)
+        if "latitude" not in df.attrs:
+            raise ValueError(f"No site location found in header of {path}")
+        by_doy = df.groupby(df.index.dayofyear)[["PRECTOTCORR", "T2M"]].mean()
+        by_doy = by_doy.reindex(range(1, DAYS_IN_YEAR + 1))
+        # Day 366 only exists in leap years; fall back to day 365 if absent
+        by_doy = by_doy.ffill().bfill()
+
+        lats.append(df.attrs["latitude"])
+        lons.append(df.attrs["longitude"])
+        rains.append(by_doy["PRECTOTCORR"].to_numpy())
+        temps.append(by_doy["T2M"].to_numpy())
+
+    return {
+        "lat": np.asarray(lats, dtype=np.float64),
+        "lon": np.asarray(lons, dtype=np.float64),
+        "rain": np.asarray(rains, dtype=np.float32),
+        "temp": np.asarray(temps, dtype=np.float32)
+    }
+
+
+def save_climatology(table: Dict[str, np.ndarray], path=CLIMATOLOGY_PATH):
+    np.savez_compressed(path, **table)
+
+
+def load_climatology(path=CLIMATOLOGY_PATH) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Load the artifact once per process. Returns None (and logs a warning
+    once) when it is missing, in which case anomalies fall back to 0.0.
+    """
+    global _climatology, _load_failed
+    if _climatology is not None or _load_failed:
+        return _climatology
+    with _load_lock:
+        if _climatology is None and not _load_failed:
+            try:
+                with np.load(path) as data:
+                    _climatology = {key: data[key] for key in data.files}
+                logger.info("Loaded climatology for %d grid cell(s) from %s", len(_climatology["lat"]), path)
+            except Exception as e:
+                _load_failed = True
+                logger.warning("Climatology unavailable (%s); anomalies default to 0.0", e)
+    return _climatology
+
+
+def lookup(doy, lat=None, lon=None):
+    """
+    Climatological (rain, temp) means for day(s) of year, vectorized.
+
+    Args:
+        doy: Day of year (1-366), scalar or array
+        lat, lon: Location(s) used to pick the nearest grid cell; when omitted
+            the first cell is used
+
+    Returns:
+        (rain_clim, temp_clim) arrays broadcast to the input shape, or None
+        if no climatology is available
+    """
+    table = load_climatology()
+    if table is None:
+        return None
+
+    doy = np.asarray(doy, dtype=np.int64)
+    day_index = np.clip(doy, 1, DAYS_IN_YEAR) - 1
+
+    if lat is None or lon is None:
+        cell = np.zeros_like(day_index)
+    else:
+        lat, lon, day_index = np.broadcast_arrays(np.asarray(lat, dtype=np.float64),
+                                                  np.asarray(lon, dtype=np.float64), day_index)
+        if len(table["lat"]) == 1:
+            cell = np.zeros_like(day_index)
+        else:
+            d2 = ((lat[..., None] - table["lat"]) ** 2 +
+                  ((lon[..., None] - table["lon"]) * np.cos(np.radians(lat[..., None]))) ** 2)
+            cell = np.argmin(d2, axis=-1)
+
+    return table["rain"][cell, day_index], table["temp"][cell, day_index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the day-of-year climatology artifact")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build climatology.npz from NASA POWER daily exports")
+    build.add_argument("csv", nargs="*", help="NASA POWER CSV exports (one per grid cell)")
+    build.add_argument("-o", "--output", default=str(CLIMATOLOGY_PATH), help="Output .npz path")
+    args = parser.parse_args(argv)
+
+    from nasa_power import NASA_CSV_PATH
+    paths = args.csv or [NASA_CSV_PATH]
+    table = build_climatology(paths)
+    save_climatology(table, args.output)
+    print(f"Wrote climatology for {len(table['lat'])} cell(s) x {DAYS_IN_YEAR} days to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
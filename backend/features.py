@@ -0,0 +1,69 @@
+"""
+Features Module
+Builds model feature rows in training order for every serving path.
+
+ORDER MUST MATCH TRAINING:
+T2M, T2M_MAX, T2M_MIN, PS, PRECTOTCORR, RH2M, WS2M, rain_anomaly, temp_anomaly
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import climatology
+
+FEATURE_NAMES = ['T2M', 'T2M_MAX', 'T2M_MIN', 'PS', 'PRECTOTCORR', 'RH2M', 'WS2M', 'rain_anomaly', 'temp_anomaly']
+
+T2M_INDEX = FEATURE_NAMES.index("T2M")
+RAIN_INDEX = FEATURE_NAMES.index("PRECTOTCORR")
+RAIN_ANOMALY_INDEX = FEATURE_NAMES.index("rain_anomaly")
+TEMP_ANOMALY_INDEX = FEATURE_NAMES.index("temp_anomaly")
+
+
+def day_of_year(when: Optional[datetime] = None) -> int:
+    return (when or datetime.now()).timetuple().tm_yday
+
+
+def days_of_year(times: Sequence[str]) -> np.ndarray:
+    """Day of year for ISO date / datetime strings ("YYYY-MM-DD[THH:MM]")."""
+    dates = np.array([t[:10] for t in times], dtype="datetime64[D]")
+    years = dates.astype("datetime64[Y]")
+    return (dates - years).astype(np.int64) + 1
+
+
+def live_feature_row(weather: Dict) -> List[float]:
+    """Model feature row for a current-weather observation (anomalies 0.0)."""
+    return [
+        weather["temperature"],            # T2M
+        weather["temperature"] + 2,        # T2M_MAX
+        weather["temperature"] - 2,        # T2M_MIN
+        weather["pressure"],               # PS
+        weather["rainfall"],               # PRECTOTCORR
+        weather["humidity"],               # RH2M
+        weather["wind_speed"],             # WS2M
+        0.0,                               # rain_anomaly
+        0.0                                # temp_anomaly
+    ]
+
+
+def add_anomalies(features: np.ndarray, doy, lat=None, lon=None) -> np.ndarray:
+    """
+    Fill the rain_anomaly / temp_anomaly columns of a feature matrix in place
+    from the precomputed day-of-year climatology (vectorized over rows).
+    `doy`, `lat` and `lon` may be scalars or per-row arrays. Leaves the
+    columns untouched when no climatology artifact is available.
+    """
+    clim = climatology.lookup(doy, lat, lon)
+    if clim is None:
+        return features
+    rain_clim, temp_clim = clim
+    features[:, RAIN_ANOMALY_INDEX] = features[:, RAIN_INDEX] - rain_clim
+    features[:, TEMP_ANOMALY_INDEX] = features[:, T2M_INDEX] - temp_clim
+    return features
+
+
+def live_features(weather: Dict, lat: float = None, lon: float = None,
+                  when: Optional[datetime] = None) -> np.ndarray:
+    """(1, 9) feature matrix for a live observation, including anomalies."""
+    features = np.array([live_feature_row(weather)], dtype=np.float64)
+    return add_anomalies(features, day_of_year(when), lat, lon)
@@ -0,0 +1,300 @@
+"""
+Forecast Engine Module
+Fetches multi-day Open-Meteo forecasts and scores the whole horizon in one
+batched model call.
+
+Up to 16 days of daily or hourly data (including the real humidity series)
+are fetched in a single upstream request. Responses are cached per location
+and upstream model-run window, so repeated requests between model runs never
+reach Open-Meteo again. The `_async` variants fetch through the shared
+async client and score on the model executor, for the async handlers.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from cache import LRUCache
+from http_client import get_json
+from model_loader import predict_batch
+from inference_pool import inference_pool, run_model
+from metrics import upstream
+from features import add_anomalies, days_of_year
+
+logger = logging.getLogger(__name__)
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+MAX_FORECAST_DAYS = 16
+RESOLUTIONS = ("daily", "hourly")
+
+# Open-Meteo refreshes its blended forecast roughly hourly; cache entries are
+# keyed on this window so a new model run is picked up on the next request.
+FORECAST_REFRESH_SECONDS = 3600
+
+DAILY_VARIABLES = [
+    "temperature_2m_mean", "temperature_2m_max", "temperature_2m_min",
+    "pressure_msl_mean", "precipitation_sum", "relative_humidity_2m_mean",
+    "wind_speed_10m_max"
+]
+HOURLY_VARIABLES = [
+    "temperature_2m", "pressure_msl", "precipitation",
+    "relative_humidity_2m", "wind_speed_10m"
+]
+
+forecast_cache = LRUCache(maxsize=2048, ttl=FORECAST_REFRESH_SECONDS, name="forecasts")
+
+# Locations per multi-location upstream request, and concurrent requests
+MULTI_LOCATION_BATCH = 50
+MAX_PARALLEL_REQUESTS = 8
+
+# Pooled connections for upstream calls
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=MAX_PARALLEL_REQUESTS))
+
+
+def forecast_run_version(now: float = None) -> int:
+    """Id of the current upstream model-run window."""
+    now = time.time() if now is None else now
+    return int(now // FORECAST_REFRESH_SECONDS)
+
+
+def validate_horizon(days: int, resolution: str):
+    if not 1 <= days <= MAX_FORECAST_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_FORECAST_DAYS}")
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {RESOLUTIONS}")
+
+
+def forecast_params(days: int, resolution: str) -> Dict[str, Any]:
+    """Open-Meteo query parameters for a horizon (location excluded)."""
+    variables = DAILY_VARIABLES if resolution == "daily" else HOURLY_VARIABLES
+    return {resolution: ",".join(variables), "forecast_days": days, "timezone": "auto"}
+
+
+def _fetch_block(lat: float, lon: float, days: int, resolution: str) -> Dict[str, List]:
+    params = {"latitude": lat, "longitude": lon, **forecast_params(days, resolution)}
+    with upstream("forecast"):
+        response = _session.get(FORECAST_URL, params=params, timeout=10)
+        response.raise_for_status()
+        return response.json()[resolution]
+
+
+async def _fetch_block_async(lat: float, lon: float, days: int, resolution: str) -> Dict[str, List]:
+    params = {"latitude": lat, "longitude": lon, **forecast_params(days, resolution)}
+    with upstream("forecast"):
+        return (await get_json(FORECAST_URL, params, timeout=10))[resolution]
+
+
+def _cache_key(lat: float, lon: float, days: int, resolution: str, version: int) -> tuple:
+    return (round(lat, 4), round(lon, 4), days, resolution, version)
+
+
+def fetch_forecast(lat: float, lon: float, days: int = 3, resolution: str = "daily") -> Dict[str, List]:
+    """
+    Fetch the daily or hourly forecast block for a location (cached per
+    location and model-run window).
+    """
+    validate_horizon(days, resolution)
+    key = _cache_key(lat, lon, days, resolution, forecast_run_version())
+    return forecast_cache.get_or_compute(key, lambda: _fetch_block(lat, lon, days, resolution))
+
+
+async def fetch_forecast_async(lat: float, lon: float, days: int = 3,
+                               resolution: str = "daily") -> Dict[str, List]:
+    validate_horizon(days, resolution)
+    key = _cache_key(lat, lon, days, resolution, forecast_run_version())
+    return await forecast_cache.aget_or_compute(key, lambda: _fetch_block_async(lat, lon, days, resolution))
+
+
+def _fetch_blocks_multi(coords: List[Tuple[float, float]], days: int, resolution: str) -> List[Dict[str, List]]:
+    """One upstream request for several locations (Open-Meteo accepts comma-separated lists)."""
+    params = {
+        "latitude": ",".join(f"{lat:.4f}" for lat, _ in coords),
+        "longitude": ",".join(f"{lon:.4f}" for _, lon in coords),
+        **forecast_params(days, resolution)
+    }
+    with upstream("forecast"):
+        response = _session.get(FORECAST_URL, params=params, timeout=30)
+        response.raise_for_status()
+        payload = response.json()
+    if isinstance(payload, dict):
+        payload = [payload]
+    return [item[resolution] for item in payload]
+
+
+def fetch_forecasts(coords: List[Tuple[float, float]], days: int = 3,
+                    resolution: str = "daily") -> List[Optional[Dict[str, List]]]:
+    """
+    Fetch forecast blocks for many locations.
+
+    Cached locations are served from the forecast cache. The rest are grouped
+    into multi-location requests of MULTI_LOCATION_BATCH sites, issued
+    concurrently over a pooled session. A failed batch yields None for its sites.
+    """
+    validate_horizon(days, resolution)
+    version = forecast_run_version()
+    blocks: List[Optional[Dict[str, List]]] = [None] * len(coords)
+    missing = []
+    for i, (lat, lon) in enumerate(coords):
+        block = forecast_cache.get(_cache_key(lat, lon, days, resolution, version))
+        if block is None:
+            missing.append(i)
+        else:
+            blocks[i] = block
+
+    batches = [missing[k:k + MULTI_LOCATION_BATCH] for k in range(0, len(missing), MULTI_LOCATION_BATCH)]
+
+    def fetch_batch(batch: List[int]):
+        try:
+            return batch, _fetch_blocks_multi([coords[i] for i in batch], days, resolution)
+        except Exception as e:
+            logger.warning("Multi-location forecast batch of %d sites failed: %s", len(batch), e)
+            return batch, None
+
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_REQUESTS, len(batches))) as pool:
+            for batch, results in pool.map(fetch_batch, batches):
+                if results is None:
+                    continue
+                for i, block in zip(batch, results):
+                    lat, lon = coords[i]
+                    forecast_cache.set(_cache_key(lat, lon, days, resolution, version), block)
+                    blocks[i] = block
+    return blocks
+
+
+def _column(block: Dict[str, List], name: str) -> np.ndarray:
+    """Series as float array; missing upstream values become NaN."""
+    return np.array(block.get(name) or [np.nan] * len(block["time"]), dtype=np.float64)
+
+
+def daily_feature_matrix(block: Dict[str, List]) -> Tuple[List[str], np.ndarray]:
+    """Model feature rows (training order) for a daily forecast block."""
+    t_max = _column(block, "temperature_2m_max")
+    t_min = _column(block, "temperature_2m_min")
+    t_mean = _column(block, "temperature_2m_mean")
+    t_mean = np.where(np.isnan(t_mean), (t_max + t_min) / 2, t_mean)
+    zeros = np.zeros(len(block["time"]))
+
+    features = np.column_stack([
+        t_mean,                                          # T2M
+        t_max,                                           # T2M_MAX
+        t_min,                                           # T2M_MIN
+        _column(block, "pressure_msl_mean"),             # PS
+        _column(block, "precipitation_sum"),             # PRECTOTCORR
+        _column(block, "relative_humidity_2m_mean"),     # RH2M
+        _column(block, "wind_speed_10m_max"),            # WS2M
+        zeros,                                           # rain_anomaly (see add_anomalies)
+        zeros                                            # temp_anomaly
+    ])
+    return list(block["time"]), features
+
+
+def hourly_feature_matrix(block: Dict[str, List]) -> Tuple[List[str], np.ndarray]:
+    """
+    Model feature rows for an hourly forecast block.
+
+    The model was trained on daily values, so each hour is described with
+    daily-equivalent quantities: T2M_MAX/T2M_MIN are the extremes of that
+    hour's calendar day and PRECTOTCORR is the trailing 24-hour rainfall total.
+    """
+    times = list(block["time"])
+    temp = _column(block, "temperature_2m")
+    precip = np.nan_to_num(_column(block, "precipitation"))
+
+    # Calendar-day extremes (times are "YYYY-MM-DDTHH:MM")
+    _, day_index = np.unique([t[:10] for t in times], return_inverse=True)
+    n_days = day_index.max() + 1 if len(times) else 0
+    day_max = np.full(n_days, -np.inf)
+    day_min = np.full(n_days, np.inf)
+    np.fmax.at(day_max, day_index, temp)
+    np.fmin.at(day_min, day_index, temp)
+
+    # Trailing 24-hour rainfall sum
+    cumulative = np.concatenate([[0.0], np.cumsum(precip)])
+    idx = np.arange(len(times))
+    rain_24h = cumulative[idx + 1] - cumulative[np.maximum(idx + 1 - 24, 0)]
+    zeros = np.zeros(len(times))
+
+    features = np.column_stack([
+        temp,                                            # T2M
+        day_max[day_index],                              # T2M_MAX
+        day_min[day_index],                              # T2M_MIN
+        _column(block, "pressure_msl"),                  # PS
+        rain_24h,                                        # PRECTOTCORR
+        _column(block, "relative_humidity_2m"),          # RH2M
+        _column(block, "wind_speed_10m"),                # WS2M
+        zeros,                                           # rain_anomaly (see add_anomalies)
+        zeros                                            # temp_anomaly
+    ])
+    return times, features
+
+
+def feature_matrix(block: Dict[str, List], resolution: str) -> Tuple[List[str], np.ndarray]:
+    if resolution == "hourly":
+        return hourly_feature_matrix(block)
+    return daily_feature_matrix(block)
+
+
+def score_forecast(lat: float, lon: float, days: int = 3, resolution: str = "daily") -> Dict[str, Any]:
+    """
+    Fetch and score a forecast horizon with a single batched model call.
+
+    Returns:
+        {"times": [...], "probabilities": np.ndarray, "features": np.ndarray}
+    """
+    return _score_block(fetch_forecast(lat, lon, days, resolution), lat, lon, resolution)
+
+
+async def score_forecast_async(lat: float, lon: float, days: int = 3, resolution: str = "daily") -> Dict[str, Any]:
+    block = await fetch_forecast_async(lat, lon, days, resolution)
+    return await run_model(_score_block, block, lat, lon, resolution)
+
+
+def _score_block(block: Dict[str, List], lat: float, lon: float, resolution: str) -> Dict[str, Any]:
+    times, features = feature_matrix(block, resolution)
+    if times:
+        add_anomalies(features, days_of_year(times), lat, lon)
+    probabilities = predict_batch(features)
+    return {"times": times, "probabilities": probabilities, "features": features}
+
+
+def score_forecasts(coords: List[Tuple[float, float]], days: int = 3,
+                    resolution: str = "daily") -> Dict[str, Any]:
+    """
+    Score every site x time step of many locations in one model call.
+
+    Returns:
+        {"probabilities": (n_sites, n_steps) array with NaN rows for sites
+         without data, "starts": first time step per site (or None)}
+    """
+    blocks = fetch_forecasts(coords, days, resolution)
+    n_steps = days * (24 if resolution == "hourly" else 1)
+
+    matrices = []
+    rows = []
+    starts: List[Optional[str]] = []
+    for i, block in enumerate(blocks):
+        if block is None:
+            starts.append(None)
+            continue
+        times, features = feature_matrix(block, resolution)
+        times, features = times[:n_steps], features[:n_steps]
+        if times:
+            lat, lon = coords[i]
+            add_anomalies(features, days_of_year(times), lat, lon)
+        matrices.append(features)
+        rows.append((i, len(features)))
+        starts.append(times[0] if times else None)
+
+    probabilities = np.full((len(coords), n_steps), np.nan)
+    if matrices:
+        scored = inference_pool.predict(np.vstack(matrices))
+        offset = 0
+        for i, count in rows:
+            probabilities[i, :count] = scored[offset:offset + count]
+            offset += count
+    return {"probabilities": probabilities, "starts": starts}
@@ -0,0 +1,116 @@
+"""
+Heatmap Encoding Module
+Compact columnar encodings for regular heatmap grids.
+
+Instead of one {"lat", "lon", "intensity"} object per cell, a grid is described
+by the center of its first cell (origin), the step between cells and its shape,
+plus a packed row-major intensity array. Cell (i, j) is located at:
+
+    lat = origin.lat + i * step.lat
+    lon = origin.lon + j * step.lon
+"""
+import base64
+from typing import Optional, Dict, Any
+
+import numpy as np
+from fastapi.responses import Response
+
+# Supported packed value types
+# uint8:   intensity = value / 255 (1 byte per cell, ~0.004 resolution)
+# float16: little-endian IEEE half precision (2 bytes per cell)
+GRID_DTYPES = ("uint8", "float16")
+
+# Media types that select an encoding through the Accept header
+GRID_JSON_MEDIA_TYPE = "application/vnd.flood.grid+json"
+GRID_BINARY_MEDIA_TYPE = "application/octet-stream"
+
+# Response headers a browser client must be allowed to read (CORS)
+GRID_HEADERS = ["X-Grid-Origin", "X-Grid-Step", "X-Grid-Shape", "X-Grid-Dtype"]
+
+
+def resolve_encoding(format_param: Optional[str], accept: Optional[str]) -> str:
+    """
+    Decide which response encoding to use.
+
+    An explicit `format` query parameter wins over the Accept header.
+
+    Returns:
+        "points" (legacy JSON list), "grid" (JSON + base64) or "binary" (raw bytes)
+    """
+    if format_param:
+        return format_param
+    accept = (accept or "").lower()
+    if GRID_BINARY_MEDIA_TYPE in accept:
+        return "binary"
+    if GRID_JSON_MEDIA_TYPE in accept:
+        return "grid"
+    return "points"
+
+
+def pack_intensities(intensities: np.ndarray, dtype: str = "uint8") -> bytes:
+    """
+    Pack a 2D intensity array (values in 0-1) into row-major bytes.
+    """
+    values = np.clip(np.asarray(intensities, dtype=np.float32), 0.0, 1.0)
+    if dtype == "uint8":
+        packed = np.rint(values * 255.0).astype(np.uint8)
+    elif dtype == "float16":
+        packed = values.astype("<f2")
+    else:
+        raise ValueError(f"Unsupported grid dtype '{dtype}'. Use one of {GRID_DTYPES}")
+    return np.ascontiguousarray(packed).tobytes()
+
+
+def grid_metadata(intensities: np.ndarray, origin_lat: float, origin_lon: float,
+                  lat_step: float, lon_step: float, dtype: str = "uint8") -> Dict[str, Any]:
+    """Describe a grid so a client can rebuild every cell coordinate."""
+    rows, cols = np.shape(intensities)
+    return {
+        "origin": {"lat": float(origin_lat), "lon": float(origin_lon)},
+        "step": {"lat": float(lat_step), "lon": float(lon_step)},
+        "shape": [int(rows), int(cols)],
+        "dtype": dtype,
+        "scale": 1.0 / 255.0 if dtype == "uint8" else 1.0,
+        "order": "row-major"
+    }
+
+
+def encode_grid_json(intensities: np.ndarray, origin_lat: float, origin_lon: float,
+                     lat_step: float, lon_step: float, dtype: str = "uint8",
+                     extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the JSON grid payload with a base64 intensity array.
+    """
+    payload = dict(extra or {})
+    payload["encoding"] = "grid"
+    payload["grid"] = grid_metadata(intensities, origin_lat, origin_lon, lat_step, lon_step, dtype)
+    payload["data"] = base64.b64encode(pack_intensities(intensities, dtype)).decode("ascii")
+    return payload
+
+
+def encode_grid_binary(intensities: np.ndarray, origin_lat: float, origin_lon: float,
+                       lat_step: float, lon_step: float, dtype: str = "uint8") -> Response:
+    """
+    Build a raw binary response. Grid metadata travels in X-Grid-* headers.
+    """
+    meta = grid_metadata(intensities, origin_lat, origin_lon, lat_step, lon_step, dtype)
+    headers = {
+        "X-Grid-Origin": f"{meta['origin']['lat']},{meta['origin']['lon']}",
+        "X-Grid-Step": f"{meta['step']['lat']},{meta['step']['lon']}",
+        "X-Grid-Shape": f"{meta['shape'][0]},{meta['shape'][1]}",
+        "X-Grid-Dtype": dtype
+    }
+    return Response(
+        content=pack_intensities(intensities, dtype),
+        media_type=GRID_BINARY_MEDIA_TYPE,
+        headers=headers
+    )
+
+
+def encode_grid_response(encoding: str, intensities: np.ndarray, origin_lat: float, origin_lon: float,
+                         lat_step: float, lon_step: float, dtype: str = "uint8",
+                         extra: Optional[Dict[str, Any]] = None):
+    """Dispatch to the JSON/base64 or raw binary encoder."""
+    if encoding == "binary":
+        return encode_grid_binary(intensities, origin_lat, origin_lon, lat_step, lon_step, dtype)
+    return encode_grid_json(intensities, origin_lat, origin_lon, lat_step, lon_step, dtype, extra)
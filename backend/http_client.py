@@ -0,0 +1,51 @@
+"""
+HTTP Client Module
+Shared async HTTP client for upstream APIs (Open-Meteo) used by the async
+request handlers.
+
+One httpx.AsyncClient per event loop keeps connections pooled and reused
+across requests; waiting on upstream never holds a worker thread. The
+client is created on first use and closed at application shutdown.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """The pooled client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        )
+    return client
+
+
+async def get_json(url: str, params: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None) -> Any:
+    """GET a JSON document; raises httpx.HTTPStatusError on error responses."""
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    response = await get_client().get(url, params=params, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+async def aclose():
+    """Close the running loop's client (call at shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,212 @@
+"""
+Inference Pool Module
+Runs large model batches (XGBoost predict, TreeSHAP) in worker processes so
+CPU-bound scoring is not serialized behind the GIL of the API process.
+
+Workers are forked after the model is loaded, so they share it copy-on-write
+instead of loading their own copy (on platforms without fork they import
+model_loader themselves). A batch is written once into a shared-memory
+buffer, each worker scores a contiguous row slice in place and writes its
+output into a second shared buffer, so only buffer names and row offsets are
+pickled. Each worker runs XGBoost single-threaded; parallelism comes from the
+number of processes.
+
+Tasks carry the model version of the calling request; a worker loads a
+version activated after it was forked from its artifact on first use.
+
+Batches smaller than `min_parallel_rows` are scored in-process, where the
+dispatch overhead would outweigh the gain.
+
+Async request handlers hand their model work to `run_model`, which runs it
+on a dedicated thread pool (`model_executor`) in the caller's context (so
+pinned model versions carry over). That keeps CPU-bound scoring off the
+event loop without competing with the server's threadpool for threads.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+
+import model_loader
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_PARALLEL_ROWS = 4096
+# SHAP is ~100x more expensive per row than predict, so it pays off sooner
+DEFAULT_MIN_PARALLEL_SHAP_ROWS = 64
+
+
+# ---------------- worker side ----------------
+
+def _init_worker():
+    # One XGBoost thread per process; the pool provides the parallelism.
+    # Versions loaded later in this worker get the same setting.
+    model_loader.registry.set_n_jobs(1)
+
+
+def _ping(_=None) -> int:
+    return os.getpid()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to a parent-owned segment without registering it for cleanup here."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attaching registers the segment with the resource
+        # tracker, which would then report (or unlink) it as leaked
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _run_slice(op: str, version: str, model_path: str, in_name: str, out_name: str,
+               shape: Tuple[int, int], start: int, stop: int) -> float:
+    """
+    Score rows [start, stop) of the shared input into the shared output with
+    the given model version, loading it first if it was activated after this
+    worker was forked.
+    """
+    registry = model_loader.registry
+    mv = registry.get_or_load(version, model_path)
+    shm_in, shm_out = _attach(in_name), _attach(out_name)
+    try:
+        with registry.pinned(mv):
+            return _score_slice(op, shm_in, shm_out, shape, start, stop)
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+def _score_slice(op, shm_in, shm_out, shape, start, stop) -> float:
+    features = np.ndarray(shape, dtype=np.float32, buffer=shm_in.buf)
+    if op == "predict":
+        out = np.ndarray((shape[0],), dtype=np.float64, buffer=shm_out.buf)
+        out[start:stop] = model_loader.predict_batch(features[start:stop])
+        base_value = 0.0
+    else:
+        out = np.ndarray(shape, dtype=np.float64, buffer=shm_out.buf)
+        out[start:stop], base_value = model_loader.shap_values_batch(features[start:stop])
+    # Release the buffer views before the segments are closed
+    del features, out
+    return base_value
+
+
+# ---------------- parent side ----------------
+
+class InferencePool:
+    """
+    Process pool for batched inference over shared-memory buffers.
+
+    Args:
+        processes: Worker processes (default: CPU count; 0 or 1 disables the pool)
+        min_parallel_rows: Smallest predict batch dispatched to the pool
+        min_parallel_shap_rows: Smallest SHAP batch dispatched to the pool
+    """
+
+    def __init__(self, processes: Optional[int] = None,
+                 min_parallel_rows: int = DEFAULT_MIN_PARALLEL_ROWS,
+                 min_parallel_shap_rows: int = DEFAULT_MIN_PARALLEL_SHAP_ROWS):
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.min_parallel_rows = min_parallel_rows
+        self.min_parallel_shap_rows = min_parallel_shap_rows
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 1
+
+    def start(self):
+        """
+        Create the workers now. Call at startup, before the server spawns
+        threads, so forked children copy a quiet process.
+        """
+        if not self.enabled or self._executor is not None:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=mp.get_context(method),
+                initializer=_init_worker
+            )
+            # With fork all workers start on first submit; wait until they are up
+            pids = set(self._executor.map(_ping, range(self.processes)))
+            logger.info("Inference pool started: %d %s workers", len(pids), method)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def _dispatch(self, op: str, arr: np.ndarray, out_shape: Tuple[int, ...]) -> Tuple[np.ndarray, float]:
+        self.start()
+        mv = model_loader.registry.current()
+        n_rows = arr.shape[0]
+        shm_in = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        shm_out = shared_memory.SharedMemory(create=True, size=max(int(np.prod(out_shape)) * 8, 1))
+        try:
+            np.ndarray(arr.shape, dtype=np.float32, buffer=shm_in.buf)[:] = arr
+            bounds = np.linspace(0, n_rows, min(self.processes, n_rows) + 1).astype(int)
+            futures = [
+                self._executor.submit(_run_slice, op, mv.version, mv.path, shm_in.name, shm_out.name,
+                                      arr.shape, start, stop)
+                for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+            ]
+            base_values = [future.result() for future in futures]
+            out = np.ndarray(out_shape, dtype=np.float64, buffer=shm_out.buf).copy()
+            return out, base_values[0] if base_values else 0.0
+        finally:
+            for shm in (shm_in, shm_out):
+                shm.close()
+                shm.unlink()
+
+    def predict(self, features) -> np.ndarray:
+        """Positive-class probabilities, same contract as model_loader.predict_batch."""
+        arr = np.ascontiguousarray(features, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if not self.enabled or arr.shape[0] < self.min_parallel_rows:
+            return model_loader.predict_batch(arr)
+        # Worker processes keep their own metrics; time the whole dispatch here
+        with stage("predict"):
+            return self._dispatch("predict", arr, (arr.shape[0],))[0]
+
+    def shap_values(self, features) -> Tuple[np.ndarray, float]:
+        """SHAP values, same contract as model_loader.shap_values_batch."""
+        arr = np.ascontiguousarray(features, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if not self.enabled or arr.shape[0] < self.min_parallel_shap_rows:
+            return model_loader.shap_values_batch(arr)
+        with stage("shap"):
+            return self._dispatch("shap", arr, arr.shape)
+
+
+inference_pool = InferencePool()
+
+
+# Sized to the cores (XGBoost and SHAP release the GIL); at least two so a
+# slow SHAP explanation never holds up a single-row prediction
+model_executor = ThreadPoolExecutor(max_workers=max(2, os.cpu_count() or 1), thread_name_prefix="model")
+
+
+async def run_model(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run CPU-bound model work on the model executor from async code."""
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(model_executor, call)
@@ -0,0 +1,340 @@
+"""
+Job Queue Module
+In-process job subsystem for long-running work (all-city scans, backtests,
+large heatmaps, parameter sweeps) that does not fit in a request/response.
+
+Work is submitted by kind with JSON parameters and a priority, and gets a job
+id back. A bounded pool of worker threads runs jobs in priority order (lower
+number first, FIFO within a priority). Job functions receive a JobContext to
+report progress and to observe cancellation, and run in a copy of the
+submitter's context (so a job keeps the model version its request was pinned
+to). Finished jobs keep their result until it expires. Everything lives in
+process memory; no external broker.
+"""
+import asyncio
+import contextvars
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+DEFAULT_PRIORITY = 5
+
+
+def _wake(future: "asyncio.Future"):
+    if not future.done():
+        future.set_result(None)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when its job has been cancelled."""
+
+
+class QueueFull(Exception):
+    """Raised on submit when the pending-job limit is reached."""
+
+
+class Job:
+    """State of one submitted job."""
+
+    def __init__(self, kind: str, params: Dict[str, Any], priority: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.status = QUEUED
+        self.done = 0
+        self.total: Optional[int] = None
+        self.message: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Bumped on every state or progress change, for long-poll subscribers
+        self.version = 0
+        self._cancel = threading.Event()
+        # Submitter's context (e.g. the model version pinned for its request)
+        self._context = contextvars.copy_context()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total, "message": self.message},
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "version": self.version
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobContext:
+    """Handle passed to job functions for progress reporting and cancellation."""
+
+    def __init__(self, job: Job, queue: "JobQueue"):
+        self._job = job
+        self._queue = queue
+
+    @property
+    def cancelled(self) -> bool:
+        return self._job._cancel.is_set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled; call between work units."""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def report(self, done: int, total: Optional[int] = None, message: Optional[str] = None):
+        """Record progress and wake subscribers."""
+        with self._queue._cond:
+            self._job.done = done
+            if total is not None:
+                self._job.total = total
+            if message is not None:
+                self._job.message = message
+            self._job.version += 1
+            self._queue._changed()
+
+
+class JobQueue:
+    """
+    Priority job queue with a bounded local worker pool.
+
+    Args:
+        workers: Worker threads (started on first submit)
+        max_pending: Maximum queued (not yet running) jobs
+        result_ttl: Seconds a finished job and its result are kept
+        max_retained: Maximum finished jobs kept regardless of TTL
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 100,
+                 result_ttl: float = 3600, max_retained: int = 500):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.max_retained = max_retained
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # (loop, future) of wait_async callers, woken on the next job change
+        self._async_waiters: List[tuple] = []
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    # ---------------- registration / submission ----------------
+
+    def register(self, kind: str, fn: Callable[..., Any]):
+        """Register `fn(ctx, **params)` as the handler for a job kind."""
+        self._handlers[kind] = fn
+
+    @property
+    def kinds(self) -> List[str]:
+        return sorted(self._handlers)
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None,
+               priority: int = DEFAULT_PRIORITY) -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'. Available: {', '.join(self.kinds)}")
+        try:
+            inspect.signature(self._handlers[kind]).bind(None, **(params or {}))
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for '{kind}' job: {e}")
+        with self._cond:
+            self._purge_expired()
+            pending = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            if pending >= self.max_pending:
+                raise QueueFull(f"Job queue is full ({self.max_pending} pending jobs)")
+            job = Job(kind, dict(params or {}), priority)
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self._ensure_workers()
+            self._cond.notify_all()
+        logger.info("Queued job %s (%s, priority %d)", job.id, kind, priority)
+        return job
+
+    # ---------------- inspection / control ----------------
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._cond:
+            self._purge_expired()
+            return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job. Queued jobs are cancelled immediately; running jobs stop
+        at their next check_cancelled(). Finished jobs are left unchanged.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job._cancel.set()
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+            return job
+
+    def wait(self, job_id: str, since_version: int = -1, timeout: float = 15.0) -> Optional[Job]:
+        """
+        Block until the job's version exceeds `since_version`, it finishes, or
+        the timeout passes. Returns the job (None if unknown or expired).
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job.version > since_version or job.finished:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job
+                self._cond.wait(remaining)
+
+    async def wait_async(self, job_id: str, since_version: int = -1, timeout: float = 15.0) -> Optional[Job]:
+        """wait() for async callers: awaits the next job change without holding a thread."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None or job.version > since_version or job.finished:
+                    return job
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return job
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if (loop, future) in self._async_waiters:
+                        self._async_waiters.remove((loop, future))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            counts = {state: 0 for state in (QUEUED, RUNNING) + TERMINAL_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {"workers": self.workers, "max_pending": self.max_pending, "jobs": counts}
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop workers after their current job; queued jobs stay queued."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    # ---------------- internals ----------------
+
+    def _ensure_workers(self):
+        """Start worker threads on first use. Caller must hold the lock."""
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None):
+        """Move a job to a terminal state. Caller must hold the lock."""
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.version += 1
+        self._changed()
+
+    def _changed(self):
+        """Wake sync and async waiters after a job changed. Caller must hold the lock."""
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # the waiter's event loop has been closed
+
+    def _purge_expired(self):
+        """Drop expired finished jobs and enforce max_retained. Caller must hold the lock."""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished:
+            if now - job.finished_at > self.result_ttl:
+                del self._jobs[job.id]
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.max_retained)]:
+            del self._jobs[job.id]
+
+    def _next_job(self) -> Optional[Job]:
+        with self._cond:
+            while not self._stopping:
+                while self._heap:
+                    _, _, job = heapq.heappop(self._heap)
+                    if job.status == QUEUED:
+                        job.status = RUNNING
+                        job.started_at = time.time()
+                        job.version += 1
+                        self._changed()
+                        return job
+                self._cond.wait()
+            return None
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            ctx = JobContext(job, self)
+            try:
+                result = job._context.run(self._handlers[job.kind], ctx, **job.params)
+                ctx.check_cancelled()
+            except JobCancelled:
+                with self._cond:
+                    self._finish(job, CANCELLED)
+                logger.info("Job %s cancelled", job.id)
+            except ValueError as e:
+                # Bad parameters caught by the job itself; no traceback needed
+                logger.warning("Job %s (%s) rejected: %s", job.id, job.kind, e)
+                with self._cond:
+                    self._finish(job, FAILED, error=str(e))
+            except Exception as e:
+                logger.exception("Job %s (%s) failed: %s", job.id, job.kind, e)
+                with self._cond:
+                    self._finish(job, FAILED, error=str(e))
+            else:
+                with self._cond:
+                    self._finish(job, SUCCEEDED, result=result)
+                logger.info("Job %s (%s) finished in %.2fs", job.id, job.kind, job.finished_at - job.started_at)
@@ -0,0 +1,239 @@
+"""
+Location Service Module
+Cached geocoding, live weather and live flood-risk assessment, shared by the
+API endpoints, the multi-city view and the chatbot.
+
+Each layer is an LRUCache with request coalescing: concurrent lookups of the
+same place or grid point share one upstream call, and repeated lookups
+within the TTL are served from memory. Live weather, predictions and SHAP
+explanations follow the Open-Meteo "current" refresh interval. Predictions
+and their SHAP explanations are cached separately (so a caller can show the
+risk before SHAP is done) and keyed on the model version, so a model swap
+never serves another model's scores.
+
+Every lookup has an `_async` twin for the async request handlers: upstream
+calls go through the shared async client (http_client) and model work runs
+on the model executor, so a slow upstream never holds a worker thread. Both
+flavours share the same caches and coalesce with each other.
+"""
+import logging
+import re
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+from cache import LRUCache
+from features import live_features
+from http_client import get_json
+from inference_pool import run_model
+from metrics import upstream
+from model_loader import explain_instance_shap, get_model_version, predict
+from structured_logging import SampledLog
+from tile_service import WEATHER_SNAPSHOT_SECONDS
+
+logger = logging.getLogger(__name__)
+# Heatmaps explain many points: one failing explainer must not flood the log
+_shap_failure_log = SampledLog(logger, per_second=1)
+
+GEOCODE_URL = "https://geocoding-api.open-meteo.com/v1/search"
+WEATHER_URL = "https://api.open-meteo.com/v1/forecast"
+REQUEST_TIMEOUT = 10
+
+# Place names rarely move; coordinates change with every weather refresh
+GEOCODE_TTL = 24 * 3600
+# Grid points closer than ~100 m share a weather lookup
+COORD_DECIMALS = 3
+
+geocode_cache = LRUCache(maxsize=4096, ttl=GEOCODE_TTL, name="geocode")
+weather_cache = LRUCache(maxsize=8192, ttl=WEATHER_SNAPSHOT_SECONDS, name="live_weather")
+prediction_cache = LRUCache(maxsize=4096, ttl=WEATHER_SNAPSHOT_SECONDS, name="live_predictions")
+shap_cache = LRUCache(maxsize=4096, ttl=WEATHER_SNAPSHOT_SECONDS, name="live_shap")
+
+_COORD_RE = re.compile(r"^-?\d+\.?\d*\s*,\s*-?\d+\.?\d*$")
+
+
+def classify_risk(probability: float) -> str:
+    if probability < 0.25:
+        return "Low"
+    elif probability < 0.50:
+        return "Moderate"
+    elif probability < 0.75:
+        return "High"
+    else:
+        return "Critical"
+
+
+def parse_coordinates(place: str) -> Optional[Tuple[float, float]]:
+    """(lat, lon) if `place` is a valid "lat,lon" string, else None."""
+    if not _COORD_RE.match(place.strip()):
+        return None
+    try:
+        lat, lon = (float(p) for p in place.split(","))
+    except ValueError:
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def _geocode_params(name: str) -> Dict[str, Any]:
+    return {"name": name, "count": 1, "language": "en"}
+
+
+def _parse_geocode(data: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    results = data.get("results")
+    if not results:
+        return None
+    return results[0]["latitude"], results[0]["longitude"]
+
+
+def _geocode(name: str) -> Optional[Tuple[float, float]]:
+    with upstream("geocode"):
+        response = requests.get(GEOCODE_URL, params=_geocode_params(name), timeout=REQUEST_TIMEOUT)
+        # An error body has no "results": raise rather than cache it as "not found"
+        response.raise_for_status()
+        return _parse_geocode(response.json())
+
+
+async def _geocode_async(name: str) -> Optional[Tuple[float, float]]:
+    with upstream("geocode"):
+        return _parse_geocode(await get_json(GEOCODE_URL, _geocode_params(name), REQUEST_TIMEOUT))
+
+
+def _place_key(place: str) -> str:
+    return " ".join(place.split()).lower()
+
+
+def get_lat_lon(place: str) -> Optional[Tuple[float, float]]:
+    """
+    Latitude and longitude of a place name or "lat,lon" string (None if not
+    found). Geocoding results, including misses, are cached per name.
+    """
+    coords = parse_coordinates(place)
+    if coords is not None:
+        return coords
+    name = _place_key(place)
+    return geocode_cache.get_or_compute(name, lambda: _geocode(name))
+
+
+async def get_lat_lon_async(place: str) -> Optional[Tuple[float, float]]:
+    coords = parse_coordinates(place)
+    if coords is not None:
+        return coords
+    name = _place_key(place)
+    return await geocode_cache.aget_or_compute(name, lambda: _geocode_async(name))
+
+
+def _weather_params(lat: float, lon: float) -> Dict[str, Any]:
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "current": "temperature_2m,relative_humidity_2m,pressure_msl,wind_speed_10m,precipitation"
+    }
+
+
+def _parse_weather(data: Dict[str, Any]) -> Dict[str, float]:
+    data = data["current"]
+    return {
+        "temperature": data["temperature_2m"],
+        "humidity": data["relative_humidity_2m"],
+        "pressure": data["pressure_msl"],
+        "wind_speed": data["wind_speed_10m"],
+        "rainfall": data["precipitation"]
+    }
+
+
+def _fetch_weather(lat: float, lon: float) -> Dict[str, float]:
+    with upstream("weather"):
+        response = requests.get(WEATHER_URL, params=_weather_params(lat, lon), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return _parse_weather(response.json())
+
+
+async def _fetch_weather_async(lat: float, lon: float) -> Dict[str, float]:
+    with upstream("weather"):
+        return _parse_weather(await get_json(WEATHER_URL, _weather_params(lat, lon), REQUEST_TIMEOUT))
+
+
+def fetch_live_weather(lat: float, lon: float) -> Dict[str, float]:
+    """Current weather at a point (cached until the next upstream refresh)."""
+    lat, lon = round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS)
+    return dict(weather_cache.get_or_compute((lat, lon), lambda: _fetch_weather(lat, lon)))
+
+
+async def fetch_live_weather_async(lat: float, lon: float) -> Dict[str, float]:
+    lat, lon = round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS)
+    return dict(await weather_cache.aget_or_compute((lat, lon), lambda: _fetch_weather_async(lat, lon)))
+
+
+def _point_key(lat: float, lon: float) -> tuple:
+    return round(lat, COORD_DECIMALS), round(lon, COORD_DECIMALS), get_model_version()
+
+
+def _score_live(weather: Dict[str, float], lat: float, lon: float) -> Dict[str, Any]:
+    features = live_features(weather, lat, lon)
+    probability = float(predict(features))
+    return {
+        "weather": weather,
+        "features": features,
+        "probability": probability,
+        "risk_level": classify_risk(probability)
+    }
+
+
+def _explain(features) -> Optional[Dict[str, Any]]:
+    try:
+        return explain_instance_shap(features)
+    except Exception as e:
+        _shap_failure_log.warning("SHAP explanation unavailable: %s", e)
+        return None
+
+
+def live_prediction(lat: float, lon: float) -> Dict[str, Any]:
+    """
+    Live weather, model features, probability and risk level for a point,
+    computed once per point, weather refresh and model version. Treat the
+    returned dict as read-only.
+    """
+    return prediction_cache.get_or_compute(
+        _point_key(lat, lon), lambda: _score_live(fetch_live_weather(lat, lon), lat, lon))
+
+
+async def live_prediction_async(lat: float, lon: float) -> Dict[str, Any]:
+    async def compute():
+        weather = await fetch_live_weather_async(lat, lon)
+        return await run_model(_score_live, weather, lat, lon)
+
+    return await prediction_cache.aget_or_compute(_point_key(lat, lon), compute)
+
+
+def live_shap(lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """SHAP explanation of live_prediction() for a point (None if SHAP is unavailable)."""
+    return shap_cache.get_or_compute(
+        _point_key(lat, lon), lambda: _explain(live_prediction(lat, lon)["features"]))
+
+
+async def live_shap_async(lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    async def compute():
+        features = (await live_prediction_async(lat, lon))["features"]
+        return await run_model(_explain, features)
+
+    return await shap_cache.aget_or_compute(_point_key(lat, lon), compute)
+
+
+def live_assessment(lat: float, lon: float) -> Dict[str, Any]:
+    """live_prediction() plus its SHAP explanation."""
+    return {**live_prediction(lat, lon), "shap_explanation": live_shap(lat, lon)}
+
+
+async def live_assessment_async(lat: float, lon: float) -> Dict[str, Any]:
+    return {**await live_prediction_async(lat, lon), "shap_explanation": await live_shap_async(lat, lon)}
+
+
+def cache_stats():
+    return {
+        "geocode": geocode_cache.stats(),
+        "weather": weather_cache.stats(),
+        "predictions": prediction_cache.stats(),
+        "shap": shap_cache.stats()
+    }
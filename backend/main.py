@@ -1,24 +1,78 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import numpy as np
-import requests
 import re
+import json
 import logging
+import os
+import tempfile
 from datetime import datetime
-from typing import List, Dict
-from model_loader import predict, get_feature_importances, get_feature_names, explain_instance, explain_instance_shap
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from model_artifact import ArtifactError
+from admission import AdmissionController, AdmissionMiddleware, EndpointClass
+from metrics import registry as metrics_registry, MetricsMiddleware, TimedJSONResponse, admission_families, cache_families
+from tracing import TracingMiddleware, admin_authorized, span
+from structured_logging import configure_logging, RequestLogMiddleware, SampledLog
+from shadow_scoring import shadow_scorer
+from model_loader import registry as model_registry, reload_model, predict, predict_batch, get_model_info, get_feature_importances, get_feature_names, explain_instance, explain_instance_shap
 from simulation_engine import simulate_flood
-from schemas import WeatherInput, PredictionOutput, LocationValidationRequest, LocationValidationResponse, PredictionInput, ChatRequest, ChatResponse
+from schemas import WeatherInput, PredictionOutput, LocationValidationRequest, LocationValidationResponse, PredictionInput, ChatRequest, ChatResponse, BulkForecastRequest, SiteInput, JobRequest, ExplainBatchRequest
 from city_loader import search_cities, city_exists
-from multi_city_utils import get_multiple_cities_predictions, get_sample_cities
+from multi_city_utils import get_multiple_cities_predictions, get_multiple_cities_predictions_async, get_sample_cities, get_city_coordinates
 from chatbot_engine import get_chatbot
-
-logging.basicConfig(level=logging.INFO)
+from location_service import classify_risk, get_lat_lon_async, fetch_live_weather, fetch_live_weather_async, live_assessment_async, cache_stats as live_cache_stats
+from chat_history import validate_session_id
+from heatmap_encoding import resolve_encoding, encode_grid_response, GRID_HEADERS
+from adaptive_sampling import AdaptiveSampler, run_adaptive_async
+from tile_service import (
+    get_tile_intensities, get_tile_png, tile_grid_geometry, seconds_until_refresh,
+    cached_sampler, cached_sampler_async, cached_samples_within, weather_snapshot_version, cache_stats as tile_cache_stats
+)
+from interpolation import interpolate_grid
+from features import live_feature_row, add_anomalies, day_of_year
+from backtest import run_backtest, backtest
+from job_queue import JobQueue, JobContext, QueueFull
+from inference_pool import inference_pool, run_model
+from http_client import aclose as close_http_client
+from bulk_scoring import stream_scored_csv, detect_format, DEFAULT_CHUNK_ROWS, FORMATS as SCORING_FORMATS
+from forecast_engine import forecast_cache, fetch_forecast, score_forecast_async, score_forecasts, validate_horizon, MAX_FORECAST_DAYS
+
+configure_logging()
 logger = logging.getLogger(__name__)
+# Request payloads: sampled at DEBUG; the request summary line covers every call
+payload_log = SampledLog(logger, every=100, per_second=1)
 # --------------------------------------------------
 # FastAPI App
 # --------------------------------------------------
-app = FastAPI(title="ML Flood Prediction System")
+app = FastAPI(title="ML Flood Prediction System", default_response_class=TimedJSONResponse)
+
+# --------------------------------------------------
+# Admission Control (per endpoint class)
+# --------------------------------------------------
+# Single-location predictions first; heavy fan-out endpoints are capped so
+# they cannot starve them, and shed early with 429/503 + Retry-After.
+admission = AdmissionController(
+    classes=[
+        EndpointClass("predict", limit=64, queue_depth=256, queue_timeout=2.0, priority=0),
+        EndpointClass("interactive", limit=32, queue_depth=64, queue_timeout=5.0, priority=1),
+        EndpointClass("tiles", limit=16, queue_depth=128, queue_timeout=5.0, priority=2),
+        EndpointClass("heatmap", limit=4, queue_depth=16, queue_timeout=10.0, priority=2),
+        EndpointClass("bulk", limit=2, queue_depth=8, queue_timeout=10.0, priority=3),
+    ],
+    rules=[
+        (r"/(predict|predict/live|explain|explainability/instance|simulate)", "predict"),
+        (r"/(forecast|forecast/3day|chat|chat/stream)", "interactive"),
+        (r"/tiles/\d+/\d+/[^/]+", "tiles"),
+        (r"/area/heatmap(/box)?", "heatmap"),
+        (r"/(multi-city/[^/]+|forecast/bulk|score/bulk|explain/batch|backtest)", "bulk"),
+    ]
+)
+# Added before CORS so that it runs inside it and rejections carry CORS headers
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 # --------------------------------------------------
 # Enable CORS (React → FastAPI)
@@ -29,35 +83,99 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=GRID_HEADERS + ["X-Model-Version", "Retry-After", "Server-Timing"],
 )
 
-# --------------------------------------------------
-# Risk Classification Logic
-# --------------------------------------------------
-def classify_risk(probability: float) -> str:
-    if probability < 0.25:
-        return "Low"
-    elif probability < 0.50:
-        return "Moderate"
-    elif probability < 0.75:
-        return "High"
-    else:
-        return "Critical"
+
+class ModelVersionMiddleware:
+    """
+    Pin the active model version for the whole request (including streamed
+    bodies) and report it in the X-Model-Version response header. A model
+    swap mid-request does not affect requests already in flight.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with model_registry.pinned() as model_version:
+            async def send_with_version(message):
+                if message["type"] == "http.response.start":
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-model-version", model_version.version.encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_version)
+
+
+app.add_middleware(ModelVersionMiddleware)
+# One summary line per request (inside tracing, to report its stage totals)
+app.add_middleware(RequestLogMiddleware)
+# Per-request spans -> Server-Timing header; X-Profile requests are profiled
+app.add_middleware(TracingMiddleware)
+# Outermost, so latency includes queueing and shed requests are counted too
+app.add_middleware(MetricsMiddleware, router=app.router)
+
+# WeatherInput fields in model feature order
+WEATHER_FIELDS = list(WeatherInput.model_fields)
+
+
+@app.on_event("startup")
+def start_inference_pool():
+    # Fork the inference workers before the server starts any threads
+    inference_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    inference_pool.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_upstream_client():
+    await close_http_client()
 
 # --------------------------------------------------
 # Health Check
 # --------------------------------------------------
 @app.get("/")
 def root():
-    return {"status": "Flood Prediction API running"}
+    info = get_model_info()
+    return {
+        "status": "Flood Prediction API running",
+        "model": {key: info.get(key) for key in ("model_file", "format", "sha256", "threshold")}
+    }
+
+@app.get("/admission")
+def admission_stats():
+    """Concurrency limits, queue depths and rejection counts per endpoint class"""
+    return admission.stats()
+
+
+def collect_app_metrics():
+    caches = [*live_cache_stats().values(), *tile_cache_stats().values(), forecast_cache.stats()]
+    return cache_families(caches) + admission_families(admission.stats())
+
+
+metrics_registry.register_collector(collect_app_metrics)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of request, stage, upstream, cache and admission metrics"""
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # --------------------------------------------------
 # Flood Prediction Endpoint
 # --------------------------------------------------
 @app.post("/predict", response_model=PredictionOutput)
 def predict_flood(data: WeatherInput):
-    # Log incoming payload for debugging
-    logger.info("Received /predict request: %s", data.dict())
+    payload_log.debug("Received /predict request: %s", data)
 
     try:
         # --------------------------------------------------
@@ -80,6 +198,7 @@ def predict_flood(data: WeatherInput):
         # --------------------------------------------------
         probability = predict(features)
         risk_level = classify_risk(probability)
+        shadow_scorer.offer(features, probability)
 
         # --------------------------------------------------
         # SHAP Explanation (for chatbot context)
@@ -110,7 +229,7 @@ def explain_prediction(data: WeatherInput):
     Explain a single prediction using SHAP TreeExplainer.
     Returns base value, feature names, and SHAP values for the prediction.
     """
-    logger.info("Received /explain request: %s", data.dict())
+    payload_log.debug("Received /explain request: %s", data)
 
     try:
         # --------------------------------------------------
@@ -139,6 +258,27 @@ def explain_prediction(data: WeatherInput):
         raise HTTPException(status_code=500, detail="Explainability failed on server")
 
 
+@app.post("/explain/batch")
+def explain_batch(data: ExplainBatchRequest):
+    """
+    SHAP values for many inputs at once. Large batches run on the inference
+    process pool so they do not stall other requests.
+    """
+    try:
+        features = np.array([[getattr(item, name) for name in WEATHER_FIELDS] for item in data.inputs])
+        shap_values, base_value = inference_pool.shap_values(features)
+        probabilities = inference_pool.predict(features)
+        return TimedJSONResponse({
+            "base_value": base_value,
+            "feature_names": get_feature_names(),
+            "shap_values": np.round(shap_values, 6).tolist(),
+            "probabilities": np.round(probabilities, 6).tolist()
+        })
+    except Exception as e:
+        logger.exception("Error during batch SHAP explanation: %s", e)
+        raise HTTPException(status_code=500, detail="Explainability failed on server")
+
+
 # --------------------------------------------------
 # City Search and Location Validation Endpoints
 # --------------------------------------------------
@@ -204,26 +344,6 @@ def validate_location(data: LocationValidationRequest):
         raise HTTPException(status_code=500, detail="Failed to validate location")
 
 
-def fetch_live_weather(lat: float, lon: float):
-    url = (
-        "https://api.open-meteo.com/v1/forecast"
-        f"?latitude={lat}&longitude={lon}"
-        "&current=temperature_2m,relative_humidity_2m,"
-        "pressure_msl,wind_speed_10m,precipitation"
-    )
-
-    response = requests.get(url)
-    data = response.json()["current"]
-
-    return {
-        "temperature": data["temperature_2m"],
-        "humidity": data["relative_humidity_2m"],
-        "pressure": data["pressure_msl"],
-        "wind_speed": data["wind_speed_10m"],
-        "rainfall": data["precipitation"]
-    }
-
-
 @app.get("/explainability")
 def explainability_global():
     """Return global feature importances (normalized)."""
@@ -258,84 +378,30 @@ def explain_instance_route(data: WeatherInput):
         raise HTTPException(status_code=500, detail="Explainability failed on server")
 
 
-def get_lat_lon(place: str):
-    """
-    Get latitude and longitude from a place name or coordinates.
-    If place is in format "lat,lon", parse it directly.
-    Otherwise, use geocoding API.
-    """
-    # Check if place is in coordinate format (e.g., "12.922, 77.505")
-    coord_pattern = r'^-?\d+\.?\d*\s*,\s*-?\d+\.?\d*$'
-    if re.match(coord_pattern, place.strip()):
-        # Parse coordinates directly
-        parts = [p.strip() for p in place.split(',')]
-        if len(parts) == 2:
-            try:
-                lat = float(parts[0])
-                lon = float(parts[1])
-                # Validate ranges
-                if -90 <= lat <= 90 and -180 <= lon <= 180:
-                    return lat, lon
-            except ValueError:
-                pass
-    
-    # Use geocoding API for place names
-    url = f"https://geocoding-api.open-meteo.com/v1/search?name={place}&count=1"
-    response = requests.get(url).json()
-
-    if "results" not in response:
-        return None
-
-    location = response["results"][0]
-    return location["latitude"], location["longitude"]
-
 def fetch_3day_forecast(lat: float, lon: float):
-    url = (
-        "https://api.open-meteo.com/v1/forecast"
-        f"?latitude={lat}&longitude={lon}"
-        "&daily=temperature_2m_max,temperature_2m_min,"
-        "precipitation_sum,wind_speed_10m_max,pressure_msl_mean"
-        "&forecast_days=3"
-    )
-
-    response = requests.get(url)
-    return response.json()["daily"]
+    return fetch_forecast(lat, lon, days=3, resolution="daily")
 
 @app.get("/predict/live")
-def live_prediction(place: str):
+async def live_prediction(place: str):
 
-    coords = get_lat_lon(place)
+    with span("resolve_location"):
+        coords = await get_lat_lon_async(place)
     if coords is None:
         return {"error": "Invalid location"}
 
     lat, lon = coords
-    weather = fetch_live_weather(lat, lon)
+    # Cached per location, weather refresh and model version
+    with span("assessment"):
+        assessment = await live_assessment_async(lat, lon)
+    weather = assessment["weather"]
+    prob = assessment["probability"]
+    risk = assessment["risk_level"]
+    shap_explanation = assessment["shap_explanation"]
+    shadow_scorer.offer(assessment["features"], prob)
 
-    # Calculate features used in model
     t2m = weather["temperature"]
     t2m_max = weather["temperature"] + 2
     t2m_min = weather["temperature"] - 2
-    
-    features = np.array([[
-        t2m,                                  # T2M
-        t2m_max,                              # T2M_MAX
-        t2m_min,                              # T2M_MIN
-        weather["pressure"],                  # PS
-        weather["rainfall"],                  # PRECTOTCORR
-        weather["humidity"],                  # RH2M
-        weather["wind_speed"],                # WS2M
-        0.0,                                  # rain_anomaly
-        0.0                                   # temp_anomaly
-    ]])
-
-    prob = predict(features)
-    risk = classify_risk(prob)
-
-    # Get SHAP explanation
-    try:
-        shap_explanation = explain_instance_shap(features)
-    except:
-        shap_explanation = None
 
     recommendations = {
         "Low": "No immediate action required",
@@ -361,32 +427,19 @@ def live_prediction(place: str):
     }
 }
 @app.get("/forecast/3day")
-def forecast_3day(place: str):
+async def forecast_3day(place: str):
 
-    coords = get_lat_lon(place)
+    with span("resolve_location"):
+        coords = await get_lat_lon_async(place)
     if coords is None:
         return {"error": "Invalid location"}
 
     lat, lon = coords
-    forecast = fetch_3day_forecast(lat, lon)
+    with span("forecast_score"):
+        scored = await score_forecast_async(lat, lon, days=3, resolution="daily")
     results = []
 
-    for i in range(3):
-        features = np.array([[
-            (forecast["temperature_2m_max"][i] +
-             forecast["temperature_2m_min"][i]) / 2,
-            forecast["temperature_2m_max"][i],
-            forecast["temperature_2m_min"][i],
-            forecast["pressure_msl_mean"][i],
-            forecast["precipitation_sum"][i],
-            70,
-            forecast["wind_speed_10m_max"][i],
-            0.0,
-            0.0
-        ]])
-
-        prob = predict(features)
-
+    for i, prob in enumerate(scored["probabilities"][:3]):
         results.append({
             "day": f"Day {i+1}",
             "probability": float(prob),
@@ -399,6 +452,115 @@ def forecast_3day(place: str):
     }
 
 
+@app.get("/forecast")
+async def forecast_horizon(
+    place: str,
+    days: int = Query(3, ge=1, le=MAX_FORECAST_DAYS, description="Forecast horizon in days"),
+    resolution: str = Query("daily", pattern="^(daily|hourly)$", description="daily or hourly rows")
+):
+    """
+    Flood risk over a forecast horizon of up to 16 days, daily or hourly.
+    The whole horizon comes from one upstream call and is scored in one
+    batched model call; upstream data is cached per location and model run.
+    """
+    with span("resolve_location"):
+        coords = await get_lat_lon_async(place)
+    if coords is None:
+        return {"error": "Invalid location"}
+
+    lat, lon = coords
+    try:
+        with span("forecast_score"):
+            scored = await score_forecast_async(lat, lon, days=days, resolution=resolution)
+    except Exception as e:
+        logger.exception("Forecast failed: %s", e)
+        raise HTTPException(status_code=502, detail="Forecast data unavailable")
+
+    results = [
+        {"time": t, "probability": float(prob), "risk": classify_risk(prob)}
+        for t, prob in zip(scored["times"], scored["probabilities"].tolist())
+    ]
+    return {
+        "location": place,
+        "latitude": lat,
+        "longitude": lon,
+        "days": days,
+        "resolution": resolution,
+        "forecast": results
+    }
+
+
+def resolve_site(site) -> Dict:
+    """Resolve a bulk-forecast site (name, "lat,lon" string or SiteInput) to coordinates."""
+    if isinstance(site, SiteInput):
+        if site.latitude is not None and site.longitude is not None:
+            return {"site": site.name or f"{site.latitude:.4f},{site.longitude:.4f}",
+                    "coords": (site.latitude, site.longitude)}
+        site = site.name
+
+    name = site.strip()
+    coord_pattern = r'^-?\d+\.?\d*\s*,\s*-?\d+\.?\d*$'
+    if re.match(coord_pattern, name):
+        lat, lon = (float(p) for p in name.split(','))
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return {"site": name, "coords": (lat, lon)}
+        return {"site": name, "coords": None}
+    return {"site": name, "coords": get_city_coordinates(name)}
+
+
+@app.post("/forecast/bulk")
+def forecast_bulk(data: BulkForecastRequest):
+    """
+    Flood risk forecast for many sites at once.
+
+    Sites are geocoded concurrently (cached), forecasts are fetched with pooled
+    multi-location upstream requests and every site x time step is scored in a
+    single model call. Returns a compact site x step probability table; rows
+    of sites that could not be resolved or fetched are null.
+
+    Request body: {"sites": ["Mumbai", "12.97,77.59", {"name": "Dam A", "latitude": .., "longitude": ..}],
+                   "days": 3, "resolution": "daily"}
+    """
+    try:
+        validate_horizon(data.days, data.resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            resolved = list(pool.map(resolve_site, data.sites))
+
+        located = [i for i, r in enumerate(resolved) if r["coords"] is not None]
+        scored = score_forecasts([resolved[i]["coords"] for i in located], data.days, data.resolution)
+
+        steps = data.days * (24 if data.resolution == "hourly" else 1)
+        table: List = [None] * len(resolved)
+        sites = []
+        for r in resolved:
+            sites.append({"site": r["site"], "latitude": None, "longitude": None, "start": None,
+                          "error": "Could not find site coordinates"})
+        for row, i in enumerate(located):
+            lat, lon = resolved[i]["coords"]
+            sites[i].update({"latitude": lat, "longitude": lon, "start": scored["starts"][row]})
+            probs = scored["probabilities"][row]
+            if np.isnan(probs).all():
+                sites[i]["error"] = "Forecast data unavailable"
+                continue
+            del sites[i]["error"]
+            table[i] = [None if np.isnan(p) else round(float(p), 4) for p in probs]
+
+        return {
+            "days": data.days,
+            "resolution": data.resolution,
+            "steps": steps,
+            "sites": sites,
+            "probabilities": table
+        }
+    except Exception as e:
+        logger.exception("Bulk forecast failed: %s", e)
+        raise HTTPException(status_code=500, detail="Bulk forecast failed")
+
+
 @app.post("/simulate")
 def simulate(data: PredictionInput):
     """Run model-driven flood simulation across hours and return timeline."""
@@ -410,18 +572,104 @@ def simulate(data: PredictionInput):
         raise HTTPException(status_code=500, detail="Simulation failed on server")
 
 
+# --------------------------------------------------
+# Backtest
+# --------------------------------------------------
+@app.get("/backtest")
+def backtest_endpoint(
+    start: Optional[str] = Query(None, description="First date (YYYY-MM-DD)"),
+    end: Optional[str] = Query(None, description="Last date (YYYY-MM-DD)"),
+    stream: bool = Query(False, description="Stream NDJSON progress events before the result")
+):
+    """
+    Score the historical NASA POWER series and evaluate against EM-DAT flood
+    dates: precision/recall over a threshold sweep plus the ROC curve.
+    """
+    for value in (start, end):
+        if value is not None:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+    if stream:
+        def events():
+            try:
+                for event in run_backtest(start=start, end=end):
+                    yield json.dumps(event) + "\n"
+            except Exception as e:
+                logger.exception("Backtest failed: %s", e)
+                yield json.dumps({"event": "error", "detail": "Backtest failed"}) + "\n"
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    try:
+        return TimedJSONResponse(backtest(start=start, end=end))
+    except Exception as e:
+        logger.exception("Backtest failed: %s", e)
+        raise HTTPException(status_code=500, detail="Backtest failed")
+
+
+# --------------------------------------------------
+# Bulk Scoring
+# --------------------------------------------------
+@app.post("/score/bulk")
+async def score_bulk(
+    request: Request,
+    format: Optional[str] = Query(None, description="Input format: csv | parquet (default: from Content-Type)"),
+    chunk_rows: int = Query(DEFAULT_CHUNK_ROWS, ge=1000, le=1_000_000)
+):
+    """
+    Score a CSV / Parquet extract sent as the raw request body.
+
+    The body is spooled to a temporary file and scored in fixed-size chunks;
+    scored rows stream back as CSV, ending with a
+    "# rows=... seconds=... rows_per_sec=..." summary line.
+    """
+    if format is not None and format not in SCORING_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {SCORING_FORMATS}")
+
+    spool = tempfile.NamedTemporaryFile(prefix="bulk-score-", delete=False)
+    try:
+        with spool:
+            async for block in request.stream():
+                spool.write(block)
+        fmt = format or detect_format(spool.name, request.headers.get("content-type"))
+        pieces = stream_scored_csv(spool.name, fmt, chunk_rows)
+        # Score the first chunk before responding so bad input still gets a 400
+        first = await run_in_threadpool(next, pieces)
+    except ValueError as e:
+        os.unlink(spool.name)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        os.unlink(spool.name)
+        logger.exception("Bulk scoring failed: %s", e)
+        raise HTTPException(status_code=500, detail="Bulk scoring failed")
+
+    def body():
+        try:
+            yield first
+            yield from pieces
+        except Exception as e:
+            logger.exception("Bulk scoring failed mid-stream: %s", e)
+            yield "# error: bulk scoring failed\n"
+        finally:
+            os.unlink(spool.name)
+
+    return StreamingResponse(body(), media_type="text/csv")
+
+
 # --------------------------------------------------
 # Multi-City Endpoints
 # --------------------------------------------------
 @app.get("/multi-city/sample")
-def get_sample_cities_endpoint(limit: int = Query(10, ge=1, le=100)):
+async def get_sample_cities_endpoint(limit: int = Query(10, ge=1, le=100)):
     """
     Get a sample of cities for the multi-city map view.
     Returns city names with flood predictions.
     """
     try:
-        city_names = get_sample_cities(limit=limit)
-        predictions = get_multiple_cities_predictions(city_names)
+        city_names = await run_in_threadpool(get_sample_cities, limit=limit)
+        predictions = await get_multiple_cities_predictions_async(city_names)
         return {"cities": predictions}
     except Exception as e:
         logger.exception("Failed to get sample cities: %s", e)
@@ -429,7 +677,7 @@ def get_sample_cities_endpoint(limit: int = Query(10, ge=1, le=100)):
 
 
 @app.post("/multi-city/predictions")
-def get_cities_predictions(data: dict):
+async def get_cities_predictions(data: dict):
     """
     Get flood predictions for a specific list of cities.
     
@@ -440,9 +688,9 @@ def get_cities_predictions(data: dict):
         if not city_names or not isinstance(city_names, list):
             raise HTTPException(status_code=400, detail="cities parameter must be a non-empty list")
         
-        # Limit to 50 cities per request
+        # Limit to 50 cities per request; larger lists go through a multi_city job
         city_names = city_names[:50]
-        predictions = get_multiple_cities_predictions(city_names)
+        predictions = await get_multiple_cities_predictions_async(city_names)
         return {"cities": predictions}
     except HTTPException:
         raise
@@ -454,8 +702,31 @@ def get_cities_predictions(data: dict):
 # --------------------------------------------------
 # Chatbot Endpoint - Explainability Assistant
 # --------------------------------------------------
+def chat_context(request: ChatRequest) -> Dict:
+    """Context dictionary for the chatbot from a chat request"""
+    context = request.context or {}
+    
+    # Merge optional context fields
+    if request.prediction:
+        context["prediction"] = request.prediction
+    if request.shap_explanation:
+        context["shap_explanation"] = request.shap_explanation
+    if request.simulation:
+        context["simulation"] = request.simulation
+    if request.location:
+        context["location"] = request.location
+    return context
+
+
+def chat_session_id(session_id: Optional[str]) -> str:
+    try:
+        return validate_session_id(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat_with_assistant(request: ChatRequest):
+async def chat_with_assistant(request: ChatRequest):
     """
     Explainability-focused chatbot endpoint.
     
@@ -468,30 +739,23 @@ def chat_with_assistant(request: ChatRequest):
     - simulation: Simulation (what-if) result
     - location: Location name for contextualization
     """
+    session_id = chat_session_id(request.session_id)
     try:
         logger.info("Received chat request: %s", request.message)
         
         # Get chatbot instance
         chatbot = get_chatbot()
+        context = chat_context(request)
         
-        # Build context dictionary
-        context = request.context or {}
-        
-        # Merge optional context fields
-        if request.prediction:
-            context["prediction"] = request.prediction
-        if request.shap_explanation:
-            context["shap_explanation"] = request.shap_explanation
-        if request.simulation:
-            context["simulation"] = request.simulation
-        if request.location:
-            context["location"] = request.location
-        
-        # Process query
-        response = chatbot.process_query(request.message, context)
+        # Fetch live data for location questions without holding a thread,
+        # then answer from the warm caches
+        await chatbot.prefetch(request.message)
+        with span("chat_reply"):
+            response = await run_in_threadpool(chatbot.process_query, request.message, context, session_id)
         
         # Add timestamp
         response["timestamp"] = datetime.now().isoformat()
+        response["session_id"] = session_id
         
         return ChatResponse(**response)
     
@@ -500,30 +764,83 @@ def chat_with_assistant(request: ChatRequest):
         raise HTTPException(status_code=500, detail="Chat processing failed on server")
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat as Server-Sent Events. Each part of the reply
+    is sent as a `section` event ({"id", "markdown"}) as soon as it is ready
+    (for location questions: header, risk, weather, SHAP, footer), followed
+    by a `done` event carrying the same fields as the /chat response.
+    """
+    session_id = chat_session_id(request.session_id)
+    logger.info("Received chat stream request: %s", request.message)
+    chatbot = get_chatbot()
+    events = chatbot.stream_query(request.message, chat_context(request), session_id)
+
+    async def sse():
+        try:
+            # Live data is fetched on the event loop while the header goes
+            # out; the remaining sections are then built from the caches
+            prefetch = asyncio.ensure_future(chatbot.prefetch(request.message, explain=False))
+            first = True
+            while True:
+                event = await run_in_threadpool(next, events, None)
+                if event is None:
+                    break
+                if event["event"] == "done":
+                    event.update(timestamp=datetime.now().isoformat(), session_id=session_id)
+                yield f"event: {event.pop('event')}\ndata: {json.dumps(event, default=float)}\n\n"
+                if first:
+                    await prefetch
+                    first = False
+        except Exception as e:
+            logger.exception("Error in chat stream: %s", e)
+            yield f"event: error\ndata: {json.dumps({'detail': 'Chat processing failed on server'})}\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/chat/history")
-def get_chat_history():
-    """Get conversation history from the chatbot"""
+def get_chat_history(
+    session_id: Optional[str] = Query(None, description="Conversation id (default session if omitted)"),
+    offset: int = Query(0, ge=0, description="Skip this many of the most recent messages"),
+    limit: int = Query(50, ge=1, le=500, description="Messages per page")
+):
+    """Get one page of a session's conversation history (offset=0 is the latest page)"""
+    session_id = chat_session_id(session_id)
     try:
         chatbot = get_chatbot()
-        history = chatbot.get_conversation_history()
-        return {"history": history}
+        return chatbot.get_conversation_history(session_id, offset, limit)
     except Exception as e:
         logger.exception("Error retrieving chat history: %s", e)
         raise HTTPException(status_code=500, detail="Failed to retrieve chat history")
 
 
 @app.post("/chat/clear")
-def clear_chat_history():
-    """Clear conversation history"""
+def clear_chat_history(session_id: Optional[str] = Query(None, description="Conversation id (default session if omitted)")):
+    """Clear a session's conversation history"""
+    session_id = chat_session_id(session_id)
     try:
         chatbot = get_chatbot()
-        chatbot.clear_history()
-        return {"message": "Chat history cleared successfully"}
+        chatbot.clear_history(session_id)
+        return {"message": "Chat history cleared successfully", "session_id": session_id}
     except Exception as e:
         logger.exception("Error clearing chat history: %s", e)
         raise HTTPException(status_code=500, detail="Failed to clear chat history")
 
 
+@app.get("/chat/sessions")
+def chat_session_stats():
+    """In-memory chat session counts and limits"""
+    return get_chatbot().sessions.stats()
+
+
+@app.on_event("shutdown")
+def flush_chat_sessions():
+    get_chatbot().sessions.flush()
+
+
 # --------------------------------------------------
 # Heatmap Endpoints - Area Flood Risk
 # --------------------------------------------------
@@ -542,51 +859,48 @@ def generate_grid_points(min_lat, min_lon, max_lat, max_lon, grid_size=64):
 
 
 @app.get("/area/heatmap")
-def area_heatmap(
+async def area_heatmap(
     center_lat: float,
     center_lon: float,
     radius_km: int = Query(50, ge=10, le=200),
-    points: int = Query(25, ge=9, le=100)
+    points: int = Query(25, ge=9, le=100),
+    format: Optional[str] = Query(None, pattern="^(points|grid|binary)$", description="Response encoding; overrides the Accept header"),
+    dtype: str = Query("uint8", pattern="^(uint8|float16)$", description="Packed value type for grid/binary encodings"),
+    accept: Optional[str] = Header(None)
 ):
     """
     Generate flood risk heatmap data for a selected area.
-    Returns multiple lat/lon points with risk probabilities.
+    Returns multiple lat/lon points with risk probabilities, or a compact
+    grid encoding (see heatmap_encoding) when requested.
     """
 
     try:
-        results = []
-
         # Generate grid around center
         grid_size = int(np.sqrt(points))
         lat_step = radius_km / 111 / grid_size
         lon_step = radius_km / (111 * np.cos(np.radians(center_lat))) / grid_size
+        grid_points = [
+            (center_lat + i * lat_step, center_lon + j * lon_step)
+            for i in range(-grid_size, grid_size + 1)
+            for j in range(-grid_size, grid_size + 1)
+        ]
 
-        for i in range(-grid_size, grid_size + 1):
-            for j in range(-grid_size, grid_size + 1):
-                lat = center_lat + i * lat_step
-                lon = center_lon + j * lon_step
-
-                weather = fetch_live_weather(lat, lon)
-
-                features = np.array([[ 
-                    weather["temperature"],
-                    weather["temperature"] + 2,
-                    weather["temperature"] - 2,
-                    weather["pressure"],
-                    weather["rainfall"],
-                    weather["humidity"],
-                    weather["wind_speed"],
-                    0.0,
-                    0.0
-                ]])
-
-                prob = float(predict(features))
-
-                results.append({
-                    "lat": lat,
-                    "lon": lon,
-                    "intensity": prob
-                })
+        # Weather for all points concurrently, then one batched model call
+        probabilities = await sample_flood_probabilities_async(grid_points)
+        intensities = np.asarray(probabilities, dtype=np.float64).reshape(2 * grid_size + 1, 2 * grid_size + 1)
+        results = [
+            {"lat": lat, "lon": lon, "intensity": float(prob)}
+            for (lat, lon), prob in zip(grid_points, probabilities)
+        ]
+
+        encoding = resolve_encoding(format, accept)
+        if encoding != "points":
+            return encode_grid_response(
+                encoding, intensities,
+                center_lat - grid_size * lat_step, center_lon - grid_size * lon_step,
+                lat_step, lon_step, dtype,
+                extra={"center": {"lat": center_lat, "lon": center_lon}, "radius_km": radius_km}
+            )
 
         return {
             "center": {"lat": center_lat, "lon": center_lon},
@@ -599,15 +913,54 @@ def area_heatmap(
         raise HTTPException(status_code=500, detail="Heatmap generation failed")
 
 
-def interpolate_bilinear(lat: float, lon: float, corner_data: List, 
-                         min_lat: float, max_lat: float, 
-                         min_lon: float, max_lon: float) -> float:
+# Concurrent upstream weather lookups per heatmap request
+MAX_PARALLEL_WEATHER = 16
+
+
+def score_live_weather(points: List, weathers: List[Dict]) -> np.ndarray:
+    """Score live weather observations at (lat, lon) points in one batched model call."""
+    rows = np.array([live_feature_row(weather) for weather in weathers], dtype=np.float64)
+    if len(rows):
+        lats, lons = zip(*points)
+        add_anomalies(rows, day_of_year(), np.array(lats), np.array(lons))
+    return predict_batch(rows)
+
+
+def sample_flood_probabilities(points: List) -> np.ndarray:
+    """
+    Fetch live weather for each (lat, lon) point and score all of them
+    in a single batched model call.
+    """
+    return score_live_weather(points, [fetch_live_weather(lat, lon) for lat, lon in points])
+
+
+async def sample_flood_probabilities_async(points: List) -> np.ndarray:
+    """
+    sample_flood_probabilities for async handlers: weather is fetched
+    concurrently (at most MAX_PARALLEL_WEATHER at a time) and scored on the
+    model executor.
+    """
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_WEATHER)
+
+    async def fetch(lat: float, lon: float):
+        async with semaphore:
+            return await fetch_live_weather_async(lat, lon)
+
+    with span("weather_fanout"):
+        weathers = await asyncio.gather(*(fetch(lat, lon) for lat, lon in points))
+    return await run_model(score_live_weather, points, weathers)
+
+
+def interpolate_bilinear(lat, lon, corner_data: List,
+                         min_lat: float, max_lat: float,
+                         min_lon: float, max_lon: float):
     """
-    Bilinear interpolation between 4 corners for smooth gradients
+    Bilinear interpolation between 4 corners for smooth gradients.
+    `lat` and `lon` may be scalars or NumPy arrays (evaluated element-wise).
     """
     # Normalize coordinates to 0-1 range
-    x = (lon - min_lon) / (max_lon - min_lon) if max_lon != min_lon else 0.5
-    y = (lat - min_lat) / (max_lat - min_lat) if max_lat != min_lat else 0.5
+    x = (np.asarray(lon) - min_lon) / (max_lon - min_lon) if max_lon != min_lon else 0.5
+    y = (np.asarray(lat) - min_lat) / (max_lat - min_lat) if max_lat != min_lat else 0.5
     
     # Extract corner values
     # corner_data format: [(lat, lon, probability), ...]
@@ -626,92 +979,510 @@ def interpolate_bilinear(lat: float, lon: float, corner_data: List,
     return value
 
 
-def add_realistic_variation(value: float, noise_level: float = 0.05) -> float:
+def add_realistic_variation(value, noise_level: float = 0.05, rng: Optional[np.random.Generator] = None):
     """
-    Add small random variation to make heatmap look more realistic
+    Add small random variation to make heatmap look more realistic.
+    `value` may be a scalar or an array; noise is drawn for every element in one call.
+    Pass a seeded `rng` for reproducible output.
     """
-    noise = np.random.normal(0, noise_level)
+    rng = rng if rng is not None else np.random.default_rng()
+    value = np.asarray(value, dtype=np.float64)
+    noise = rng.normal(0.0, noise_level, size=value.shape)
     return np.clip(value + noise, 0.0, 1.0)
 
 
+def grid_cell_centers(min_lat: float, min_lon: float, max_lat: float, max_lon: float, grid_size: int):
+    """
+    Return (lats, lons) cell-center arrays of shape (grid_size, grid_size).
+    Row i / column j matches the (i, j) ordering used by `generate_grid_points`.
+    """
+    lat_step = (max_lat - min_lat) / grid_size
+    lon_step = (max_lon - min_lon) / grid_size
+    lat_axis = min_lat + (np.arange(grid_size) + 0.5) * lat_step
+    lon_axis = min_lon + (np.arange(grid_size) + 0.5) * lon_step
+    return np.meshgrid(lat_axis, lon_axis, indexing="ij")
+
+
 @app.get("/area/heatmap/box")
-def area_heatmap_box(
+async def area_heatmap_box(
     min_lat: float,
     min_lon: float,
     max_lat: float,
     max_lon: float,
-    grid_size: int = 30
+    grid_size: int = Query(30, ge=2, le=512),
+    seed: Optional[int] = Query(None, ge=0, description="Seed for the noise layer; same seed and inputs give identical output"),
+    mode: str = Query("corners", pattern="^(corners|adaptive)$", description="corners: 4 corner samples; adaptive: coarse-to-fine refinement"),
+    tolerance: float = Query(0.1, gt=0, le=1, description="Adaptive mode: split cells whose corner probabilities differ by more than this"),
+    max_samples: int = Query(64, ge=4, le=400, description="Adaptive mode: hard budget of upstream weather calls"),
+    coarse: int = Query(3, ge=1, le=8, description="Adaptive mode: cells per side of the initial lattice"),
+    interp: str = Query("bilinear", pattern="^(bilinear|idw|rbf)$", description="Grid fill: bilinear cells, or idw/rbf over all samples"),
+    format: Optional[str] = Query(None, pattern="^(points|grid|binary)$", description="Response encoding; overrides the Accept header"),
+    dtype: str = Query("uint8", pattern="^(uint8|float16)$", description="Packed value type for grid/binary encodings"),
+    accept: Optional[str] = Header(None)
 ):
     """
     Generate flood risk heatmap for a bounding box area using interpolation for speed.
+
+    Sampling modes:
+    - corners (default): sample the 4 corners and interpolate bilinearly
+    - adaptive: start from a coarse lattice of real samples and subdivide only
+      cells whose corner probabilities differ by more than `tolerance`, never
+      exceeding `max_samples` upstream calls (see adaptive_sampling)
+
+    Grid fill (`interp`):
+    - bilinear (default): blend the corners of each sampled cell
+    - idw / rbf: scattered-point interpolation over every sample taken here,
+      including the center point, plus samples already cached for the
+      current weather snapshot inside the box (see interpolation)
+
+    Encodings (`format` query parameter or Accept header):
+    - points (default): JSON list of {"lat", "lon", "intensity"}
+    - grid (application/vnd.flood.grid+json): origin/step/shape + base64 packed intensities
+    - binary (application/octet-stream): raw packed intensities, metadata in X-Grid-* headers
     """
     try:
-        # STEP 1: Sample only 5 strategic points (FAST!)
-        sample_points = [
-            (min_lat, min_lon),                             # Bottom-left corner
-            (min_lat, max_lon),                             # Bottom-right corner
-            (max_lat, min_lon),                             # Top-left corner
-            (max_lat, max_lon),                             # Top-right corner
-            ((min_lat + max_lat)/2, (min_lon + max_lon)/2) # Center point
-        ]
-        
-        sampled_data = []
-        for lat, lon in sample_points:
-            # Fetch weather data
-            weather = fetch_live_weather(lat, lon)
+        extra = {"success": True, "grid_size": f"{grid_size}x{grid_size}", "seed": seed, "mode": mode, "interp": interp}
+        version = weather_snapshot_version()
+        sample_fn = cached_sampler_async(sample_flood_probabilities_async, version)
+
+        if mode == "adaptive":
+            try:
+                sampler = AdaptiveSampler(
+                    min_lat, min_lon, max_lat, max_lon,
+                    coarse=coarse, tolerance=tolerance, max_samples=max_samples
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            await run_adaptive_async(sampler, sample_fn)
+            extra["samples_used"] = sampler.samples_used
+            extra["refinement_rounds"] = sampler.rounds
+        else:
+            # STEP 1: Sample only 5 strategic points (FAST!)
+            sample_points = [
+                (min_lat, min_lon),                             # Bottom-left corner
+                (min_lat, max_lon),                             # Bottom-right corner
+                (max_lat, min_lon),                             # Top-left corner
+                (max_lat, max_lon),                             # Top-right corner
+                ((min_lat + max_lat)/2, (min_lon + max_lon)/2) # Center point
+            ]
             
-            # Build model features
-            features = np.array([[
-                weather["temperature"],
-                weather["temperature"] + 2,
-                weather["temperature"] - 2,
-                weather["pressure"],
-                weather["rainfall"],
-                weather["humidity"],
-                weather["wind_speed"],
-                0.0,
-                0.0
-            ]])
+            # Fetch weather and score all samples in one model call
+            probabilities = await sample_fn(sample_points)
+            sampled_data = [(lat, lon, float(p)) for (lat, lon), p in zip(sample_points, probabilities)]
             
-            # Get flood probability prediction
-            probability = predict(features)
-            sampled_data.append((lat, lon, float(probability)))
-        
-        # STEP 2: Use corner points for interpolation
-        corner_data = sampled_data[:4]
-        
-        # STEP 3: Create dense grid with interpolation
-        lat_step = (max_lat - min_lat) / grid_size
-        lon_step = (max_lon - min_lon) / grid_size
-        
-        heatmap_points = []
-        
-        for i in range(grid_size):
-            for j in range(grid_size):
-                lat = min_lat + (i + 0.5) * lat_step
-                lon = min_lon + (j + 0.5) * lon_step
-                
-                # Interpolate value from 4 corners
-                interpolated_value = interpolate_bilinear(
-                    lat, lon, corner_data, 
+            # STEP 2: Use corner points for interpolation
+            corner_data = sampled_data[:4]
+            extra["samples_used"] = len(sample_points)
+
+        def render():
+            # STEP 3: Create dense grid with interpolation (whole-array operations)
+            lats, lons = grid_cell_centers(min_lat, min_lon, max_lat, max_lon, grid_size)
+            if interp != "bilinear":
+                # Every sample of this snapshot inside the box: this request's own
+                # plus any left in the shared point cache by tiles or other boxes
+                # (only the request's own if they have been evicted meanwhile)
+                samples = (cached_samples_within(min_lat, min_lon, max_lat, max_lon, version)
+                           or (sampler.samples() if mode == "adaptive" else sampled_data))
+                interpolated = interpolate_grid(samples, lats, lons, method=interp)
+                extra["samples_interpolated"] = len(samples)
+            elif mode == "adaptive":
+                interpolated = sampler.interpolate(lats, lons)
+            else:
+                interpolated = interpolate_bilinear(
+                    lats, lons, corner_data,
                     min_lat, max_lat, min_lon, max_lon
                 )
-                
-                # Add slight realistic variation
-                final_value = add_realistic_variation(interpolated_value, noise_level=0.03)
-                
-                heatmap_points.append({
-                    "lat": round(lat, 6),
-                    "lon": round(lon, 6),
-                    "intensity": round(final_value, 4)
-                })
+            
+            # Add slight realistic variation
+            rng = np.random.default_rng(seed)
+            intensities = add_realistic_variation(interpolated, noise_level=0.03, rng=rng)
+            
+            encoding = resolve_encoding(format, accept)
+            if encoding != "points":
+                lat_step = (max_lat - min_lat) / grid_size
+                lon_step = (max_lon - min_lon) / grid_size
+                return encode_grid_response(
+                    encoding, intensities,
+                    min_lat + 0.5 * lat_step, min_lon + 0.5 * lon_step,
+                    lat_step, lon_step, dtype,
+                    extra=extra
+                )
+            
+            lat_list = np.round(lats, 6).ravel().tolist()
+            lon_list = np.round(lons, 6).ravel().tolist()
+            intensity_list = np.round(intensities, 4).ravel().tolist()
+            heatmap_points = [
+                {"lat": lat, "lon": lon, "intensity": intensity}
+                for lat, lon, intensity in zip(lat_list, lon_list, intensity_list)
+            ]
+            
+            # Already plain Python types, so skip FastAPI's per-item jsonable_encoder pass
+            return TimedJSONResponse({**extra, "points": heatmap_points})
         
-        return {
-            "success": True,
-            "grid_size": f"{grid_size}x{grid_size}",
-            "points": heatmap_points
-        }
+        # Interpolating and encoding a large grid is CPU work: keep it off the event loop
+        with span("render"):
+            return await run_model(render)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Heatmap interpolation failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Heatmap generation failed: {str(e)}")
+
+
+# --------------------------------------------------
+# Slippy-Map Tiles - Flood Risk Raster
+# --------------------------------------------------
+@app.get("/tiles/{z}/{x}/{y}")
+def flood_risk_tile(
+    z: int,
+    x: int,
+    y: str,
+    size: int = Query(256, ge=16, le=512, description="Tile edge length in pixels"),
+    format: Optional[str] = Query(None, pattern="^(png|grid|binary)$", description="png (default), grid or binary"),
+    dtype: str = Query("uint8", pattern="^(uint8|float16)$", description="Packed value type for grid/binary encodings"),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Flood-risk intensity for a standard web-mercator XYZ tile.
+    `y` may carry an image extension (e.g. /tiles/6/45/28.png).
+
+    Tiles are cached per weather snapshot, so every tile is computed at most
+    once per refresh no matter how many clients request it.
+    """
+    try:
+        y_index = int(y.split(".", 1)[0])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Tile y must be an integer")
+
+    encoding = format or resolve_encoding(None, accept)
+    if encoding == "points":
+        encoding = "png"
+
+    try:
+        headers = {"Cache-Control": f"public, max-age={seconds_until_refresh()}"}
+        if encoding == "png":
+            png, version = get_tile_png(z, x, y_index, size, sample_flood_probabilities)
+            headers["ETag"] = f'"{z}-{x}-{y_index}-{size}-{version}"'
+            return Response(content=png, media_type="image/png", headers=headers)
+
+        intensities, version = get_tile_intensities(z, x, y_index, size, sample_flood_probabilities)
+        origin_lat, origin_lon, lat_step, lon_step = tile_grid_geometry(z, x, y_index, size)
+        response = encode_grid_response(
+            encoding, intensities, origin_lat, origin_lon, lat_step, lon_step, dtype,
+            extra={"tile": {"z": z, "x": x, "y": y_index}, "version": version}
+        )
+        if encoding == "grid":
+            response = TimedJSONResponse(response)
+        response.headers.update(headers)
+        response.headers["ETag"] = f'"{z}-{x}-{y_index}-{size}-{version}-{encoding}"'
+        return response
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Tile rendering failed: %s", e)
+        raise HTTPException(status_code=500, detail="Tile rendering failed")
+
+
+@app.get("/tiles/stats")
+def tile_stats():
+    """Tile and point-sample cache statistics."""
+    return tile_cache_stats()
+
+
+# --------------------------------------------------
+# Background Jobs
+# --------------------------------------------------
+job_queue = JobQueue(workers=2, max_pending=100, result_ttl=3600)
+
+# Weather lookups in flight per all-city job
+CITY_JOB_CONCURRENCY = 16
+MAX_SWEEP_COMBINATIONS = 1_000_000
+SWEEP_CHUNK_ROWS = 100_000
+
+
+def multi_city_job(ctx: JobContext, cities: List[str]):
+    """Predictions for any number of cities (no per-request cap)."""
+    if not isinstance(cities, list) or not cities:
+        raise ValueError("cities must be a non-empty list")
+    results = []
+    with ThreadPoolExecutor(max_workers=CITY_JOB_CONCURRENCY) as pool:
+        for offset in range(0, len(cities), CITY_JOB_CONCURRENCY):
+            ctx.check_cancelled()
+            batch = cities[offset:offset + CITY_JOB_CONCURRENCY]
+            for predictions in pool.map(lambda city: get_multiple_cities_predictions([city]), batch):
+                results.extend(predictions)
+            ctx.report(len(results), len(cities))
+    return {"cities": results}
+
+
+def backtest_job(ctx: JobContext, start: Optional[str] = None, end: Optional[str] = None):
+    for event in run_backtest(start=start, end=end):
+        ctx.check_cancelled()
+        if event["event"] == "progress":
+            ctx.report(event["rows_scored"], event["rows_total"],
+                       f"{event['site']} ({event['site_index']}/{event['sites']})")
+        else:
+            return event
+
+
+def heatmap_job(ctx: JobContext, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                grid_size: int = 256, coarse: int = 4, tolerance: float = 0.1, max_samples: int = 400,
+                interp: str = "bilinear", dtype: str = "uint8"):
+    """
+    Adaptive heatmap for large boxes (e.g. a whole country), beyond the
+    synchronous endpoint's limits. Returns the compact grid encoding.
+    """
+    if not 2 <= grid_size <= 2048:
+        raise ValueError("grid_size must be between 2 and 2048")
+    if not 4 <= max_samples <= 5000:
+        raise ValueError("max_samples must be between 4 and 5000")
+    if interp not in ("bilinear", "idw", "rbf"):
+        raise ValueError("interp must be one of bilinear, idw, rbf")
+
+    sampler = AdaptiveSampler(min_lat, min_lon, max_lat, max_lon,
+                              coarse=coarse, tolerance=tolerance, max_samples=max_samples)
+    version = weather_snapshot_version()
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_WEATHER) as pool:
+        def sample_batch(points: List) -> np.ndarray:
+            # Fetch each refinement round's weather concurrently, score it in one call
+            weathers = list(pool.map(lambda point: fetch_live_weather(*point), points))
+            return score_live_weather(points, weathers)
+
+        sample_fn = cached_sampler(sample_batch, version)
+        while not sampler.done:
+            ctx.check_cancelled()
+            sampler.add_results(sample_fn(sampler.pending()))
+            ctx.report(sampler.samples_used, max_samples, f"refinement round {sampler.rounds}")
+
+    lats, lons = grid_cell_centers(min_lat, min_lon, max_lat, max_lon, grid_size)
+    if interp == "bilinear":
+        intensities = sampler.interpolate(lats, lons)
+    else:
+        samples = cached_samples_within(min_lat, min_lon, max_lat, max_lon, version) or sampler.samples()
+        intensities = interpolate_grid(samples, lats, lons, method=interp)
+
+    lat_step = (max_lat - min_lat) / grid_size
+    lon_step = (max_lon - min_lon) / grid_size
+    return encode_grid_response(
+        "grid", np.clip(intensities, 0.0, 1.0),
+        min_lat + 0.5 * lat_step, min_lon + 0.5 * lon_step, lat_step, lon_step, dtype,
+        extra={"grid_size": grid_size, "samples_used": sampler.samples_used,
+               "refinement_rounds": sampler.rounds, "interp": interp}
+    )
+
+
+def sweep_job(ctx: JobContext, base: Dict[str, float], vary: Dict[str, List[float]]):
+    """
+    Score the cartesian product of `vary` values (WeatherInput fields) on top
+    of a `base` WeatherInput. Probabilities come back as a nested list with
+    one axis per varied field, in `vary` order.
+    """
+    base_row = np.array([getattr(WeatherInput(**base), name) for name in WEATHER_FIELDS], dtype=np.float64)
+    unknown = [name for name in vary if name not in WEATHER_FIELDS]
+    if unknown or not vary:
+        raise ValueError(f"vary must map WeatherInput fields to value lists; unknown: {unknown}")
+    axes = [np.asarray(values, dtype=np.float64) for values in vary.values()]
+    shape = tuple(len(axis) for axis in axes)
+    total = int(np.prod(shape))
+    if total == 0 or total > MAX_SWEEP_COMBINATIONS:
+        raise ValueError(f"Sweep must have between 1 and {MAX_SWEEP_COMBINATIONS} combinations")
+
+    columns = [WEATHER_FIELDS.index(name) for name in vary]
+    grids = np.meshgrid(*axes, indexing="ij")
+    probabilities = np.empty(total, dtype=np.float64)
+    for offset in range(0, total, SWEEP_CHUNK_ROWS):
+        ctx.check_cancelled()
+        chunk = slice(offset, min(offset + SWEEP_CHUNK_ROWS, total))
+        features = np.tile(base_row, (chunk.stop - chunk.start, 1))
+        for column, grid in zip(columns, grids):
+            features[:, column] = grid.ravel()[chunk]
+        probabilities[chunk] = inference_pool.predict(features)
+        ctx.report(chunk.stop, total)
+
+    return {
+        "fields": list(vary),
+        "values": [axis.tolist() for axis in axes],
+        "shape": list(shape),
+        "probabilities": np.round(probabilities, 6).reshape(shape).tolist()
+    }
+
+
+job_queue.register("multi_city", multi_city_job)
+job_queue.register("backtest", backtest_job)
+job_queue.register("heatmap", heatmap_job)
+job_queue.register("sweep", sweep_job)
+
+
+def get_job_or_404(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+def submit_job(data: JobRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Submit a long-running job and get its id back.
+
+    Kinds: multi_city {cities}, backtest {start, end}, heatmap {min_lat, min_lon,
+    max_lat, max_lon, grid_size, ...}, sweep {base, vary}.
+    Lower priority numbers run first.
+    """
+    if data.kind in ADMIN_JOB_KINDS and not admin_authorized(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    try:
+        job = job_queue.submit(data.kind, data.params, data.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+
+@app.get("/jobs")
+def list_jobs():
+    """All retained jobs (newest first), available kinds and queue counters."""
+    return {
+        "kinds": job_queue.kinds,
+        **job_queue.stats(),
+        "items": [job.to_dict() for job in job_queue.list()]
+    }
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """Result of a finished job; 409 while it is still queued or running."""
+    job = get_job_or_404(job_id)
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return TimedJSONResponse(job.to_dict(include_result=True))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream job status as NDJSON on every progress change until it finishes.
+    Subscribers wait on the event loop, so they hold no threads between updates.
+    """
+    get_job_or_404(job_id)
+
+    async def events():
+        version = -1
+        while True:
+            job = await job_queue.wait_async(job_id, version, timeout=15)
+            if job is None:
+                yield json.dumps({"job_id": job_id, "status": "expired"}) + "\n"
+                return
+            # Emits a heartbeat line (unchanged version) when nothing happened
+            yield json.dumps(job.to_dict()) + "\n"
+            version = job.version
+            if job.finished:
+                return
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    get_job_or_404(job_id)
+    return job_queue.cancel(job_id).to_dict()
+
+
+# --------------------------------------------------
+# Model Registry
+# --------------------------------------------------
+def model_reload_job(ctx: JobContext, filename: Optional[str] = None, activate: bool = True):
+    """Load, verify and warm a native model artifact, then swap it in."""
+    ctx.report(0, 1, f"loading {filename or 'default artifact'}")
+    try:
+        mv = reload_model(filename, activate=activate)
+    except ArtifactError as e:
+        raise ValueError(str(e))
+    ctx.report(1, 1, f"model {mv.version} {'active' if activate else 'loaded'}")
+    return {**mv.info(), "active": model_registry.active is mv}
+
+
+job_queue.register("model_reload", model_reload_job)
+# Job kinds that change what production serves: admin only, even via POST /jobs
+ADMIN_JOB_KINDS = {"model_reload"}
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency of the model management routes: 403 without a valid X-Admin-Token."""
+    if not admin_authorized(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.get("/models")
+def list_models():
+    """Loaded model versions; `active` serves new requests."""
+    return {"active": model_registry.active.version, "versions": model_registry.versions()}
+
+
+@app.post("/models/reload", status_code=202, dependencies=[Depends(require_admin)])
+def reload_model_endpoint(filename: Optional[str] = None, activate: bool = True):
+    """
+    Load a native artifact from the model directory in the background (as a
+    top-priority job), warm it and its SHAP explainer, then swap it in. The
+    current model keeps serving until the swap; poll /jobs/{job_id}.
+    """
+    try:
+        job = job_queue.submit("model_reload", {"filename": filename, "activate": activate}, priority=0)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+
+@app.post("/models/{version}/activate", dependencies=[Depends(require_admin)])
+def activate_model(version: str):
+    """Swap in an already loaded version."""
+    try:
+        return model_registry.activate(version).info()
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/models/rollback", dependencies=[Depends(require_admin)])
+def rollback_model():
+    """Reactivate the previously active version."""
+    try:
+        return model_registry.rollback().info()
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/models/shadow")
+def shadow_stats():
+    """Production vs. candidate disagreement statistics per risk band."""
+    return shadow_scorer.stats()
+
+
+@app.post("/models/shadow", dependencies=[Depends(require_admin)])
+def start_shadow(
+    version: str,
+    sample_rate: Optional[float] = Query(None, ge=0.0, le=1.0, description="Fraction of requests also scored by the candidate")
+):
+    """
+    Shadow-score a sample of /predict and /predict/live traffic with a loaded,
+    inactive version (see POST /models/reload?activate=false). Candidate
+    scoring runs batched in the background and never delays responses.
+    """
+    try:
+        shadow_scorer.start(version, sample_rate)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return shadow_scorer.stats()
+
+
+@app.delete("/models/shadow", dependencies=[Depends(require_admin)])
+def stop_shadow():
+    shadow_scorer.stop()
+    return shadow_scorer.stats()
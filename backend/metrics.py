@@ -0,0 +1,443 @@
+"""
+Metrics Module
+Prometheus-style counters, gauges and histograms, rendered in the text
+exposition format by GET /metrics.
+
+Recording is lock-free on the hot path: every thread increments its own
+shard of each metric (a plain list only that thread writes), and a scrape
+sums the shards. A lock is taken only the first time a thread touches a
+metric or a new label combination appears. Shards of exited threads are
+folded into a retired total, so pool churn doesn't grow the shard lists.
+
+Besides HTTP request counts and latencies (MetricsMiddleware), the app
+records stage timings (`stage()`): geocoding, weather and forecast fetches
+(`upstream()`, which also counts outcomes and in-flight calls), model
+predict, SHAP and JSON serialization, so slow percentiles can be attributed
+to Open-Meteo, XGBoost or SHAP. Stages are also recorded as spans of the
+current request trace (see tracing). Values that already live elsewhere (cache
+counters, admission queues) are read at scrape time by collectors.
+"""
+import asyncio
+import functools
+import itertools
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+import tracing
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (name, type, help, [(labels, value), ...]) as produced by collectors
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class _Shards:
+    """
+    Per-thread value arrays; each thread writes only its own. When a thread
+    exits, its shard is folded into a retired total, so threads from
+    short-lived pools don't pile up shards that every scrape has to sum.
+    """
+
+    def __init__(self, size: int, lock: threading.Lock):
+        self._size = size
+        self._lock = lock
+        self._local = threading.local()
+        self._keys = itertools.count()
+        self._live: Dict[int, List[float]] = {}
+        self._dead: List[int] = []
+        self._retired = [0.0] * size
+
+    def local(self) -> List[float]:
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = [0.0] * self._size
+            key = next(self._keys)
+            # The owner lives exactly as long as this thread's local storage
+            owner = self._local.owner = _ShardOwner()
+            finalizer = weakref.finalize(owner, self._dead.append, key)
+            finalizer.atexit = False
+            with self._lock:
+                self._fold_dead()
+                self._live[key] = values
+            self._local.values = values
+        return values
+
+    def _fold_dead(self):
+        # Called with the lock held. The finalizer only queues the key, since
+        # it may run on any thread, including one already holding the lock.
+        while self._dead:
+            for i, value in enumerate(self._live.pop(self._dead.pop())):
+                self._retired[i] += value
+
+    def total(self) -> List[float]:
+        with self._lock:
+            self._fold_dead()
+            shards = [self._retired, *self._live.values()]
+            return [sum(column) for column in zip(*shards)]
+
+    def __len__(self) -> int:
+        """Live (per-thread) shards."""
+        with self._lock:
+            self._fold_dead()
+            return len(self._live)
+
+
+class _ShardOwner:
+    """Per-thread sentinel whose collection retires the thread's shard."""
+    __slots__ = ("__weakref__",)
+
+
+class _CounterChild:
+    def __init__(self, lock):
+        self._shards = _Shards(1, lock)
+
+    def inc(self, amount: float = 1.0):
+        self._shards.local()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        self._shards.local()[0] -= amount
+
+
+class _HistogramChild:
+    def __init__(self, lock, buckets: Sequence[float]):
+        self._buckets = buckets
+        # One slot per bucket, one for +Inf, then the sum
+        self._shards = _Shards(len(buckets) + 2, lock)
+
+    def observe(self, value: float):
+        values = self._shards.local()
+        values[bisect_left(self._buckets, value)] += 1
+        values[-1] += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def value(self) -> Tuple[List[float], float]:
+        """(cumulative bucket counts including +Inf, sum)"""
+        totals = self._shards.total()
+        cumulative, running = [], 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1]
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Metric:
+    """A metric family; `labels(...)` returns the child for one label combination."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), **options):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._options = options
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def __getattr__(self, attr):
+        # Unlabelled metrics record directly: counter.inc(), histogram.observe(...)
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._default, attr)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            children = list(self._children.items())
+        out = []
+        for values, child in children:
+            out.extend(self._child_samples(dict(zip(self.labelnames, values)), child))
+        return out
+
+    def _child_samples(self, labels: Dict[str, str], child) -> List[Tuple[str, Dict[str, str], float]]:
+        return [(self.name, labels, child.value())]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild(self._lock)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self._options.get("buckets", DEFAULT_BUCKETS))
+
+    def _child_samples(self, labels, child):
+        buckets = list(self._options.get("buckets", DEFAULT_BUCKETS)) + [float("inf")]
+        cumulative, total = child.value()
+        out = [(f"{self.name}_bucket", {**labels, "le": _format_value(le)}, count)
+               for le, count in zip(buckets, cumulative)]
+        out.append((f"{self.name}_sum", labels, total))
+        out.append((f"{self.name}_count", labels, cumulative[-1]))
+        return out
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets=tuple(buckets)))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Add a callable returning metric families, evaluated on every scrape."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "flood_http_requests_total", "HTTP requests by route template and status", ["method", "route", "status"])
+http_request_seconds = registry.histogram(
+    "flood_http_request_duration_seconds", "HTTP request latency (including streamed bodies)", ["route"])
+http_in_flight = registry.gauge("flood_http_requests_in_flight", "HTTP requests being served")
+stage_seconds = registry.histogram(
+    "flood_stage_duration_seconds",
+    "Time spent per processing stage (geocode, weather, forecast, predict, shap, serialize)", ["stage"])
+upstream_requests = registry.counter(
+    "flood_upstream_requests_total", "Upstream API calls by service and outcome", ["service", "outcome"])
+upstream_in_flight = registry.gauge("flood_upstream_requests_in_flight", "Upstream API calls in progress", ["service"])
+
+
+class _StageTimer:
+    __slots__ = ("_name", "_child", "_start")
+
+    def __init__(self, name: str, child: _HistogramChild):
+        self._name = name
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self._child.observe(end - self._start)
+        tracing.record(self._name, self._start, end)
+
+
+def stage(name: str) -> _StageTimer:
+    """Context manager timing one stage: `with stage("predict"): ...`"""
+    return _StageTimer(name, stage_seconds.labels(name))
+
+
+def timed(name: str):
+    """Decorator timing every call of a (sync or async) function as a stage."""
+    def decorate(fn):
+        child = stage_seconds.labels(name)
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _StageTimer(name, child):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _StageTimer(name, child):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class upstream:
+    """
+    Context manager around one upstream call: times it as a stage, tracks
+    in-flight calls and counts the outcome (ok/error) per service.
+    """
+    __slots__ = ("_service", "_start")
+
+    def __init__(self, service: str):
+        self._service = service
+
+    def __enter__(self):
+        upstream_in_flight.labels(self._service).inc()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        stage_seconds.labels(self._service).observe(end - self._start)
+        tracing.record(self._service, self._start, end)
+        upstream_in_flight.labels(self._service).dec()
+        upstream_requests.labels(self._service, "ok" if exc_type is None else "error").inc()
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records its rendering time as the `serialize` stage."""
+
+    def render(self, content: Any) -> bytes:
+        with stage("serialize"):
+            return super().render(content)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and observing latency per route
+    template (e.g. /tiles/{z}/{x}/{y}), so raw paths never become labels.
+    """
+
+    def __init__(self, app, router=None):
+        self.app = app
+        self.router = router
+
+    def _route(self, scope) -> str:
+        route = scope.get("route")
+        if route is None and self.router is not None:
+            # Rejected before routing (e.g. by admission control)
+            for candidate in self.router.routes:
+                if candidate.matches(scope)[0] == Match.FULL:
+                    route = candidate
+                    break
+        return getattr(route, "path", None) or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            route = self._route(scope)
+            http_requests.labels(scope["method"], route, str(status)).inc()
+            http_request_seconds.labels(route).observe(elapsed)
+
+
+def cache_families(caches: Iterable[Dict[str, Any]]) -> List[Family]:
+    """Metric families for LRUCache.stats() dicts."""
+    stats = list(caches)
+    return [
+        ("flood_cache_hits_total", "counter", "Cache hits", [({"cache": s["name"]}, s["hits"]) for s in stats]),
+        ("flood_cache_misses_total", "counter", "Cache misses", [({"cache": s["name"]}, s["misses"]) for s in stats]),
+        ("flood_cache_hit_ratio", "gauge", "Cache hit ratio since start", [({"cache": s["name"]}, s["hit_ratio"]) for s in stats]),
+        ("flood_cache_entries", "gauge", "Cached entries", [({"cache": s["name"]}, s["size"]) for s in stats]),
+        ("flood_cache_max_entries", "gauge", "Cache capacity", [({"cache": s["name"]}, s["maxsize"]) for s in stats]),
+    ]
+
+
+def admission_families(stats: Dict[str, Dict[str, Any]]) -> List[Family]:
+    """Metric families for AdmissionController.stats()."""
+    def per_class(key):
+        return [({"class": name}, s[key]) for name, s in stats.items()]
+
+    rejected = [({"class": name, "reason": "queue_full"}, s["rejected_queue_full"]) for name, s in stats.items()]
+    rejected += [({"class": name, "reason": "timeout"}, s["rejected_timeout"]) for name, s in stats.items()]
+    return [
+        ("flood_admission_limit", "gauge", "Concurrent requests allowed per endpoint class", per_class("limit")),
+        ("flood_admission_queue_depth", "gauge", "Queue capacity per endpoint class", per_class("queue_depth")),
+        ("flood_admission_active", "gauge", "Requests being served per endpoint class", per_class("active")),
+        ("flood_admission_queued", "gauge", "Requests waiting per endpoint class", per_class("queued")),
+        ("flood_admission_admitted_total", "counter", "Requests admitted per endpoint class", per_class("admitted")),
+        ("flood_admission_rejected_total", "counter", "Requests shed per endpoint class and reason", rejected),
+    ]
@@ -0,0 +1,146 @@
+"""
+Model Artifact Module
+Native XGBoost model artifacts with a verified sidecar manifest.
+
+The model is stored in XGBoost's own UBJSON (or JSON) booster format, which
+loads without unpickling arbitrary code and across xgboost/scikit-learn
+versions. Next to it, a manifest records the feature names, the decision
+threshold, the xgboost version that wrote it and the SHA-256 of the model
+file; loading refuses a model whose checksum or features do not match.
+
+Export the notebook's pickle once:
+    python model_artifact.py export [--pickle xgboost_flood_model.pkl] [--threshold 0.5]
+Verify an artifact:
+    python model_artifact.py verify [xgboost_flood_model.ubj]
+"""
+import argparse
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = Path(__file__).parent
+PICKLE_PATH = MODEL_DIR / "xgboost_flood_model.pkl"
+NATIVE_MODEL_PATH = MODEL_DIR / "xgboost_flood_model.ubj"
+DEFAULT_THRESHOLD = 0.5
+
+
+class ArtifactError(Exception):
+    """Raised when a model artifact is missing, corrupt or inconsistent."""
+
+
+def manifest_path_for(model_path) -> Path:
+    """Sidecar manifest location: <model file>.manifest.json"""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.name + ".manifest.json")
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_model(model, path=NATIVE_MODEL_PATH, threshold: float = DEFAULT_THRESHOLD,
+                 feature_names: Optional[Sequence[str]] = None, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Save an XGBClassifier in native format (UBJSON for .ubj, JSON for .json)
+    and write its manifest. Returns the manifest.
+    """
+    import xgboost as xgb
+
+    path = Path(path)
+    model.save_model(str(path))
+    if feature_names is None:
+        feature_names = getattr(model, "feature_names_in_", None)
+    if feature_names is None:
+        feature_names = model.get_booster().feature_names or []
+    names = [str(n) for n in feature_names]
+    manifest = {
+        "model_file": path.name,
+        "format": "ubj" if path.suffix == ".ubj" else "json",
+        "sha256": file_sha256(path),
+        "feature_names": names,
+        "threshold": threshold,
+        "xgboost_version": xgb.__version__,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **(extra or {})
+    }
+    with open(manifest_path_for(path), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(path=NATIVE_MODEL_PATH) -> Dict[str, Any]:
+    manifest_path = manifest_path_for(path)
+    if not manifest_path.exists():
+        raise ArtifactError(f"Manifest not found: {manifest_path}")
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def verify_artifact(path=NATIVE_MODEL_PATH) -> Dict[str, Any]:
+    """Check the model file against its manifest checksum. Returns the manifest."""
+    path = Path(path)
+    if not path.exists():
+        raise ArtifactError(f"Model file not found: {path}")
+    manifest = read_manifest(path)
+    actual = file_sha256(path)
+    if actual != manifest.get("sha256"):
+        raise ArtifactError(f"Checksum mismatch for {path.name}: expected {manifest.get('sha256')}, got {actual}")
+    return manifest
+
+
+def load_native_model(path=NATIVE_MODEL_PATH) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Load a verified native model as an XGBClassifier.
+
+    Returns:
+        (model, manifest)
+    """
+    import xgboost as xgb
+
+    manifest = verify_artifact(path)
+    model = xgb.XGBClassifier()
+    model.load_model(str(path))
+    names = model.get_booster().feature_names
+    if names is not None and list(names) != manifest["feature_names"]:
+        raise ArtifactError(f"Feature names in {Path(path).name} do not match its manifest")
+    return model, manifest
+
+
+def load_pickled_model(path=PICKLE_PATH):
+    """Legacy joblib/pickle artifact from the training notebook (trusted files only)."""
+    import pickle
+
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or verify native model artifacts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Convert the pickled model to native format + manifest")
+    export.add_argument("--pickle", default=str(PICKLE_PATH), help="Pickled XGBClassifier")
+    export.add_argument("-o", "--output", default=str(NATIVE_MODEL_PATH), help="Output model (.ubj or .json)")
+    export.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Decision threshold")
+    verify = sub.add_parser("verify", help="Verify a native model against its manifest")
+    verify.add_argument("model", nargs="?", default=str(NATIVE_MODEL_PATH))
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        manifest = export_model(load_pickled_model(args.pickle), args.output, args.threshold)
+        print(f"Wrote {args.output} (sha256 {manifest['sha256'][:12]}...) and {manifest_path_for(args.output).name}")
+    else:
+        model, manifest = load_native_model(args.model)
+        print(f"OK: {args.model} ({len(manifest['feature_names'])} features, threshold {manifest['threshold']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,270 @@
-import pickle
 import os
 import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
 import numpy as np
 
-logging.basicConfig(level=logging.INFO)
+from metrics import timed
+from tracing import span
+from structured_logging import SampledLog
+from model_artifact import NATIVE_MODEL_PATH, DEFAULT_THRESHOLD, file_sha256, load_native_model, load_pickled_model
+
 logger = logging.getLogger(__name__)
+# predict() runs once per row in some callers: never log every call
+_predict_log = SampledLog(logger, every=1000, per_second=1)
+# Error conditions are never sampled, only rate limited (with a suppressed count)
+_nan_log = SampledLog(logger, per_second=5)
 
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "xgboost_flood_model.pkl")
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
 
-with open(MODEL_PATH, "rb") as f:
-    flood_model = pickle.load(f)
 
-logger.info("Expected features: %s", getattr(flood_model, "feature_names_in_", None))
+class ModelVersion:
+    """One loaded model with its manifest and (lazily built) SHAP explainer."""
 
-# Initialize SHAP TreeExplainer for XGBoost model.
-# NOTE: importing `shap` can transitively import `cv2` (OpenCV). If the user's
-# NumPy/OpenCV wheels are mismatched, importing at module import-time can crash
-# uvicorn's reload subprocess. We therefore lazy-load SHAP on demand.
-shap_explainer = None
-_shap_init_error = None
+    def __init__(self, model, manifest: Dict[str, Any], path: str):
+        self.model = model
+        self.manifest = manifest
+        self.path = path
+        # Content-addressed: the same artifact always gets the same version
+        self.version = manifest["sha256"][:12]
+        self.loaded_at = time.time()
+        self._explainer = None
+        self._explainer_error: Optional[Exception] = None
+        self._lock = threading.Lock()
 
+    def explainer(self):
+        """
+        SHAP TreeExplainer for this model, built on first use.
+        NOTE: importing `shap` can transitively import `cv2` (OpenCV). If the
+        user's NumPy/OpenCV wheels are mismatched, importing at module
+        import-time can crash uvicorn's reload subprocess, so SHAP is only
+        imported here.
+        """
+        if self._explainer is not None:
+            return self._explainer
+        with self._lock:
+            if self._explainer is None:
+                if self._explainer_error is not None:
+                    raise self._explainer_error
+                try:
+                    with span("shap_explainer_init"):
+                        import shap  # type: ignore
+                        self._explainer = shap.TreeExplainer(self.model)
+                    logger.info("SHAP TreeExplainer initialized for model %s", self.version)
+                except Exception as e:
+                    self._explainer_error = e
+                    logger.warning("Failed to initialize SHAP TreeExplainer: %s", e)
+                    raise
+        return self._explainer
 
-def _get_shap_explainer():
-    global shap_explainer, _shap_init_error
-    if shap_explainer is not None:
-        return shap_explainer
-    if _shap_init_error is not None:
-        raise _shap_init_error
+    def warm(self):
+        """Run one prediction and build the explainer so the first request is not cold."""
+        n_features = len(self.manifest.get("feature_names") or []) or 9
+        self.model.predict_proba(np.zeros((1, n_features), dtype=np.float32))
+        try:
+            self.explainer()
+        except Exception:
+            pass
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "model_file": self.manifest.get("model_file"),
+            "format": self.manifest.get("format"),
+            "sha256": self.manifest.get("sha256"),
+            "threshold": self.manifest.get("threshold", DEFAULT_THRESHOLD),
+            "loaded_at": self.loaded_at
+        }
+
+
+class ModelRegistry:
+    """
+    Loaded model versions, the active one, and activation history.
+
+    Swapping the active version is a single reference assignment, so
+    readers never see a half-loaded model. Requests pin the version that
+    was active when they started (see pinned()), so a swap never changes
+    the model under an in-flight request.
+    """
+
+    def __init__(self, keep: int = 5):
+        self.keep = keep
+        self._versions: "OrderedDict[str, ModelVersion]" = OrderedDict()
+        self._active: Optional[ModelVersion] = None
+        self._history: List[str] = []
+        self._lock = threading.Lock()
+        self._pinned: ContextVar[Optional[ModelVersion]] = ContextVar("pinned_model", default=None)
+        # XGBoost threads for every loaded model (None = xgboost default)
+        self.n_jobs: Optional[int] = None
+
+    @property
+    def active(self) -> ModelVersion:
+        return self._active
+
+    def current(self) -> ModelVersion:
+        """The model version pinned for this request/context, else the active one."""
+        return self._pinned.get() or self._active
 
+    @contextmanager
+    def pinned(self, version: Optional[ModelVersion] = None):
+        """Pin a model version (default: the active one) for the enclosed work."""
+        token = self._pinned.set(version or self._active)
+        try:
+            yield self._pinned.get()
+        finally:
+            self._pinned.reset(token)
+
+    def get(self, version: str) -> Optional[ModelVersion]:
+        return self._versions.get(version)
+
+    def versions(self) -> List[Dict[str, Any]]:
+        active = self._active.version if self._active else None
+        return [{**mv.info(), "active": mv.version == active} for mv in self._versions.values()]
+
+    def set_n_jobs(self, n_jobs: int):
+        """Limit XGBoost threads for loaded and future versions."""
+        with self._lock:
+            self.n_jobs = n_jobs
+            for mv in self._versions.values():
+                mv.model.set_params(n_jobs=n_jobs)
+
+    def register(self, mv: ModelVersion) -> ModelVersion:
+        with self._lock:
+            existing = self._versions.get(mv.version)
+            if existing is not None:
+                return existing
+            if self.n_jobs is not None:
+                mv.model.set_params(n_jobs=self.n_jobs)
+            self._versions[mv.version] = mv
+            # Evict the oldest versions that are neither active nor the rollback target
+            protected = {mv.version, self._active.version if self._active else None, *self._history[-1:]}
+            for version in list(self._versions):
+                if len(self._versions) <= self.keep:
+                    break
+                if version not in protected:
+                    del self._versions[version]
+            return mv
+
+    def load(self, path=NATIVE_MODEL_PATH, warm: bool = True) -> ModelVersion:
+        """Load and verify a native artifact and register it (not yet active)."""
+        model, manifest = load_native_model(path)
+        mv = self.get(manifest["sha256"][:12])
+        if mv is not None:
+            return mv
+        mv = self.register(ModelVersion(model, manifest, str(path)))
+        if warm:
+            mv.warm()
+        logger.info("Loaded model version %s from %s", mv.version, path)
+        return mv
+
+    def get_or_load(self, version: str, path: str) -> ModelVersion:
+        """Version by id, loading it from `path` if this process does not have it yet."""
+        mv = self.get(version)
+        if mv is None:
+            mv = self.load(path, warm=False)
+            if mv.version != version:
+                raise ValueError(f"Artifact {path} is version {mv.version}, expected {version}")
+        return mv
+
+    def activate(self, version: str) -> ModelVersion:
+        with self._lock:
+            mv = self._versions.get(version)
+            if mv is None:
+                raise KeyError(f"Unknown model version '{version}'")
+            if self._active is not None and self._active.version != version:
+                self._history.append(self._active.version)
+            self._active = mv
+        logger.info("Activated model version %s", version)
+        return mv
+
+    def rollback(self) -> ModelVersion:
+        """Reactivate the previously active version."""
+        with self._lock:
+            while self._history:
+                previous = self._history.pop()
+                if previous in self._versions:
+                    self._active = self._versions[previous]
+                    logger.info("Rolled back to model version %s", previous)
+                    return self._active
+        raise ValueError("No previous model version to roll back to")
+
+
+def _load_initial() -> ModelVersion:
+    """
+    Load the verified native model (see model_artifact); fall back to the
+    legacy pickle only if the native artifact is missing or fails checks.
+    """
     try:
-        import shap  # type: ignore
-        shap_explainer = shap.TreeExplainer(flood_model)
-        logger.info("SHAP TreeExplainer initialized successfully")
-        return shap_explainer
+        return registry.load(NATIVE_MODEL_PATH, warm=False)
     except Exception as e:
-        _shap_init_error = e
-        logger.warning("Failed to initialize SHAP TreeExplainer: %s", e)
-        raise
+        logger.warning("Native model unavailable (%s); falling back to pickle %s", e, MODEL_PATH)
+    model = load_pickled_model(MODEL_PATH)
+    names = getattr(model, "feature_names_in_", None)
+    manifest = {
+        "model_file": os.path.basename(MODEL_PATH),
+        "format": "pickle",
+        "sha256": file_sha256(MODEL_PATH),
+        "feature_names": [str(n) for n in names] if names is not None else None,
+        "threshold": DEFAULT_THRESHOLD
+    }
+    return registry.register(ModelVersion(model, manifest, MODEL_PATH))
+
+
+registry = ModelRegistry()
+registry.activate(_load_initial().version)
+
+logger.info("Expected features: %s", getattr(registry.active.model, "feature_names_in_", None))
+
+
+def _model():
+    return registry.current().model
+
+
+def _get_shap_explainer():
+    return registry.current().explainer()
+
+
+def get_model_version() -> str:
+    """Version id of the model serving the current request."""
+    return registry.current().version
+
+
+def get_model_info():
+    """Manifest of the current model (file, format, checksum, features, threshold)."""
+    mv = registry.current()
+    return {**mv.manifest, "version": mv.version}
+
+
+def reload_model(filename: Optional[str] = None, activate: bool = True) -> ModelVersion:
+    """
+    Load a native artifact from the model directory in the calling thread,
+    warm it and its explainer, then (optionally) swap it in atomically.
+    """
+    name = os.path.basename(filename or NATIVE_MODEL_PATH.name)
+    mv = registry.load(os.path.join(MODEL_DIR, name))
+    if activate:
+        registry.activate(mv.version)
+    return mv
 
 
 def get_feature_names():
     """Get feature names in the correct order used for training"""
     # Try scikit-learn API
-    names = getattr(flood_model, "feature_names_in_", None)
+    names = getattr(_model(), "feature_names_in_", None)
     if names is not None:
         return [str(n) for n in names]
 
     # Try xgboost booster
     try:
-        booster = getattr(flood_model, "get_booster", None)
+        booster = getattr(_model(), "get_booster", None)
         if booster:
-            b = flood_model.get_booster()
+            b = _model().get_booster()
             fmap = b.feature_names
             if fmap:
                 return [str(n) for n in fmap]
@@ -61,6 +275,7 @@ def get_feature_names():
     return ['T2M', 'T2M_MAX', 'T2M_MIN', 'PS', 'PRECTOTCORR', 'RH2M', 'WS2M', 'rain_anomaly', 'temp_anomaly']
 
 
+@timed("predict")
 def predict(features):
     """
     features: 2D numpy array
@@ -71,9 +286,7 @@ def predict(features):
         if arr.ndim == 1:
             arr = arr.reshape(1, -1)
 
-        logger.info("Model input features: %s", arr.tolist())
-
-        proba = flood_model.predict_proba(arr)
+        proba = _model().predict_proba(arr)
         # Defensive checks
         if proba is None:
             logger.warning("predict_proba returned None")
@@ -85,20 +298,42 @@ def predict(features):
 
         prob = float(proba[0][1])
         if np.isnan(prob):
-            logger.warning("predict_proba returned NaN")
+            _nan_log.warning("predict_proba returned NaN for input %s", arr)
             return 0.0
 
-        logger.info("Predicted probability: %s", prob)
+        _predict_log.debug("Model input features: %s -> probability %.4f", arr, prob)
         return prob
     except Exception as e:
         logger.exception("Error in model prediction: %s", e)
         return 0.0
 
 
+@timed("predict")
+def predict_batch(features):
+    """
+    features: 2D numpy array (n_rows, n_features)
+    Returns a 1D numpy array with the positive-class probability of every row,
+    scored in a single model call. NaN probabilities are mapped to 0.0.
+    """
+    arr = np.array(features, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    if arr.shape[0] == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    proba = _model().predict_proba(arr)
+    if proba.shape[1] < 2:
+        logger.warning("predict_proba returned unexpected shape: %s", proba.shape)
+        probs = proba[:, 0]
+    else:
+        probs = proba[:, 1]
+    return np.nan_to_num(probs.astype(np.float64), nan=0.0)
+
+
 def get_feature_importances(normalize=True):
     """Get global feature importances from the model"""
     # Prefer scikit-learn style attribute
-    fi = getattr(flood_model, "feature_importances_", None)
+    fi = getattr(_model(), "feature_importances_", None)
     if fi is not None:
         arr = list(map(float, fi))
         names = get_feature_names()
@@ -106,7 +341,7 @@ def get_feature_importances(normalize=True):
     else:
         # Try xgboost booster feature scores
         try:
-            b = flood_model.get_booster()
+            b = _model().get_booster()
             score = b.get_score(importance_type="weight")
             # score keys like 'f0', map to names
             names = get_feature_names()
@@ -127,6 +362,39 @@ def get_feature_importances(normalize=True):
     return mapping
 
 
+def _expected_value(explainer) -> float:
+    """Base value (expected model output) for the positive class."""
+    if not hasattr(explainer, 'expected_value'):
+        return 0.5
+    ev = explainer.expected_value
+    if isinstance(ev, (list, np.ndarray)) and np.ndim(ev) > 0:
+        return float(ev[1] if len(ev) > 1 else ev[0])
+    return float(ev)
+
+
+@timed("shap")
+def shap_values_batch(features):
+    """
+    SHAP values for many rows in one TreeExplainer call.
+
+    Returns:
+        (values, base_value): (n_rows, n_features) float64 array for the
+        positive class, and the explainer's expected value
+    """
+    explainer = _get_shap_explainer()
+    arr = np.array(features, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    values = explainer.shap_values(arr)
+    if isinstance(values, list):
+        values = values[1] if len(values) > 1 else values[0]
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values.reshape(1, -1)
+    return values, _expected_value(explainer)
+
+
+@timed("shap")
 def explain_instance_shap(features):
     """
     Use SHAP TreeExplainer to explain a single prediction.
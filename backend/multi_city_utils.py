@@ -2,20 +2,28 @@
 Multi-city utilities for flood risk visualization
 Provides functions to get city data with flood predictions
 """
-import re
-import requests
+import asyncio
 import pandas as pd
 import logging
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from city_loader import load_cities, search_cities
-from model_loader import predict
+from model_loader import predict, predict_batch
+from features import live_features
+from inference_pool import run_model
+from tracing import span
+from structured_logging import SampledLog
+from location_service import (
+    classify_risk, parse_coordinates, get_lat_lon, get_lat_lon_async,
+    fetch_live_weather, fetch_live_weather_async
+)
 import numpy as np
 
 logger = logging.getLogger(__name__)
-
-# Cache for city coordinates (geocoded on demand)
-_coordinates_cache: Dict[str, tuple] = {}
+# Per-city failures: an upstream outage would otherwise log once per city
+_geocode_failure_log = SampledLog(logger, per_second=5)
+_weather_failure_log = SampledLog(logger, per_second=5)
+_prediction_failure_log = SampledLog(logger, per_second=5)
 
 # Path to Cities.csv
 CSV_PATH = Path(__file__).parent.parent / "Cities.csv"
@@ -32,26 +40,27 @@ def get_city_coordinates(city_name: str) -> tuple:
     Returns:
         Tuple of (latitude, longitude) or None if not found
     """
-    # Check cache first
-    if city_name in _coordinates_cache:
-        return _coordinates_cache[city_name]
-    
     try:
-        url = f"https://geocoding-api.open-meteo.com/v1/search?name={city_name}&count=1&language=en"
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        
-        if "results" in data and len(data["results"]) > 0:
-            location = data["results"][0]
-            coords = (location["latitude"], location["longitude"])
-            _coordinates_cache[city_name] = coords
-            return coords
+        return get_lat_lon(city_name)
     except Exception as e:
-        logger.warning(f"Failed to geocode city {city_name}: {e}")
+        _geocode_failure_log.warning("Failed to geocode city %s: %s", city_name, e)
     
     return None
 
 
+# Used when live weather for a city cannot be fetched
+FALLBACK_WEATHER = {
+    "temperature": 25.0,
+    "humidity": 70.0,
+    "pressure": 1013.0,
+    "wind_speed": 5.0,
+    "rainfall": 0.0
+}
+
+# Cities looked up concurrently by the async variant
+MAX_CONCURRENT_CITIES = 10
+
+
 def fetch_live_weather_for_city(lat: float, lon: float) -> Dict[str, Any]:
     """
     Fetch live weather for given coordinates.
@@ -64,32 +73,42 @@ def fetch_live_weather_for_city(lat: float, lon: float) -> Dict[str, Any]:
         Dictionary with weather data
     """
     try:
-        url = (
-            "https://api.open-meteo.com/v1/forecast"
-            f"?latitude={lat}&longitude={lon}"
-            "&current=temperature_2m,relative_humidity_2m,"
-            "pressure_msl,wind_speed_10m,precipitation"
-        )
-        
-        response = requests.get(url, timeout=5)
-        data = response.json()["current"]
-        
-        return {
-            "temperature": data["temperature_2m"],
-            "humidity": data["relative_humidity_2m"],
-            "pressure": data["pressure_msl"],
-            "wind_speed": data["wind_speed_10m"],
-            "rainfall": data["precipitation"]
-        }
+        return fetch_live_weather(lat, lon)
     except Exception as e:
-        logger.warning(f"Failed to fetch weather for {lat},{lon}: {e}")
-        return {
-            "temperature": 25.0,
-            "humidity": 70.0,
-            "pressure": 1013.0,
-            "wind_speed": 5.0,
-            "rainfall": 0.0
-        }
+        _weather_failure_log.warning("Failed to fetch weather for %s,%s: %s", lat, lon, e)
+        return dict(FALLBACK_WEATHER)
+
+
+def _parse_city(city_name: str) -> Tuple[str, Optional[Tuple[float, float]]]:
+    """Display name and coordinates of a "lat,lon" string; coordinates are None for names."""
+    coords = parse_coordinates(city_name)
+    if coords is None:
+        return city_name, None
+    lat, lon = coords
+    return f"Location ({lat:.4f}, {lon:.4f})", coords
+
+
+def _unknown_city(city_name: str, error: str) -> Dict[str, Any]:
+    return {
+        "city": city_name,
+        "latitude": None,
+        "longitude": None,
+        "probability": 0.0,
+        "risk_level": "Unknown",
+        "error": error
+    }
+
+
+def _city_result(city_name: str, lat: float, lon: float, probability: float,
+                 weather: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "city": city_name,
+        "latitude": lat,
+        "longitude": lon,
+        "probability": round(probability, 3),
+        "risk_level": classify_risk(probability),
+        "weather": weather
+    }
 
 
 def get_flood_prediction_for_city(city_name: str) -> Dict[str, Any]:
@@ -103,74 +122,19 @@ def get_flood_prediction_for_city(city_name: str) -> Dict[str, Any]:
     Returns:
         Dictionary with prediction data including probability and risk level
     """
-    # Check if city_name is in coordinate format (e.g., "12.922, 77.505")
-    coord_pattern = r'^-?\d+\.?\d*\s*,\s*-?\d+\.?\d*$'
-    coords = None
-    
-    if re.match(coord_pattern, city_name.strip()):
-        # Parse coordinates directly
-        parts = [p.strip() for p in city_name.split(',')]
-        if len(parts) == 2:
-            try:
-                lat = float(parts[0])
-                lon = float(parts[1])
-                # Validate ranges
-                if -90 <= lat <= 90 and -180 <= lon <= 180:
-                    coords = (lat, lon)
-                    city_name = f"Location ({lat:.4f}, {lon:.4f})"
-            except ValueError:
-                pass
-    
-    # If not coordinates, try geocoding
+    city_name, coords = _parse_city(city_name)
     if coords is None:
         coords = get_city_coordinates(city_name)
-    
     if not coords:
-        return {
-            "city": city_name,
-            "latitude": None,
-            "longitude": None,
-            "probability": 0.0,
-            "risk_level": "Unknown",
-            "error": "Could not find city coordinates"
-        }
+        return _unknown_city(city_name, "Could not find city coordinates")
     
     lat, lon = coords
     weather = fetch_live_weather_for_city(lat, lon)
     
-    # Build feature vector for prediction
-    features = np.array([[
-        weather["temperature"],
-        weather["temperature"] + 2,  # T2M_MAX
-        weather["temperature"] - 2,  # T2M_MIN
-        weather["pressure"],
-        weather["rainfall"],
-        weather["humidity"],
-        weather["wind_speed"],
-        0.0,  # rain_anomaly
-        0.0   # temp_anomaly
-    ]])
-    
+    # Build feature vector for prediction (anomalies from the climatology table)
+    features = live_features(weather, lat, lon)
     probability = float(predict(features))
-    
-    # Classify risk
-    if probability < 0.25:
-        risk_level = "Low"
-    elif probability < 0.50:
-        risk_level = "Moderate"
-    elif probability < 0.75:
-        risk_level = "High"
-    else:
-        risk_level = "Critical"
-    
-    return {
-        "city": city_name,
-        "latitude": lat,
-        "longitude": lon,
-        "probability": round(probability, 3),
-        "risk_level": risk_level,
-        "weather": weather
-    }
+    return _city_result(city_name, lat, lon, probability, weather)
 
 
 def get_multiple_cities_predictions(city_names: List[str]) -> List[Dict[str, Any]]:
@@ -186,22 +150,73 @@ def get_multiple_cities_predictions(city_names: List[str]) -> List[Dict[str, Any
     results = []
     for city_name in city_names:
         try:
-            prediction = get_flood_prediction_for_city(city_name)
+            with span("city_prediction"):
+                prediction = get_flood_prediction_for_city(city_name)
             results.append(prediction)
         except Exception as e:
-            logger.error(f"Error getting prediction for {city_name}: {e}")
-            results.append({
-                "city": city_name,
-                "latitude": None,
-                "longitude": None,
-                "probability": 0.0,
-                "risk_level": "Unknown",
-                "error": str(e)
-            })
+            _prediction_failure_log.error("Error getting prediction for %s: %s", city_name, e)
+            results.append(_unknown_city(city_name, str(e)))
     
     return results
 
 
+async def _city_inputs_async(city_name: str) -> Tuple[str, Optional[Tuple[float, float]], Optional[Dict[str, Any]]]:
+    """Display name, coordinates and live weather of a city (coordinates None if not found)."""
+    city_name, coords = _parse_city(city_name)
+    if coords is None:
+        try:
+            coords = await get_lat_lon_async(city_name)
+        except Exception as e:
+            _geocode_failure_log.warning("Failed to geocode city %s: %s", city_name, e)
+    if not coords:
+        return city_name, None, None
+    lat, lon = coords
+    try:
+        weather = await fetch_live_weather_async(lat, lon)
+    except Exception as e:
+        _weather_failure_log.warning("Failed to fetch weather for %s,%s: %s", lat, lon, e)
+        weather = dict(FALLBACK_WEATHER)
+    return city_name, coords, weather
+
+
+def _score_cities(inputs: List[Tuple[Tuple[float, float], Dict[str, Any]]]) -> np.ndarray:
+    features = np.vstack([live_features(weather, lat, lon) for (lat, lon), weather in inputs])
+    return predict_batch(features)
+
+
+async def get_multiple_cities_predictions_async(city_names: List[str]) -> List[Dict[str, Any]]:
+    """
+    Async get_multiple_cities_predictions: cities are geocoded and their
+    weather fetched concurrently, then all of them are scored in one batched
+    model call on the model executor.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CITIES)
+
+    async def lookup(city_name: str):
+        async with semaphore:
+            return await _city_inputs_async(city_name)
+
+    with span("city_lookups"):
+        looked_up = await asyncio.gather(*(lookup(c) for c in city_names), return_exceptions=True)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(city_names)
+    found = []
+    for i, item in enumerate(looked_up):
+        if isinstance(item, Exception):
+            _prediction_failure_log.error("Error getting prediction for %s: %s", city_names[i], item)
+            results[i] = _unknown_city(city_names[i], str(item))
+        elif item[1] is None:
+            results[i] = _unknown_city(item[0], "Could not find city coordinates")
+        else:
+            found.append((i, item))
+
+    if found:
+        probabilities = await run_model(_score_cities, [(coords, weather) for _, (_, coords, weather) in found])
+        for (i, (city_name, (lat, lon), weather)), probability in zip(found, probabilities):
+            results[i] = _city_result(city_name, lat, lon, float(probability), weather)
+    return results
+
+
 def get_sample_cities(limit: int = 10) -> List[str]:
     """
     Get a sample of cities from the CSV for the multi-city view.
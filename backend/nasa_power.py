@@ -0,0 +1,63 @@
+"""
+NASA POWER Data Module
+Loads NASA POWER daily point exports (e.g. nasa(India).csv).
+
+The export starts with a free-text block between "-BEGIN HEADER-" and
+"-END HEADER-" (including the site location), followed by a CSV table with
+YEAR and DOY columns. Missing values are encoded as -999.
+"""
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Default dataset shipped with the project (repository root)
+NASA_CSV_PATH = Path(__file__).parent.parent / "nasa(India).csv"
+
+MISSING_VALUE = -999
+
+_LOCATION_RE = re.compile(r"latitude\s+(-?\d+(?:\.\d+)?)\s+longitude\s+(-?\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def read_header(path) -> Tuple[int, Optional[Tuple[float, float]]]:
+    """
+    Scan the header block.
+
+    Returns:
+        (number of lines before the CSV column row, (lat, lon) of the site or None)
+    """
+    location = None
+    with open(path, "r") as f:
+        for i, line in enumerate(f):
+            if line.startswith("YEAR"):
+                return i, location
+            match = _LOCATION_RE.search(line)
+            if match and location is None:
+                location = (float(match.group(1)), float(match.group(2)))
+    raise ValueError(f"No YEAR column row found in {path}")
+
+
+def load_nasa_power_csv(path=NASA_CSV_PATH, interpolate: bool = True) -> pd.DataFrame:
+    """
+    Load a NASA POWER daily CSV export into a date-indexed DataFrame.
+
+    -999 values become NaN and are linearly interpolated when `interpolate`
+    is True (same preprocessing as the training notebook). The site location
+    from the header is stored in `df.attrs["latitude"]` / `df.attrs["longitude"]`.
+    """
+    skiprows, location = read_header(path)
+    df = pd.read_csv(path, skiprows=skiprows)
+
+    df["date"] = pd.to_datetime(df["YEAR"], format="%Y") + pd.to_timedelta(df["DOY"] - 1, unit="D")
+    df.set_index("date", inplace=True)
+    df.drop(columns=["YEAR", "DOY"], inplace=True)
+
+    df = df.replace(MISSING_VALUE, np.nan)
+    if interpolate:
+        df = df.interpolate()
+
+    if location is not None:
+        df.attrs["latitude"], df.attrs["longitude"] = location
+    return df
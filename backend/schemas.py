@@ -15,6 +15,19 @@ class WeatherInput(BaseModel):
     rain_anomaly: float = 0.0
     temp_anomaly: float = 0.0
 
+class ExplainBatchRequest(BaseModel):
+    """Request model for batched SHAP explanations"""
+    inputs: List[WeatherInput]
+
+    @field_validator('inputs')
+    @classmethod
+    def validate_inputs(cls, v):
+        if not v:
+            raise ValueError('inputs must be a non-empty list')
+        if len(v) > 10000:
+            raise ValueError('At most 10000 inputs per request')
+        return v
+
 class PredictionOutput(BaseModel):
     probability: float
     risk_level: str
@@ -72,6 +85,52 @@ class LocationValidationResponse(BaseModel):
 PredictionInput = WeatherInput
 
 
+class SiteInput(BaseModel):
+    """A forecast site given by name or by coordinates"""
+    name: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    @model_validator(mode='after')
+    def validate_location(self):
+        has_coords = self.latitude is not None and self.longitude is not None
+        if not has_coords and not (self.name and self.name.strip()):
+            raise ValueError('Each site needs a name or latitude and longitude')
+        if has_coords and not (-90 <= self.latitude <= 90 and -180 <= self.longitude <= 180):
+            raise ValueError('Site coordinates are out of range')
+        return self
+
+
+class BulkForecastRequest(BaseModel):
+    """Request model for multi-site forecasts"""
+    sites: List[Union[str, SiteInput]]
+    days: int = 3
+    resolution: str = "daily"
+
+    @field_validator('sites')
+    @classmethod
+    def validate_sites(cls, v):
+        if not v:
+            raise ValueError('sites must be a non-empty list')
+        if len(v) > 1000:
+            raise ValueError('At most 1000 sites per request')
+        return v
+
+
+class JobRequest(BaseModel):
+    """Request model for background job submission"""
+    kind: str
+    params: Dict[str, Any] = {}
+    priority: int = 5
+
+    @field_validator('priority')
+    @classmethod
+    def validate_priority(cls, v):
+        if not 0 <= v <= 9:
+            raise ValueError('priority must be between 0 (highest) and 9 (lowest)')
+        return v
+
+
 # Chatbot schemas
 class ChatMessage(BaseModel):
     """A single chat message"""
@@ -84,6 +143,8 @@ class ChatRequest(BaseModel):
     """Request model for chatbot queries"""
     message: str
     context: Optional[Dict[str, Any]] = None
+    # Conversation to record the exchange in (shared "default" session if omitted)
+    session_id: Optional[str] = None
     
     # Optional context components
     prediction: Optional[Dict[str, Any]] = None
@@ -99,3 +160,4 @@ class ChatResponse(BaseModel):
     confidence: float
     data: Optional[Dict[str, Any]] = None
     timestamp: str
+    session_id: Optional[str] = None
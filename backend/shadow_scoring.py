@@ -0,0 +1,226 @@
+"""
+Shadow Scoring Module
+Scores a sample of live traffic with a candidate model next to the
+production model, to compare them before the candidate is promoted.
+
+Request handlers only `offer()` the feature rows they already scored along
+with the production probabilities; that is a random draw and a deque append,
+so the response never waits for the candidate. A background thread drains
+the queue in batches, scores each batch with the candidate in one model call
+and aggregates disagreement statistics per production risk band. When the
+queue is full, samples are dropped (and counted) rather than blocking.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from model_loader import ModelVersion, predict_batch, registry
+
+logger = logging.getLogger(__name__)
+
+# Same bands as location_service.classify_risk
+RISK_BANDS = ("Low", "Moderate", "High", "Critical")
+RISK_BAND_EDGES = np.array([0.25, 0.50, 0.75])
+
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_PENDING = 10_000
+
+
+def risk_bands(probabilities: np.ndarray) -> np.ndarray:
+    """Risk band index (into RISK_BANDS) of every probability."""
+    return np.searchsorted(RISK_BAND_EDGES, probabilities, side="right")
+
+
+class ShadowStats:
+    """Running disagreement statistics between production and candidate, per band."""
+
+    def __init__(self, primary: str, candidate: str):
+        self.primary = primary
+        self.candidate = candidate
+        self.started_at = time.time()
+        n = len(RISK_BANDS)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.abs_diff_sum = np.zeros(n)
+        self.max_abs_diff = np.zeros(n)
+        self.diff_sum = np.zeros(n)
+        self.decision_flips = np.zeros(n, dtype=np.int64)
+        # transitions[i, j]: rows production put in band i and the candidate in band j
+        self.transitions = np.zeros((n, n), dtype=np.int64)
+
+    def update(self, primary: np.ndarray, candidate: np.ndarray,
+               primary_threshold: float, candidate_threshold: float):
+        n = len(RISK_BANDS)
+        p_band, c_band = risk_bands(primary), risk_bands(candidate)
+        diff = candidate - primary
+        abs_diff = np.abs(diff)
+        flips = (primary >= primary_threshold) != (candidate >= candidate_threshold)
+
+        self.count += np.bincount(p_band, minlength=n)
+        self.abs_diff_sum += np.bincount(p_band, weights=abs_diff, minlength=n)
+        self.diff_sum += np.bincount(p_band, weights=diff, minlength=n)
+        self.decision_flips += np.bincount(p_band, weights=flips, minlength=n).astype(np.int64)
+        np.maximum.at(self.max_abs_diff, p_band, abs_diff)
+        np.add.at(self.transitions, (p_band, c_band), 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        bands = {}
+        for i, band in enumerate(RISK_BANDS):
+            n = int(self.count[i])
+            bands[band] = {
+                "samples": n,
+                "band_agreement": float(self.transitions[i, i] / n) if n else None,
+                "mean_abs_diff": float(self.abs_diff_sum[i] / n) if n else None,
+                "mean_diff": float(self.diff_sum[i] / n) if n else None,
+                "max_abs_diff": float(self.max_abs_diff[i]),
+                "decision_flips": int(self.decision_flips[i]),
+                "candidate_bands": {RISK_BANDS[j]: int(c) for j, c in enumerate(self.transitions[i])}
+            }
+        total = int(self.count.sum())
+        return {
+            "primary_version": self.primary,
+            "candidate_version": self.candidate,
+            "started_at": self.started_at,
+            "samples": total,
+            "band_agreement": float(np.trace(self.transitions) / total) if total else None,
+            "mean_abs_diff": float(self.abs_diff_sum.sum() / total) if total else None,
+            "decision_flips": int(self.decision_flips.sum()),
+            "bands": bands
+        }
+
+
+class ShadowScorer:
+    """
+    Background candidate scoring for a sampled fraction of requests.
+
+    Args:
+        sample_rate: Fraction of offered requests scored by the candidate
+        batch_size: Rows scored per candidate model call
+        flush_interval: Seconds before a partial batch is scored anyway
+        max_pending: Queued rows beyond which new samples are dropped
+    """
+
+    def __init__(self, sample_rate: float = DEFAULT_SAMPLE_RATE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, max_pending: int = DEFAULT_MAX_PENDING):
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._candidate: Optional[ModelVersion] = None
+        self._stats: Dict[str, ShadowStats] = {}
+        self._pending: deque = deque()
+        self._dropped = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def candidate(self) -> Optional[ModelVersion]:
+        return self._candidate
+
+    def start(self, version: str, sample_rate: Optional[float] = None) -> ModelVersion:
+        """Shadow-score with a loaded model version; statistics start from zero."""
+        mv = registry.get(version)
+        if mv is None:
+            raise KeyError(f"Unknown model version '{version}'")
+        with self._cond:
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            self._candidate = mv
+            self._stats = {}
+            self._pending.clear()
+            self._dropped = 0
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="shadow-scorer", daemon=True)
+                self._thread.start()
+        logger.info("Shadow scoring with candidate %s at sample rate %.3f", version, self.sample_rate)
+        return mv
+
+    def stop(self):
+        """Stop shadow scoring; queued samples are discarded, statistics are kept."""
+        with self._cond:
+            self._candidate = None
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def offer(self, features, probabilities) -> bool:
+        """
+        Hand rows already scored by production to the shadow scorer. Returns
+        True if they were sampled. Never blocks on candidate scoring.
+        """
+        candidate = self._candidate
+        if candidate is None or random.random() >= self.sample_rate:
+            return False
+        primary = registry.current()
+        if primary is candidate:
+            return False
+        arr = np.array(features, dtype=np.float32).reshape(-1, np.shape(features)[-1])
+        probs = np.atleast_1d(np.asarray(probabilities, dtype=np.float64))
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._dropped += len(arr)
+                return False
+            self._pending.append((primary, arr, probs))
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            candidate = self._candidate
+            return {
+                "candidate_version": candidate.version if candidate else None,
+                "sample_rate": self.sample_rate,
+                "pending": len(self._pending),
+                "dropped": self._dropped,
+                "comparisons": [stats.to_dict() for stats in self._stats.values()]
+            }
+
+    def _next_batch(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.batch_size))]
+            return self._candidate, batch
+
+    def _worker(self):
+        while True:
+            candidate, batch = self._next_batch()
+            if candidate is None or not batch:
+                continue
+            try:
+                self._score(candidate, batch)
+            except Exception as e:
+                logger.exception("Shadow scoring batch failed: %s", e)
+
+    def _score(self, candidate: ModelVersion, batch):
+        features = np.vstack([arr for _, arr, _ in batch])
+        with registry.pinned(candidate):
+            scored = predict_batch(features)
+        candidate_threshold = candidate.manifest.get("threshold", 0.5)
+
+        offset = 0
+        for primary, arr, probs in batch:
+            n = len(arr)
+            key = f"{primary.version}:{candidate.version}"
+            with self._cond:
+                if self._candidate is not candidate:
+                    return
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = ShadowStats(primary.version, candidate.version)
+                stats.update(probs, scored[offset:offset + n],
+                             primary.manifest.get("threshold", 0.5), candidate_threshold)
+            offset += n
+
+
+shadow_scorer = ShadowScorer()
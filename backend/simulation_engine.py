@@ -1,7 +1,7 @@
 import logging
 from typing import List, Dict, Any
 import numpy as np
-from model_loader import predict
+from model_loader import predict_batch
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +19,7 @@ def _classify_risk(probability: float) -> str:
 
 def simulate_flood(input_data: Dict[str, Any], hours: int = 24) -> List[Dict[str, Any]]:
 	"""
-	Run the existing flood model once per simulated hour.
+	Run the existing flood model over every simulated hour.
 
 	- Accumulates rainfall over time (simple running total).
 	- Slightly decreases pressure each hour to simulate storm progression.
@@ -36,35 +36,34 @@ def simulate_flood(input_data: Dict[str, Any], hours: int = 24) -> List[Dict[str
 	rain_anomaly = float(input_data.get("rain_anomaly", 0.0))
 	temp_anomaly = float(input_data.get("temp_anomaly", 0.0))
 
-	cumulative_rainfall = base_rainfall
 	pressure_step = 0.5  # hPa per hour drop to represent mild pressure decline
 
-	timeline: List[Dict[str, Any]] = []
-
-	for hour in range(hours):
-		features = np.array([[
-			temperature,
-			temperature_max,
-			temperature_min,
-			pressure,
-			cumulative_rainfall,
-			humidity,
-			wind_speed,
-			rain_anomaly,
-			temp_anomaly
-		]])
+	# Evolving conditions for every hour at once: rainfall accumulates and
+	# pressure declines each hour; the whole timeline is scored in one call
+	hour_index = np.arange(hours, dtype=np.float64)
+	features = np.empty((hours, 9), dtype=np.float64)
+	features[:] = [
+		temperature,
+		temperature_max,
+		temperature_min,
+		pressure,
+		base_rainfall,
+		humidity,
+		wind_speed,
+		rain_anomaly,
+		temp_anomaly
+	]
+	features[1:, 3] = np.maximum(0.0, pressure - pressure_step * hour_index[1:])
+	features[:, 4] = base_rainfall * (hour_index + 1)
 
-		probability = float(predict(features))
-		risk_state = _classify_risk(probability)
+	probabilities = predict_batch(features)
 
+	timeline: List[Dict[str, Any]] = []
+	for hour, probability in enumerate(probabilities.tolist()):
 		timeline.append({
 			"hour": hour,
 			"probability": probability,
-			"risk_state": risk_state
+			"risk_state": _classify_risk(probability)
 		})
 
-		# Update evolving conditions for next hour
-		cumulative_rainfall += base_rainfall
-		pressure = max(0.0, pressure - pressure_step)
-
 	return timeline
@@ -0,0 +1,291 @@
+"""
+Structured Logging Module
+Logging setup for the API: one configure_logging() call at startup, text or
+JSON output with structured fields, per-call-site sampling and rate limits
+for hot paths, and one summary line per HTTP request.
+
+Hot paths (model calls, per-city and per-point loops) must not format a log
+line per row. They log through a SampledLog call site instead:
+
+    _input_log = SampledLog(logger, every=1000, per_second=1)
+    ...
+    _input_log.debug("Model input: %s", arr)
+
+A disabled level costs one isEnabledFor() check; arguments are only
+formatted for records that are actually emitted (pass the object, not its
+`.tolist()`). Records dropped by the rate limit are counted and reported as
+`suppressed=N` on the next record emitted from the same call site.
+
+Per-request detail goes into the request summary line written by
+RequestLogMiddleware (method, route, status, duration, model version and
+the trace's stage totals) rather than into per-call logs.
+
+Environment:
+    FLOOD_LOG_LEVEL           Root level (default INFO)
+    FLOOD_LOG_FORMAT          "text" (default) or "json"
+    FLOOD_REQUEST_LOG_SAMPLE  Share of successful requests summarised (default 1.0);
+                              4xx/5xx responses are always logged
+
+Run `python structured_logging.py` to measure the overhead of each pattern.
+"""
+import argparse
+import io
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import tracing
+
+LOG_LEVEL = os.environ.get("FLOOD_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("FLOOD_LOG_FORMAT", "text").lower()
+REQUEST_LOG_SAMPLE = float(os.environ.get("FLOOD_REQUEST_LOG_SAMPLE", "1.0"))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records with their structured `fields` (passed as
+    `extra={"fields": {...}}`): appended as key=value pairs in text mode,
+    merged into one JSON object per line in JSON mode.
+    """
+
+    def __init__(self, json_output: bool = False):
+        super().__init__(TEXT_FORMAT)
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None)
+        if not self.json_output:
+            line = super().format(record)
+            if fields:
+                line += " " + " ".join(f"{key}={_text_value(value)}" for key, value in fields.items())
+            return line
+
+        payload: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def _text_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    if isinstance(value, dict):
+        return ",".join(f"{k}:{_text_value(v)}" for k, v in value.items())
+    return str(value)
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """
+    Install the structured handler on the root logger. Idempotent: only the
+    first call configures anything, so importing modules never re-configures.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        root = logging.getLogger()
+        # Like basicConfig: leave handlers installed by a host (tests, workers) alone
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(StructuredFormatter(json_output=(fmt or LOG_FORMAT) == "json"))
+            root.addHandler(handler)
+        root.setLevel(level or LOG_LEVEL)
+        _configured = True
+
+
+class SampledLog:
+    """
+    A sampled, rate-limited logging call site.
+
+    Args:
+        logger: Logger records are sent to
+        every: Emit one of every `every` calls (1 = all)
+        per_second: At most this many records per second (None = unlimited)
+    """
+
+    def __init__(self, logger: logging.Logger, every: int = 1, per_second: Optional[float] = None):
+        self.logger = logger
+        self.every = max(1, every)
+        self.per_second = per_second
+        self._calls = itertools.count()
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._window_count = 0
+        self._suppressed = 0
+
+    def _admit(self) -> Optional[int]:
+        """None to drop the record, else the number of records suppressed since the last one."""
+        if self.every > 1 and next(self._calls) % self.every:
+            return None
+        if self.per_second is None:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            if self._window_count >= self.per_second:
+                self._suppressed += 1
+                return None
+            self._window_count += 1
+            suppressed, self._suppressed = self._suppressed, 0
+            return suppressed
+
+    def log(self, level: int, msg: str, *args, fields: Optional[Dict[str, Any]] = None, exc_info=None):
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._admit()
+        if suppressed is None:
+            return
+        if suppressed or self.every > 1:
+            fields = dict(fields or ())
+            if self.every > 1:
+                fields["sampled"] = f"1/{self.every}"
+            if suppressed:
+                fields["suppressed"] = suppressed
+        # stacklevel points file/line at the caller of debug()/info()/...
+        self.logger.log(level, msg, *args, extra={"fields": fields} if fields else None,
+                        exc_info=exc_info, stacklevel=3)
+
+    def debug(self, msg: str, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg: str, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg: str, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg: str, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+# --------------------------------------------------
+# Request summary line
+# --------------------------------------------------
+request_logger = logging.getLogger("flood.request")
+
+
+class RequestLogMiddleware:
+    """
+    Pure ASGI middleware writing one structured summary line per HTTP
+    request. Must run inside TracingMiddleware to report stage totals.
+    """
+
+    def __init__(self, app, sample: float = REQUEST_LOG_SAMPLE):
+        self.app = app
+        self.every = max(1, round(1 / sample)) if sample > 0 else 0
+        self._calls = itertools.count()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not request_logger.isEnabledFor(logging.INFO):
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        response = {"status": 500, "bytes": 0, "model_version": None}
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for key, value in message.get("headers", ()):
+                    if key == b"x-model-version":
+                        response["model_version"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            self._summarise(scope, response, time.perf_counter() - started)
+
+    def _summarise(self, scope, response: Dict[str, Any], seconds: float):
+        status = response["status"]
+        if status < 400:
+            if not self.every or next(self._calls) % self.every:
+                return
+        route = scope.get("route")
+        fields: Dict[str, Any] = {
+            "method": scope["method"],
+            "route": getattr(route, "path", scope["path"]),
+            "status": status,
+            "duration_ms": round(seconds * 1000, 1),
+            "bytes": response["bytes"]
+        }
+        if response["model_version"]:
+            fields["model_version"] = response["model_version"]
+        trace = tracing.current_trace()
+        if trace is not None and trace.spans:
+            fields["stages_ms"] = {name: round(total * 1000, 1) for name, (total, _) in trace.totals().items()}
+        level = logging.WARNING if status >= 500 else logging.INFO
+        request_logger.log(level, "request", extra={"fields": fields})
+
+
+# --------------------------------------------------
+# Benchmark
+# --------------------------------------------------
+def benchmark(iterations: int = 20000) -> Dict[str, float]:
+    """
+    Cost per call, in microseconds, of logging a 9-feature model input the
+    old way (INFO with `.tolist()`) versus through SampledLog, with an
+    INFO-level structured handler writing to memory.
+    """
+    import numpy as np
+
+    bench = logging.getLogger("flood.benchmark")
+    bench.propagate = False
+    bench.setLevel(logging.INFO)
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(StructuredFormatter())
+    bench.addHandler(handler)
+    arr = np.random.default_rng(0).random((1, 9), dtype=np.float32)
+
+    sampled_debug = SampledLog(bench)
+    sampled = SampledLog(bench, every=1000)
+    limited = SampledLog(bench, per_second=1)
+    cases = {
+        "info_eager_tolist": lambda: bench.info("Model input features: %s", arr.tolist()),
+        "info_lazy": lambda: bench.info("Model input features: %s", arr),
+        "sampled_debug_disabled": lambda: sampled_debug.debug("Model input features: %s", arr),
+        "sampled_1_in_1000": lambda: sampled.info("Model input features: %s", arr),
+        "rate_limited_1_per_s": lambda: limited.info("Model input features: %s", arr),
+    }
+    results = {}
+    try:
+        for name, call in cases.items():
+            started = time.perf_counter()
+            for _ in range(iterations):
+                call()
+            results[name] = (time.perf_counter() - started) / iterations * 1e6
+    finally:
+        bench.removeHandler(handler)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark hot-path logging patterns")
+    parser.add_argument("--iterations", type=int, default=20000, help="Calls per pattern")
+    args = parser.parse_args(argv)
+
+    for name, cost in benchmark(args.iterations).items():
+        print(f"{cost:8.3f} us/call  {name}")
+
+
+if __name__ == "__main__":
+    main()
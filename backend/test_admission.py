@@ -0,0 +1,187 @@
+"""
+Tests for admission control: queue limits, deadlines, priority dispatch and
+cancellation. Run with `python -m pytest test_admission.py`.
+"""
+import asyncio
+import json
+
+import pytest
+
+from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, EndpointClass
+
+
+def make_controller(limit=1, queue_depth=4, queue_timeout=1.0, bulk_limit=1):
+    return AdmissionController(
+        classes=[
+            EndpointClass("predict", limit=limit, queue_depth=queue_depth, queue_timeout=queue_timeout, priority=0),
+            EndpointClass("bulk", limit=bulk_limit, queue_depth=queue_depth, queue_timeout=queue_timeout, priority=3),
+        ],
+        rules=[(r"/predict", "predict"), (r"/bulk", "bulk")]
+    )
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_classify_by_path():
+    controller = make_controller()
+    assert controller.classify("/predict").name == "predict"
+    assert controller.classify("/bulk").name == "bulk"
+    assert controller.classify("/other") is None
+
+
+def test_queue_full_rejects_with_429():
+    async def scenario():
+        controller = make_controller(limit=1, queue_depth=1)
+        predict = controller.classify("/predict")
+        assert await controller.acquire(predict) is False
+        queued = asyncio.ensure_future(controller.acquire(predict))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(predict)
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+        assert predict.rejected_queue_full == 1
+
+        controller.release(predict, 0.01)
+        assert await queued is True
+        controller.release(predict, 0.01)
+        assert predict.active == 0
+
+    run(scenario())
+
+
+def test_queue_deadline_rejects_with_503():
+    async def scenario():
+        controller = make_controller(limit=1, queue_timeout=0.05)
+        predict = controller.classify("/predict")
+        await controller.acquire(predict)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(predict)
+        assert rejected.value.status_code == 503
+        assert predict.rejected_timeout == 1
+        assert len(predict.queue) == 0
+        controller.release(predict)
+
+    run(scenario())
+
+
+def test_lower_priority_held_back_while_predict_queued():
+    async def scenario():
+        controller = make_controller(limit=1, bulk_limit=1)
+        predict = controller.classify("/predict")
+        bulk = controller.classify("/bulk")
+        order = []
+
+        async def acquire(endpoint_class):
+            await controller.acquire(endpoint_class)
+            order.append(endpoint_class.name)
+
+        await controller.acquire(predict)
+        waiting_predict = asyncio.ensure_future(acquire(predict))
+        await asyncio.sleep(0)
+        # bulk has a free slot, but a predict request is waiting
+        waiting_bulk = asyncio.ensure_future(acquire(bulk))
+        await asyncio.sleep(0.01)
+        assert order == []
+        assert bulk.active == 0 and len(bulk.queue) == 1
+
+        controller.release(predict)
+        await asyncio.gather(waiting_predict, waiting_bulk)
+        assert order == ["predict", "bulk"]
+
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        controller = make_controller(limit=1)
+        predict = controller.classify("/predict")
+        await controller.acquire(predict)
+        waiting = asyncio.ensure_future(controller.acquire(predict))
+        await asyncio.sleep(0)
+        assert len(predict.queue) == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert len(predict.queue) == 0
+
+        controller.release(predict)
+        assert predict.active == 0
+        assert await controller.acquire(predict) is False
+
+    run(scenario())
+
+
+def test_cancel_after_grant_releases_slot():
+    async def scenario():
+        controller = make_controller(limit=1)
+        predict = controller.classify("/predict")
+        await controller.acquire(predict)
+        waiting = asyncio.ensure_future(controller.acquire(predict))
+        await asyncio.sleep(0)
+
+        # The slot is handed over, but the client goes away before it runs
+        controller.release(predict)
+        assert predict.active == 1
+        waiting.cancel()
+        try:
+            granted = await waiting
+        except asyncio.CancelledError:
+            # The slot was given back on the way out
+            assert predict.active == 0
+        else:
+            # Some Python versions let wait_for finish once its future is done:
+            # the request then owns the slot and releases it normally
+            assert granted is True and predict.active == 1
+            controller.release(predict)
+        assert predict.active == 0 and len(predict.queue) == 0
+
+    run(scenario())
+
+
+def test_grant_at_deadline_keeps_slot(monkeypatch):
+    async def scenario():
+        controller = make_controller(limit=1)
+        predict = controller.classify("/predict")
+        await controller.acquire(predict)
+
+        async def granted_then_timeout(waiter, timeout):
+            # The slot frees and the queue deadline fires in the same tick
+            controller.release(predict)
+            assert waiter.done()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr("admission.asyncio.wait_for", granted_then_timeout)
+        assert await controller.acquire(predict) is True
+        assert predict.active == 1 and predict.rejected_timeout == 0
+        controller.release(predict)
+        assert predict.active == 0 and len(predict.queue) == 0
+
+    run(scenario())
+
+
+def test_middleware_rejection_response():
+    async def scenario():
+        controller = make_controller(limit=1, queue_depth=0)
+        predict = controller.classify("/predict")
+        await controller.acquire(predict)
+
+        async def app(scope, receive, send):
+            raise AssertionError("rejected requests must not reach the app")
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/predict"}
+        await AdmissionMiddleware(app, controller)(scope, None, send)
+        start, body = messages
+        assert start["status"] == 429
+        assert (b"retry-after", b"1") in start["headers"]
+        assert json.loads(body["body"])["detail"]
+
+    run(scenario())
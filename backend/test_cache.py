@@ -0,0 +1,126 @@
+"""
+Tests for LRUCache: TTL/LRU basics and single-flight computation shared by
+sync (threaded) and async callers. Run with `python -m pytest test_cache.py`.
+"""
+import asyncio
+import threading
+import time
+
+from cache import LRUCache
+
+
+def test_lru_eviction_and_ttl():
+    cache = LRUCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_peek_many_does_not_touch_order_or_stats():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.peek_many(["a", "x"]) == [1, None]
+    assert (cache.hits, cache.misses) == (0, 0)
+    cache.set("c", 3)
+    assert cache.get("a") is None
+
+
+def test_sync_leader_async_follower_share_one_computation():
+    cache = LRUCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append("sync")
+        started.set()
+        release.wait(5)
+        return 42
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.setdefault("sync", cache.get_or_compute("k", compute)))
+    leader.start()
+    assert started.wait(5)
+
+    async def follower():
+        async def compute_async():
+            calls.append("async")
+            return -1
+
+        task = asyncio.ensure_future(cache.aget_or_compute("k", compute_async))
+        await asyncio.sleep(0.02)
+        assert not task.done()
+        release.set()
+        return await asyncio.wait_for(task, 5)
+
+    results["async"] = asyncio.run(follower())
+    leader.join(5)
+    assert results == {"sync": 42, "async": 42}
+    assert calls == ["sync"]
+
+
+def test_async_leader_sync_follower_share_one_computation():
+    cache = LRUCache()
+    calls = []
+    results = {}
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def compute_async():
+            calls.append("async")
+            await release.wait()
+            return 7
+
+        leader = asyncio.ensure_future(cache.aget_or_compute("k", compute_async))
+        await asyncio.sleep(0)
+
+        def compute():
+            calls.append("sync")
+            return -1
+
+        follower = threading.Thread(target=lambda: results.setdefault("sync", cache.get_or_compute("k", compute)))
+        follower.start()
+        await asyncio.sleep(0.02)
+        assert "sync" not in results
+        release.set()
+        results["async"] = await leader
+        await asyncio.get_running_loop().run_in_executor(None, follower.join, 5)
+
+    asyncio.run(scenario())
+    assert results == {"sync": 7, "async": 7}
+    assert calls == ["async"]
+
+
+def test_failed_computation_lets_waiters_retry():
+    cache = LRUCache()
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def failing():
+            await release.wait()
+            raise RuntimeError("upstream down")
+
+        async def succeeding():
+            return "ok"
+
+        leader = asyncio.ensure_future(cache.aget_or_compute("k", failing))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.aget_or_compute("k", succeeding))
+        await asyncio.sleep(0)
+        release.set()
+        try:
+            await leader
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("the leader's error must propagate")
+        return await follower
+
+    assert asyncio.run(scenario()) == "ok"
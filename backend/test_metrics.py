@@ -0,0 +1,57 @@
+"""
+Tests for the sharded metrics: per-thread recording, retirement of shards
+left by exited threads, and the text exposition. Run with
+`python -m pytest test_metrics.py`.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import MetricsRegistry
+
+
+def test_exited_threads_are_folded_into_retired_total():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "test", ["stage"], buckets=(0.1, 1.0))
+    child = histogram.labels("weather")
+
+    for _ in range(50):
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda _: child.observe(0.05), range(32)))
+
+    assert len(child._shards) == 0
+    cumulative, total = child.value()
+    assert cumulative == [1600, 1600, 1600]
+    assert abs(total - 80.0) < 1e-6
+
+
+def test_live_thread_keeps_its_shard():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "test")
+    counter.inc(2)
+    recorded, done = threading.Event(), threading.Event()
+
+    def worker():
+        counter.inc(3)
+        recorded.set()
+        done.wait(5)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert recorded.wait(5)
+    assert counter.value() == 5
+    assert len(counter._default._shards) == 2
+
+    done.set()
+    thread.join(5)
+    assert counter.value() == 5
+    assert len(counter._default._shards) == 1
+    counter.inc()
+    assert counter.value() == 6
+
+
+def test_render_exposition():
+    registry = MetricsRegistry()
+    registry.counter("test_requests_total", "Requests", ["route"]).labels("/predict").inc()
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/predict"} 1' in text
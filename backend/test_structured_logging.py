@@ -0,0 +1,90 @@
+"""
+Tests for SampledLog sampling and rate limiting and the structured
+formatter. Run with `python -m pytest test_structured_logging.py`.
+"""
+import json
+import logging
+
+from structured_logging import SampledLog, StructuredFormatter
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_logger(name, level=logging.DEBUG):
+    logger = logging.getLogger(f"test.{name}")
+    logger.handlers[:] = []
+    logger.propagate = False
+    logger.setLevel(level)
+    handler = Records()
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_disabled_level_is_dropped_without_formatting():
+    logger, handler = make_logger("disabled", level=logging.INFO)
+
+    class Exploding:
+        def __str__(self):
+            raise AssertionError("must not be formatted")
+
+    SampledLog(logger).debug("value %s", Exploding())
+    assert handler.records == []
+
+
+def test_one_in_n_sampling():
+    logger, handler = make_logger("sampled")
+    site = SampledLog(logger, every=10)
+    for i in range(100):
+        site.info("call %d", i)
+    assert [r.getMessage() for r in handler.records] == [f"call {i}" for i in range(0, 100, 10)]
+    assert handler.records[0].fields == {"sampled": "1/10"}
+
+
+def test_rate_limit_counts_suppressed(monkeypatch):
+    logger, handler = make_logger("limited")
+    site = SampledLog(logger, per_second=2)
+    now = [1000.0]
+    monkeypatch.setattr("structured_logging.time.monotonic", lambda: now[0])
+
+    for _ in range(5):
+        site.warning("upstream failed")
+    assert len(handler.records) == 2
+
+    now[0] += 1.0
+    site.warning("upstream failed")
+    assert len(handler.records) == 3
+    assert handler.records[-1].fields == {"suppressed": 3}
+
+    site.warning("upstream failed")
+    assert getattr(handler.records[-1], "fields", None) is None
+
+
+def test_call_sites_are_independent():
+    logger, handler = make_logger("sites")
+    first = SampledLog(logger, per_second=1)
+    second = SampledLog(logger, per_second=1)
+    first.error("a")
+    first.error("a")
+    second.error("b")
+    assert [r.getMessage() for r in handler.records] == ["a", "b"]
+
+
+def test_record_points_at_caller():
+    logger, handler = make_logger("caller")
+    SampledLog(logger).info("here")
+    assert handler.records[0].funcName == "test_record_points_at_caller"
+
+
+def test_formatter_fields():
+    record = logging.LogRecord("flood.request", logging.INFO, __file__, 1, "request", None, None)
+    record.fields = {"status": 200, "stages_ms": {"predict": 1.25}}
+    assert StructuredFormatter().format(record).endswith("request status=200 stages_ms=predict:1.25")
+    payload = json.loads(StructuredFormatter(json_output=True).format(record))
+    assert payload["msg"] == "request" and payload["status"] == 200 and payload["stages_ms"] == {"predict": 1.25}
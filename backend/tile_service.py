@@ -0,0 +1,275 @@
+"""
+Tile Service Module
+Flood-risk raster tiles for standard web-mercator XYZ (slippy map) addressing.
+
+Tiles are rendered from a small adaptive set of real samples and kept in an
+LRU cache keyed on (tile, render options, weather snapshot version), so
+overlapping viewports and concurrent users share work: each tile is computed
+at most once per weather refresh. Individual point samples are cached as
+well, which lets neighboring tiles reuse their shared corner samples.
+"""
+import math
+import struct
+import threading
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from adaptive_sampling import AdaptiveSampler, run_adaptive
+from cache import LRUCache
+
+# Open-Meteo "current" conditions are refreshed every 15 minutes
+WEATHER_SNAPSHOT_SECONDS = 900
+
+MAX_ZOOM = 18
+
+# Per-tile sampling budget (upstream weather calls, shared corners excluded)
+TILE_COARSE = 1
+TILE_TOLERANCE = 0.1
+TILE_MAX_SAMPLES = 16
+
+# Rendered tiles and individual point samples
+tile_cache = LRUCache(maxsize=4096, ttl=WEATHER_SNAPSHOT_SECONDS, name="tiles")
+point_cache = LRUCache(maxsize=50000, ttl=WEATHER_SNAPSHOT_SECONDS, name="points")
+
+# Spatial index of point_cache keys: snapshot version -> grid cell -> keys.
+# Entries evicted from the cache are pruned lazily when a lookup misses them.
+INDEX_CELL_DEGREES = 0.25
+_point_index: Dict[int, Dict[Tuple[int, int], Set[tuple]]] = {}
+_point_index_lock = threading.Lock()
+
+# Same stops as the AreaHeatmap leaflet.heat gradient (blue -> red)
+_COLOR_STOPS = np.array([0.0, 0.1, 0.3, 0.5, 0.7, 1.0])
+_COLOR_VALUES = np.array([
+    [0, 0, 255],
+    [0, 0, 255],
+    [0, 255, 255],
+    [0, 255, 0],
+    [255, 255, 0],
+    [255, 0, 0]
+], dtype=np.float64)
+
+
+def weather_snapshot_version(now: float = None) -> int:
+    """Monotonic id of the current weather snapshot (changes every refresh)."""
+    now = time.time() if now is None else now
+    return int(now // WEATHER_SNAPSHOT_SECONDS)
+
+
+def seconds_until_refresh(now: float = None) -> int:
+    now = time.time() if now is None else now
+    return int(WEATHER_SNAPSHOT_SECONDS - (now % WEATHER_SNAPSHOT_SECONDS))
+
+
+def validate_tile(z: int, x: int, y: int):
+    """Raise ValueError for tile addresses outside the XYZ scheme."""
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f"Zoom must be between 0 and {MAX_ZOOM}")
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile x/y must be between 0 and {n - 1} at zoom {z}")
+
+
+def _mercator_lat(y_norm: np.ndarray) -> np.ndarray:
+    """Latitude for normalized mercator y (0 = north edge, 1 = south edge)."""
+    return np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y_norm))))
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (min_lat, min_lon, max_lat, max_lon) of a tile."""
+    n = 2 ** z
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = float(_mercator_lat(np.float64(y / n)))
+    min_lat = float(_mercator_lat(np.float64((y + 1) / n)))
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def tile_pixel_centers(z: int, x: int, y: int, size: int):
+    """
+    (lats, lons) arrays of shape (size, size) for the pixel centers of a tile.
+    Row 0 is the northern edge, matching image row order. Rows are evenly
+    spaced in mercator y, not in latitude.
+    """
+    n = 2 ** z
+    offsets = (np.arange(size) + 0.5) / size
+    lats = _mercator_lat((y + offsets) / n)
+    lons = (x + offsets) / n * 360.0 - 180.0
+    return np.meshgrid(lats, lons, indexing="ij")
+
+
+def _index_cell(lat: float, lon: float) -> Tuple[int, int]:
+    return math.floor(lat / INDEX_CELL_DEGREES), math.floor(lon / INDEX_CELL_DEGREES)
+
+
+def _cache_point(key: tuple, prob: float):
+    """Store a point sample and index it by snapshot version and cell."""
+    point_cache.set(key, prob)
+    lat, lon, version = key
+    with _point_index_lock:
+        cells = _point_index.get(version)
+        if cells is None:
+            # Only the current and the previous snapshot are still queried
+            for old in [v for v in _point_index if v < version - 1]:
+                del _point_index[old]
+            cells = _point_index[version] = {}
+        cells.setdefault(_index_cell(lat, lon), set()).add(key)
+
+
+def cached_sampler(sample_fn: Callable[[List[Tuple[float, float]]], Sequence[float]], version: int):
+    """
+    Wrap a batch sampling function with the shared point cache, so only
+    points not seen in this weather snapshot reach the upstream API.
+    """
+    def sample(points: List[Tuple[float, float]]) -> List[float]:
+        keys = [(round(lat, 5), round(lon, 5), version) for lat, lon in points]
+        values = [point_cache.get(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            fresh = sample_fn([points[i] for i in missing])
+            for i, prob in zip(missing, fresh):
+                values[i] = float(prob)
+                _cache_point(keys[i], values[i])
+        return values
+    return sample
+
+
+def cached_sampler_async(sample_fn: Callable[[List[Tuple[float, float]]], Awaitable[Sequence[float]]],
+                         version: int):
+    """cached_sampler for a coroutine batch sampling function."""
+    async def sample(points: List[Tuple[float, float]]) -> List[float]:
+        keys = [(round(lat, 5), round(lon, 5), version) for lat, lon in points]
+        values = [point_cache.get(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            fresh = await sample_fn([points[i] for i in missing])
+            for i, prob in zip(missing, fresh):
+                values[i] = float(prob)
+                _cache_point(keys[i], values[i])
+        return values
+    return sample
+
+
+def cached_samples_within(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                          version: int, margin: float = 0.0) -> List[Tuple[float, float, float]]:
+    """
+    Cached (lat, lon, probability) samples of a weather snapshot that fall
+    inside a box (optionally grown by `margin` degrees on every side). Only
+    the index cells overlapping the box are visited.
+    """
+    min_lat, min_lon, max_lat, max_lon = min_lat - margin, min_lon - margin, max_lat + margin, max_lon + margin
+    low_i, low_j = _index_cell(min_lat, min_lon)
+    high_i, high_j = _index_cell(max_lat, max_lon)
+    with _point_index_lock:
+        cells = _point_index.get(version, {})
+        if (high_i - low_i + 1) * (high_j - low_j + 1) <= len(cells):
+            candidates = [cells.get((i, j), ()) for i in range(low_i, high_i + 1) for j in range(low_j, high_j + 1)]
+        else:
+            candidates = [keys for (i, j), keys in cells.items() if low_i <= i <= high_i and low_j <= j <= high_j]
+        keys = [key for cell_keys in candidates for key in cell_keys
+                if min_lat <= key[0] <= max_lat and min_lon <= key[1] <= max_lon]
+
+    samples, evicted = [], []
+    for key, prob in zip(keys, point_cache.peek_many(keys)):
+        if prob is None:
+            evicted.append(key)
+        else:
+            samples.append((key[0], key[1], prob))
+    if evicted:
+        with _point_index_lock:
+            cells = _point_index.get(version, {})
+            for key in evicted:
+                cells.get(_index_cell(key[0], key[1]), set()).discard(key)
+    return samples
+
+
+def render_tile_intensities(z: int, x: int, y: int, size: int,
+                            sample_fn: Callable[[List[Tuple[float, float]]], Sequence[float]],
+                            version: int) -> np.ndarray:
+    """Sample a tile adaptively and interpolate a (size, size) intensity raster."""
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+    sampler = AdaptiveSampler(
+        min_lat, min_lon, max_lat, max_lon,
+        coarse=TILE_COARSE, tolerance=TILE_TOLERANCE, max_samples=TILE_MAX_SAMPLES
+    )
+    run_adaptive(sampler, cached_sampler(sample_fn, version))
+    lats, lons = tile_pixel_centers(z, x, y, size)
+    return np.clip(sampler.interpolate(lats, lons), 0.0, 1.0)
+
+
+def colorize(intensities: np.ndarray) -> np.ndarray:
+    """Map 0-1 intensities to an RGBA uint8 image using the heatmap gradient."""
+    values = np.clip(intensities, 0.0, 1.0)
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(values, _COLOR_STOPS, _COLOR_VALUES[:, channel]).astype(np.uint8)
+    # Low risk fades out so the base map stays readable
+    rgba[..., 3] = np.rint(60 + 140 * values).astype(np.uint8)
+    return rgba
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """Encode an (h, w, 4) uint8 array as a PNG image."""
+    height, width, _ = rgba.shape
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)  # filter byte 0 per row
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + tag + data +
+                struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", header) +
+            chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) +
+            chunk(b"IEND", b""))
+
+
+def tile_key(z: int, x: int, y: int, size: int, version: int) -> tuple:
+    return (z, x, y, size, version)
+
+
+def get_tile_intensities(z: int, x: int, y: int, size: int,
+                         sample_fn: Callable[[List[Tuple[float, float]]], Sequence[float]]):
+    """
+    Return (intensities, version) for a tile, computing it at most once per
+    weather snapshot even under concurrent requests.
+    """
+    validate_tile(z, x, y)
+    version = weather_snapshot_version()
+    intensities = tile_cache.get_or_compute(
+        tile_key(z, x, y, size, version),
+        lambda: render_tile_intensities(z, x, y, size, sample_fn, version)
+    )
+    return intensities, version
+
+
+def get_tile_png(z: int, x: int, y: int, size: int,
+                 sample_fn: Callable[[List[Tuple[float, float]]], Sequence[float]]):
+    """Return (png_bytes, version) for a tile; the encoded image is cached too."""
+    validate_tile(z, x, y)
+    version = weather_snapshot_version()
+    png = tile_cache.get_or_compute(
+        tile_key(z, x, y, size, version) + ("png",),
+        lambda: encode_png(colorize(get_tile_intensities(z, x, y, size, sample_fn)[0]))
+    )
+    return png, version
+
+
+def tile_grid_geometry(z: int, x: int, y: int, size: int) -> Tuple[float, float, float, float]:
+    """
+    Approximate regular-grid geometry (origin lat/lon of the first pixel,
+    lat/lon step) for the compact grid encoding. Latitude steps are only
+    exactly uniform in mercator space; at tile scale the error is negligible.
+    """
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+    lat_step = -(max_lat - min_lat) / size
+    lon_step = (max_lon - min_lon) / size
+    lats, lons = tile_pixel_centers(z, x, y, size)
+    return float(lats[0, 0]), float(lons[0, 0]), lat_step, lon_step
+
+
+def cache_stats() -> dict:
+    return {"tiles": tile_cache.stats(), "points": point_cache.stats()}
@@ -0,0 +1,257 @@
+"""
+Tracing Module
+Lightweight per-request trace spans, a Server-Timing response header and
+an opt-in sampling profiler for single requests.
+
+TracingMiddleware starts a Trace for every HTTP request and keeps it in a
+context variable, which follows the request into threadpool endpoints, the
+model executor and the chatbot's section executor. `span(name)` (and every
+metrics stage: geocode, weather, forecast, predict, shap, serialize)
+appends (name, start, duration) to the current trace; outside a request it
+costs one context-variable lookup. When the response starts, spans are
+summed per name into a `Server-Timing` header, e.g.
+
+    Server-Timing: geocode;dur=212.4, weather;dur=187.9, predict;dur=1.3, app;dur=405.1
+
+Profiling: a request sent with `X-Profile: 1` and an `X-Admin-Token` equal
+to the FLOOD_ADMIN_TOKEN environment variable is run under a sampling
+profiler, and its response body is replaced by a JSON summary (status,
+spans, hottest functions). The sampler records the stacks of every busy
+thread, so profile on a quiet instance. Without FLOOD_ADMIN_TOKEN profiling
+is disabled.
+"""
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+ADMIN_TOKEN = os.environ.get("FLOOD_ADMIN_TOKEN")
+
+PROFILE_HEADER = b"x-profile"
+ADMIN_TOKEN_HEADER = b"x-admin-token"
+PROFILE_INTERVAL = 0.005
+PROFILE_TOP = 30
+
+# Innermost frames of threads that are waiting, not working
+# (an idle executor thread blocks in C inside ThreadPoolExecutor's _worker)
+_IDLE_FUNCTIONS = frozenset(["wait", "select", "poll", "accept", "_wait_for_tstate_lock", "_worker"])
+
+
+class Trace:
+    """Spans recorded for one request (from any thread)."""
+
+    __slots__ = ("started", "spans")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # list.append is atomic, so threads of the same request need no lock
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, name: str, start: float, end: float):
+        self.spans.append((name, start, end - start))
+
+    def totals(self) -> Dict[str, Tuple[float, int]]:
+        """Seconds and count per span name, in order of first appearance."""
+        totals: Dict[str, Tuple[float, int]] = {}
+        for name, _, duration in list(self.spans):
+            seconds, count = totals.get(name, (0.0, 0))
+            totals[name] = (seconds + duration, count + 1)
+        return totals
+
+    def server_timing(self, now: Optional[float] = None) -> str:
+        now = time.perf_counter() if now is None else now
+        entries = []
+        for name, (seconds, count) in self.totals().items():
+            entry = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="x{count}"'
+            entries.append(entry)
+        entries.append(f"app;dur={(now - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": name, "start_ms": round((start - self.started) * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+            for name, start, duration in sorted(self.spans, key=lambda s: s[1])
+        ]
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def record(name: str, start: float, end: float):
+    """Add a finished span (perf_counter timestamps) to the current trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, end)
+
+
+class span:
+    """Context manager recording a span: `with span("resolve_location"): ...`"""
+
+    __slots__ = ("_name", "_trace", "_start")
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __enter__(self):
+        self._trace = _current.get()
+        if self._trace is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._trace is not None:
+            self._trace.add(self._name, self._start, time.perf_counter())
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of all busy threads every `interval` seconds
+    and aggregates them per function.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._self: Counter = Counter()
+        self._total: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me or frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+                self.samples += 1
+                self._self[_describe(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    key = _describe(frame)
+                    if key not in seen:
+                        seen.add(key)
+                        self._total[key] += 1
+                    frame = frame.f_back
+
+    def summary(self, top: int = PROFILE_TOP) -> Dict[str, Any]:
+        ms = self.interval * 1000
+
+        def rows(counter: Counter):
+            return [{"function": key, "samples": n, "approx_ms": round(n * ms, 1)} for key, n in counter.most_common(top)]
+
+        return {
+            "interval_ms": ms,
+            "busy_thread_samples": self.samples,
+            "self": rows(self._self),
+            "cumulative": rows(self._total)
+        }
+
+
+def _describe(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def admin_authorized(token: Optional[str]) -> bool:
+    """True if `token` matches FLOOD_ADMIN_TOKEN (always False when it is unset)."""
+    if not ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: trace every request, add Server-Timing, profile on request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = _header(scope, PROFILE_HEADER) not in (None, "", "0")
+        if profile and not admin_authorized(_header(scope, ADMIN_TOKEN_HEADER)):
+            return await _send_json(send, 403, {"detail": "Profiling requires a valid X-Admin-Token"})
+
+        trace = Trace()
+        token = _current.set(trace)
+        try:
+            if profile:
+                await self._profiled(trace, scope, receive, send)
+            else:
+                await self.app(scope, receive, self._with_server_timing(trace, send))
+        finally:
+            _current.reset(token)
+
+    @staticmethod
+    def _with_server_timing(trace: Trace, send):
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", trace.server_timing().encode())
+                ]
+            await send(message)
+        return send_with_timing
+
+    async def _profiled(self, trace: Trace, scope, receive, send):
+        response = {"status": None, "bytes": 0}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            profiler.stop()
+        elapsed = time.perf_counter() - trace.started
+        await _send_json(send, 200, {
+            "path": scope["path"],
+            "status": response["status"],
+            "response_bytes": response["bytes"],
+            "duration_ms": round(elapsed * 1000, 3),
+            "server_timing": trace.server_timing(),
+            "spans": trace.to_list(),
+            "profile": profiler.summary()
+        }, [(b"server-timing", trace.server_timing().encode())])
+
+
+async def _send_json(send, status: int, payload: Dict[str, Any], headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers]
+    })
+    await send({"type": "http.response.body", "body": body})
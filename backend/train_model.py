@@ -0,0 +1,229 @@
+"""
+Train Model Module
+Reproducible training CLI for the flood classifier (replaces the Colab
+notebook's training cells).
+
+Loads NASA POWER daily exports and EM-DAT flood records, builds feature rows
+with the serving code (features.add_anomalies over the climatology artifact,
+so training and serving anomalies are identical), and trains an
+XGBClassifier with the multi-threaded `hist` tree method on all cores. The
+result is written directly as a native artifact + manifest (model_artifact)
+that POST /models/reload can load.
+
+Continued training (--warm-start) adds boosting rounds on top of an
+existing artifact using only the days after the base model's training data
+(its held-out evaluation days included), so a retrain costs time
+proportional to the new data, not the full history. The base model's class
+weight is kept, so a short window without flood days can still be trained on.
+
+Usage:
+    python train_model.py ["../nasa(India).csv" ...] [--emdat ../EMD_data.xlsx]
+    python train_model.py --warm-start xgboost_flood_model.ubj [--since 2025-01-01] [--rounds 50]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import climatology
+from backtest import EMDAT_PATH, load_flood_dates, roc_curve, threshold_metrics
+from features import FEATURE_NAMES, add_anomalies
+from model_artifact import DEFAULT_THRESHOLD, MODEL_DIR, export_model, load_native_model
+from nasa_power import NASA_CSV_PATH, load_nasa_power_csv
+
+logger = logging.getLogger(__name__)
+
+# Hyperparameters of the notebook's XGBoost model, plus the histogram method
+DEFAULT_PARAMS = {
+    "max_depth": 5,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "tree_method": "hist",
+    "max_bin": 256,
+    "eval_metric": "logloss"
+}
+DEFAULT_ROUNDS = 300
+DEFAULT_WARM_START_ROUNDS = 50
+# Most recent fraction of rows held out for evaluation (time-ordered, as in the notebook)
+DEFAULT_HOLDOUT = 0.2
+
+
+def training_data(paths: Sequence, emdat_path=EMDAT_PATH, start: Optional[str] = None,
+                  end: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Feature rows, flood labels and dates for the days in [start, end] of
+    every NASA POWER export, in date order.
+
+    Returns:
+        (features float32 (n, 9), labels int8 (n,), dates datetime64[D] (n,))
+    """
+    if climatology.load_climatology() is None:
+        raise ValueError("Climatology artifact missing; build it first: python climatology.py build")
+    flood_dates = load_flood_dates(emdat_path)
+
+    matrices, labels, dates = [], [], []
+    for path in paths:
+        df = load_nasa_power_csv(path)
+        if start or end:
+            df = df.loc[start:end]
+        if df.empty:
+            continue
+        features = df.reindex(columns=FEATURE_NAMES).to_numpy(dtype=np.float64)
+        add_anomalies(features, df.index.dayofyear.to_numpy(), df.attrs.get("latitude"), df.attrs.get("longitude"))
+        day = df.index.to_numpy().astype("datetime64[D]")
+        matrices.append(features.astype(np.float32))
+        labels.append(np.isin(day, flood_dates).astype(np.int8))
+        dates.append(day)
+
+    if not matrices:
+        return np.zeros((0, len(FEATURE_NAMES)), np.float32), np.zeros(0, np.int8), np.zeros(0, "datetime64[D]")
+    dates = np.concatenate(dates)
+    order = np.argsort(dates, kind="stable")
+    return np.vstack(matrices)[order], np.concatenate(labels)[order], dates[order]
+
+
+def base_scale_pos_weight(model, manifest: Optional[Dict[str, Any]] = None) -> float:
+    """Class weight a model was trained with (manifest first, then the booster's config)."""
+    weight = ((manifest or {}).get("training") or {}).get("scale_pos_weight")
+    if weight is not None:
+        return float(weight)
+    try:
+        config = json.loads(model.get_booster().save_config())
+        return float(config["learner"]["objective"]["reg_loss_param"]["scale_pos_weight"])
+    except (KeyError, TypeError, ValueError):
+        return 1.0
+
+
+def train(features: np.ndarray, labels: np.ndarray, rounds: int, params: Optional[Dict[str, Any]] = None,
+          base_model=None, n_jobs: Optional[int] = None, scale_pos_weight: Optional[float] = None):
+    """
+    Fit an XGBClassifier (class-balanced like the notebook). With
+    `base_model`, `rounds` new trees are boosted on top of its trees; pass
+    the base model's `scale_pos_weight` then, since a short window of new
+    days (possibly without any flood day) says little about class balance.
+    """
+    import xgboost as xgb
+
+    if scale_pos_weight is None:
+        n_pos = int(labels.sum())
+        if n_pos == 0 or n_pos == len(labels):
+            raise ValueError("Training data must contain both flood and non-flood days")
+        scale_pos_weight = (len(labels) - n_pos) / n_pos
+    model = xgb.XGBClassifier(
+        n_estimators=rounds,
+        scale_pos_weight=scale_pos_weight,
+        n_jobs=n_jobs or os.cpu_count(),
+        **{**DEFAULT_PARAMS, **(params or {})}
+    )
+    X = pd.DataFrame(features, columns=FEATURE_NAMES)
+    model.fit(X, labels, xgb_model=base_model.get_booster() if base_model is not None else None)
+    return model
+
+
+def evaluate(model, features: np.ndarray, labels: np.ndarray, threshold: float) -> Dict[str, Any]:
+    if len(labels) == 0:
+        return {"rows": 0}
+    scores = model.predict_proba(pd.DataFrame(features, columns=FEATURE_NAMES))[:, 1]
+    return {
+        "rows": int(len(labels)),
+        "flood_days": int(labels.sum()),
+        "auc": roc_curve(labels, scores)["auc"],
+        **threshold_metrics(labels, scores, [threshold])[0]
+    }
+
+
+def run_training(paths: Sequence = None, emdat_path=EMDAT_PATH, output=None, warm_start=None,
+                 since: Optional[str] = None, until: Optional[str] = None, rounds: Optional[int] = None,
+                 threshold: Optional[float] = None, holdout: float = DEFAULT_HOLDOUT,
+                 n_jobs: Optional[int] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the training set, train (or continue training), evaluate on the
+    most recent `holdout` fraction and export the artifact. Returns its manifest.
+    """
+    paths = [str(p) for p in (paths or [NASA_CSV_PATH])]
+    base_model, base_manifest = None, None
+    if warm_start:
+        base_model, base_manifest = load_native_model(warm_start)
+        # Only the days the base model has not seen
+        data_end = (base_manifest.get("training") or {}).get("data_end")
+        if since is None and data_end:
+            since = str(datetime.fromisoformat(data_end).date() + timedelta(days=1))
+    if rounds is None:
+        rounds = DEFAULT_WARM_START_ROUNDS if warm_start else DEFAULT_ROUNDS
+    if threshold is None:
+        threshold = base_manifest.get("threshold", DEFAULT_THRESHOLD) if base_manifest else DEFAULT_THRESHOLD
+
+    started = time.perf_counter()
+    features, labels, dates = training_data(paths, emdat_path, since, until)
+    if len(labels) == 0:
+        raise ValueError(f"No training rows between {since or 'start'} and {until or 'end'}")
+    loaded = time.perf_counter()
+
+    split = int(len(labels) * (1 - holdout)) if 0 < holdout < 1 else len(labels)
+    if split == 0:
+        raise ValueError(f"Too few training rows ({len(labels)}) to hold out {holdout:.0%}")
+    scale_pos_weight = base_scale_pos_weight(base_model, base_manifest) if base_model is not None else None
+    model = train(features[:split], labels[:split], rounds, params, base_model, n_jobs, scale_pos_weight)
+    trained = time.perf_counter()
+    metrics = evaluate(model, features[split:], labels[split:], threshold)
+
+    output = Path(output or MODEL_DIR / f"xgboost_flood_model_{datetime.now():%Y%m%d%H%M%S}.ubj")
+    training = {
+        "datasets": [Path(p).name for p in paths],
+        "emdat": Path(emdat_path).name,
+        "data_start": str(dates[0]),
+        # Last day trained on: held-out days are picked up by the next --warm-start
+        "data_end": str(dates[split - 1]),
+        "holdout_end": str(dates[-1]),
+        "rows": int(len(labels)),
+        "train_rows": int(split),
+        "flood_days": int(labels.sum()),
+        "scale_pos_weight": float(model.get_params()["scale_pos_weight"]),
+        "rounds": rounds,
+        "total_rounds": model.get_booster().num_boosted_rounds(),
+        "warm_start_from": base_manifest["sha256"][:12] if base_manifest else None,
+        "params": {**DEFAULT_PARAMS, **(params or {})},
+        "holdout": metrics,
+        "seconds": {"load": round(loaded - started, 3), "train": round(trained - loaded, 3)}
+    }
+    manifest = export_model(model, output, threshold, feature_names=FEATURE_NAMES, extra={"training": training})
+    logger.info("Trained %s in %.2fs (%d rows, %d rounds)", output.name, trained - loaded, split, rounds)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the flood model and export a native artifact")
+    parser.add_argument("csv", nargs="*", help="NASA POWER daily exports (default: nasa(India).csv)")
+    parser.add_argument("--emdat", default=str(EMDAT_PATH), help="EM-DAT export (.xlsx)")
+    parser.add_argument("-o", "--output", help="Output model (.ubj/.json; default: timestamped file in backend/)")
+    parser.add_argument("--warm-start", help="Continue training this native artifact on new days only")
+    parser.add_argument("--since", help="First training date (default with --warm-start: day after the base model's data)")
+    parser.add_argument("--until", help="Last training date (YYYY-MM-DD)")
+    parser.add_argument("--rounds", type=int, help=f"Boosting rounds (default {DEFAULT_ROUNDS}, "
+                                                   f"{DEFAULT_WARM_START_ROUNDS} with --warm-start)")
+    parser.add_argument("--threshold", type=float, help="Decision threshold stored in the manifest")
+    parser.add_argument("--holdout", type=float, default=DEFAULT_HOLDOUT, help="Most recent fraction held out for evaluation")
+    parser.add_argument("--n-jobs", type=int, help="Training threads (default: all cores)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        manifest = run_training(args.csv or None, args.emdat, args.output, args.warm_start, args.since,
+                                args.until, args.rounds, args.threshold, args.holdout, args.n_jobs)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import { useState } from "react";
 import BoxSelectMap from "../components/AreaHeatmap/BoxSelectMap";
 import AreaHeatmapMap from "../components/AreaHeatmap/AreaHeatmapMap";
 import "../components/AreaHeatmap/AreaHeatmap.css";
+import { decodeHeatmapGrid } from "../services/api";
 
 export default function AreaHeatmap() {
   const [box, setBox] = useState(null);
@@ -15,7 +16,7 @@ export default function AreaHeatmap() {
     setLoading(true);
     setError(null);
     try {
-      const params = new URLSearchParams(bounds).toString();
+      const params = new URLSearchParams({ ...bounds, format: "grid" }).toString();
       const res = await fetch(
         `http://127.0.0.1:8000/area/heatmap/box?${params}`
       );
@@ -24,7 +25,9 @@ export default function AreaHeatmap() {
       
       const data = await res.json();
       
-      if (data.points && Array.isArray(data.points)) {
+      if (data.encoding === "grid" && data.grid) {
+        setHeatmapData(decodeHeatmapGrid(data));
+      } else if (data.points && Array.isArray(data.points)) {
         setHeatmapData(data.points);
       } else {
         throw new Error("Invalid data format received from server");
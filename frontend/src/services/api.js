@@ -153,13 +153,43 @@ export async function getMultiCityPredictions(cities) {
 }
 
 // Chatbot endpoints
+// Each browser tab keeps its own conversation: a random session id is kept in
+// sessionStorage (survives reloads, not shared between tabs) and sent with
+// every chat call, so users never see or clear each other's history.
+const CHAT_SESSION_KEY = "flood-chat-session-id";
+let memoryChatSessionId = null;
+
+function newChatSessionId() {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+export function getChatSessionId() {
+  let id = null;
+  try {
+    id = window.sessionStorage.getItem(CHAT_SESSION_KEY);
+    if (!id) {
+      id = newChatSessionId();
+      window.sessionStorage.setItem(CHAT_SESSION_KEY, id);
+    }
+  } catch (e) {
+    // storage unavailable (private mode): keep one id for this page load
+    memoryChatSessionId = memoryChatSessionId || newChatSessionId();
+    id = memoryChatSessionId;
+  }
+  return id;
+}
+
 export async function sendChatMessage(message, context = {}) {
   const res = await fetch(`http://127.0.0.1:8000/chat`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({
       message,
-      ...context
+      ...context,
+      session_id: getChatSessionId()
     }),
   });
 
@@ -179,7 +209,9 @@ export async function sendChatMessage(message, context = {}) {
 }
 
 export async function getChatHistory() {
-  const res = await fetch(`http://127.0.0.1:8000/chat/history`);
+  const res = await fetch(
+    `http://127.0.0.1:8000/chat/history?session_id=${encodeURIComponent(getChatSessionId())}`
+  );
   
   if (!res.ok) {
     throw new Error(`Failed to get chat history: ${res.status}`);
@@ -189,7 +221,8 @@ export async function getChatHistory() {
 }
 
 export async function clearChatHistory() {
-  const res = await fetch(`http://127.0.0.1:8000/chat/clear`, {
+  const res = await fetch(
+    `http://127.0.0.1:8000/chat/clear?session_id=${encodeURIComponent(getChatSessionId())}`, {
     method: "POST",
   });
   
@@ -198,4 +231,43 @@ export async function clearChatHistory() {
   }
   
   return await res.json();
-}
\ No newline at end of file
+}
+
+// Heatmap grid encoding (format=grid)
+// Rebuilds the {lat, lon, intensity} point list from origin/step/shape and
+// the base64 packed intensity array returned by the heatmap endpoints.
+export function decodeHeatmapGrid(payload) {
+  const { origin, step, shape, dtype, scale } = payload.grid;
+  const [rows, cols] = shape;
+  const bytes = Uint8Array.from(atob(payload.data), (c) => c.charCodeAt(0));
+
+  let values;
+  if (dtype === "float16") {
+    const view = new DataView(bytes.buffer);
+    values = new Float32Array(rows * cols);
+    for (let k = 0; k < values.length; k++) {
+      values[k] = halfToFloat(view.getUint16(k * 2, true));
+    }
+  } else {
+    values = bytes;
+  }
+
+  const points = new Array(rows * cols);
+  for (let i = 0; i < rows; i++) {
+    const lat = origin.lat + i * step.lat;
+    for (let j = 0; j < cols; j++) {
+      const k = i * cols + j;
+      points[k] = { lat, lon: origin.lon + j * step.lon, intensity: values[k] * scale };
+    }
+  }
+  return points;
+}
+
+function halfToFloat(h) {
+  const sign = h & 0x8000 ? -1 : 1;
+  const exponent = (h >> 10) & 0x1f;
+  const fraction = h & 0x03ff;
+  if (exponent === 0) return sign * Math.pow(2, -14) * (fraction / 1024);
+  if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+  return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+}